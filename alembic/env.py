@@ -4,15 +4,19 @@ from sqlalchemy import engine_from_config, pool
 
 from alembic import context
 from dependencies.database import Base
+from models.acumulados import AcumuladosDB
 from models.ajustes import AjustesDB
 from models.bancos import BancosDB
 from models.colonias import ColoniaDB
-from models.dispersiones import DispersionesDB, DispersionesDetalleDB
+from models.dispersiones import (DispersionesCalculoDB, DispersionesDB,
+                                 DispersionesDetalleDB)
 from models.empleados import EmpleadosDB
-from models.prestamos import PrestamosDB
+from models.prestamos import PrestamosDB, PrestamosSaldoDB
 from models.recibos import RecibosDB, RecibosDetalleDB
 from models.salarios import SalariosDB
-from models.users import UserDB
+from models.trabajos import TrabajosArchivoDB, TrabajosDB
+from models.users import RefreshTokensDB, RevocacionesDB, UserDB
+from models.versiones import VersionesDB
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
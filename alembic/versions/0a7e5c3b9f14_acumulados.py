@@ -0,0 +1,86 @@
+"""acumulados
+
+Revision ID: 0a7e5c3b9f14
+Revises: f6a3d8b1c290
+Create Date: 2026-10-18 16:05:27.482913
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '0a7e5c3b9f14'
+down_revision: Union[str, None] = 'f6a3d8b1c290'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('acumulados',
+                    sa.Column('id_empleado', sa.Integer(), nullable=False),
+                    sa.Column('anio', sa.Integer(), nullable=False),
+                    sa.Column('tipo', sa.String(), nullable=False),
+                    sa.Column('concepto', sa.String(), nullable=False),
+                    sa.Column('monto', sa.Float(), nullable=True),
+                    sa.Column('recibos', sa.Integer(), nullable=True),
+                    sa.ForeignKeyConstraint(['id_empleado'],
+                                            ['empleados.id_empleado'], ),
+                    sa.PrimaryKeyConstraint('id_empleado', 'anio', 'tipo',
+                                            'concepto')
+                    )
+    # Acumulados de las dispersiones ya existentes; después se puede
+    # verificar con python -m dependencies.acumulados
+    detalle = sa.table('recibos_detalle',
+                       sa.column('id_recibo', sa.Integer),
+                       sa.column('id_salario', sa.Integer),
+                       sa.column('id_ajuste', sa.Integer),
+                       sa.column('id_cuenta', sa.Integer),
+                       sa.column('texto', sa.String),
+                       sa.column('monto', sa.Float))
+    recibos = sa.table('recibos',
+                       sa.column('id_recibo', sa.Integer),
+                       sa.column('id_empleado', sa.Integer),
+                       sa.column('id_dispersion', sa.Integer))
+    dispersiones = sa.table('dispersiones',
+                            sa.column('id_dispersion', sa.Integer),
+                            sa.column('periodo_fecha', sa.Date))
+    anio = sa.extract('year', dispersiones.c.periodo_fecha)
+    tipo = sa.case((detalle.c.id_cuenta.is_not(None), 'neto'),
+                   (detalle.c.id_salario.is_not(None), 'salario'),
+                   (detalle.c.id_ajuste.is_not(None), 'ajuste'),
+                   else_='prestamo')
+    concepto = sa.case((detalle.c.id_cuenta.is_not(None), 'Neto'),
+                       (detalle.c.id_salario.is_not(None), 'Salario'),
+                       (detalle.c.id_ajuste.is_not(None), detalle.c.texto),
+                       else_='Préstamos')
+    acumulados = sa.select(recibos.c.id_empleado,
+                           anio,
+                           tipo,
+                           concepto,
+                           sa.func.sum(detalle.c.monto),
+                           sa.func.count(sa.distinct(detalle.c.id_recibo)))\
+        .select_from(detalle
+                     .join(recibos,
+                           recibos.c.id_recibo == detalle.c.id_recibo)
+                     .join(dispersiones,
+                           dispersiones.c.id_dispersion ==
+                           recibos.c.id_dispersion))\
+        .group_by(recibos.c.id_empleado, anio, tipo, concepto)
+    op.execute(sa.table('acumulados',
+                        sa.column('id_empleado'),
+                        sa.column('anio'),
+                        sa.column('tipo'),
+                        sa.column('concepto'),
+                        sa.column('monto'),
+                        sa.column('recibos'))
+               .insert()
+               .from_select(['id_empleado', 'anio', 'tipo', 'concepto',
+                             'monto', 'recibos'],
+                            acumulados))
+
+
+def downgrade() -> None:
+    op.drop_table('acumulados')
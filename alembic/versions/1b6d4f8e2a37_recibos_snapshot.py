@@ -0,0 +1,29 @@
+"""recibos snapshot
+
+Revision ID: 1b6d4f8e2a37
+Revises: 0a7e5c3b9f14
+Create Date: 2026-10-18 17:12:40.318452
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '1b6d4f8e2a37'
+down_revision: Union[str, None] = '0a7e5c3b9f14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Los recibos existentes quedan sin snapshot y se siguen armando
+    # desde sus detalles
+    op.add_column('recibos',
+                  sa.Column('snapshot', sa.LargeBinary(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('recibos', 'snapshot')
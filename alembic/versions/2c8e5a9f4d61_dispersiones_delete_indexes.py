@@ -0,0 +1,30 @@
+"""dispersiones delete indexes
+
+Revision ID: 2c8e5a9f4d61
+Revises: 1b6d4f8e2a37
+Create Date: 2026-10-18 17:48:03.906215
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '2c8e5a9f4d61'
+down_revision: Union[str, None] = '1b6d4f8e2a37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(op.f('ix_recibos_detalle_id_recibo'),
+                    'recibos_detalle', ['id_recibo'], unique=False)
+    op.create_index(op.f('ix_dispersiones_detalle_id_dispersion'),
+                    'dispersiones_detalle', ['id_dispersion'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_dispersiones_detalle_id_dispersion'),
+                  table_name='dispersiones_detalle')
+    op.drop_index(op.f('ix_recibos_detalle_id_recibo'),
+                  table_name='recibos_detalle')
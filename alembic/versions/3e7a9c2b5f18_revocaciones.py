@@ -0,0 +1,40 @@
+"""revocaciones
+
+Revision ID: 3e7a9c2b5f18
+Revises: 2c8e5a9f4d61
+Create Date: 2026-10-18 18:31:26.150734
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '3e7a9c2b5f18'
+down_revision: Union[str, None] = '2c8e5a9f4d61'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('revocaciones',
+                    sa.Column('id_revocacion', sa.Integer(), nullable=False),
+                    sa.Column('jti', sa.String(), nullable=True),
+                    sa.Column('id_user', sa.Integer(), nullable=True),
+                    sa.Column('fecha', sa.DateTime(), nullable=False),
+                    sa.ForeignKeyConstraint(['id_user'], ['users.id_user'], ),
+                    sa.PrimaryKeyConstraint('id_revocacion')
+                    )
+    op.create_index(op.f('ix_revocaciones_id_revocacion'), 'revocaciones',
+                    ['id_revocacion'], unique=False)
+    op.create_index(op.f('ix_revocaciones_fecha'), 'revocaciones',
+                    ['fecha'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_revocaciones_fecha'), table_name='revocaciones')
+    op.drop_index(op.f('ix_revocaciones_id_revocacion'),
+                  table_name='revocaciones')
+    op.drop_table('revocaciones')
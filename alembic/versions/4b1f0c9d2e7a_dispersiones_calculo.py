@@ -0,0 +1,49 @@
+"""dispersiones_calculo
+
+Revision ID: 4b1f0c9d2e7a
+Revises: 13d00ad10c72
+Create Date: 2026-10-18 10:12:40.318204
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '4b1f0c9d2e7a'
+down_revision: Union[str, None] = '13d00ad10c72'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('dispersiones_calculo',
+                    sa.Column('id_calculo', sa.Integer(), nullable=False),
+                    sa.Column('fecha',
+                              sa.DateTime(),
+                              server_default=sa.text('(CURRENT_TIMESTAMP)'),
+                              nullable=True),
+                    sa.Column('periodo', sa.Integer(), nullable=True),
+                    sa.Column('periodo_fecha', sa.Date(), nullable=True),
+                    sa.Column('id_empleado', sa.Integer(), nullable=True),
+                    sa.Column('huella', sa.String(), nullable=True),
+                    sa.Column('recibo', sa.String(), nullable=True),
+                    sa.ForeignKeyConstraint(['id_empleado'],
+                                            ['empleados.id_empleado'], ),
+                    sa.PrimaryKeyConstraint('id_calculo'),
+                    sa.UniqueConstraint('periodo',
+                                        'periodo_fecha',
+                                        'id_empleado')
+                    )
+    op.create_index(op.f('ix_dispersiones_calculo_id_calculo'),
+                    'dispersiones_calculo',
+                    ['id_calculo'],
+                    unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_dispersiones_calculo_id_calculo'),
+                  table_name='dispersiones_calculo')
+    op.drop_table('dispersiones_calculo')
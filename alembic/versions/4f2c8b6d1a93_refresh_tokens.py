@@ -0,0 +1,49 @@
+"""refresh tokens
+
+Revision ID: 4f2c8b6d1a93
+Revises: 3e7a9c2b5f18
+Create Date: 2026-10-18 19:12:40.518263
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '4f2c8b6d1a93'
+down_revision: Union[str, None] = '3e7a9c2b5f18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('refresh_tokens',
+                    sa.Column('id_refresh', sa.Integer(), nullable=False),
+                    sa.Column('hash', sa.String(), nullable=False),
+                    sa.Column('familia', sa.String(), nullable=False),
+                    sa.Column('id_user', sa.Integer(), nullable=False),
+                    sa.Column('expira', sa.DateTime(), nullable=False),
+                    sa.Column('usado', sa.Boolean(), nullable=False),
+                    sa.Column('revocado', sa.Boolean(), nullable=False),
+                    sa.ForeignKeyConstraint(['id_user'], ['users.id_user'], ),
+                    sa.PrimaryKeyConstraint('id_refresh'),
+                    sa.UniqueConstraint('hash')
+                    )
+    op.create_index(op.f('ix_refresh_tokens_id_refresh'), 'refresh_tokens',
+                    ['id_refresh'], unique=False)
+    op.create_index(op.f('ix_refresh_tokens_familia'), 'refresh_tokens',
+                    ['familia'], unique=False)
+    op.create_index(op.f('ix_refresh_tokens_id_user'), 'refresh_tokens',
+                    ['id_user'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_refresh_tokens_id_user'),
+                  table_name='refresh_tokens')
+    op.drop_index(op.f('ix_refresh_tokens_familia'),
+                  table_name='refresh_tokens')
+    op.drop_index(op.f('ix_refresh_tokens_id_refresh'),
+                  table_name='refresh_tokens')
+    op.drop_table('refresh_tokens')
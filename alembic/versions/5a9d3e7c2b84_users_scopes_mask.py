@@ -0,0 +1,69 @@
+"""users scopes mask
+
+Revision ID: 5a9d3e7c2b84
+Revises: 4f2c8b6d1a93
+Create Date: 2026-10-18 19:48:05.732914
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '5a9d3e7c2b84'
+down_revision: Union[str, None] = '4f2c8b6d1a93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Copia del registro de schemas/scopes.py al momento de la migración
+SCOPES = ('Admin', 'users:read', 'users:write', 'empleados:read',
+          'empleados:write', 'cuentas:read', 'cuentas:write', 'bancos:read',
+          'bancos:write', 'salarios:read', 'salarios:write', 'ajustes:read',
+          'ajustes:write', 'prestamos:read', 'prestamos:write',
+          'dispersiones:read', 'dispersiones:write', 'dispersiones:delete',
+          'recibos:read')
+BITS = {scope: 1 << bit for bit, scope in enumerate(SCOPES)}
+
+
+def upgrade() -> None:
+    users = sa.table('users',
+                     sa.column('id_user', sa.Integer),
+                     sa.column('scopes', sa.String),
+                     sa.column('scopes_mask', sa.Integer))
+    op.add_column('users', sa.Column('scopes_mask', sa.Integer(),
+                                     nullable=False, server_default='0'))
+    conn = op.get_bind()
+    # Los scopes fuera del registro no otorgaban permisos y se descartan
+    for id_user, scopes in conn.execute(sa.select(users.c.id_user,
+                                                  users.c.scopes)):
+        mask = 0
+        for scope in (scopes or '').split(','):
+            mask |= BITS.get(scope, 0)
+        conn.execute(users.update()
+                     .where(users.c.id_user == id_user)
+                     .values(scopes_mask=mask))
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('scopes')
+        batch_op.alter_column('scopes_mask', new_column_name='scopes',
+                              server_default=None)
+
+
+def downgrade() -> None:
+    users = sa.table('users',
+                     sa.column('id_user', sa.Integer),
+                     sa.column('scopes', sa.Integer),
+                     sa.column('scopes_txt', sa.String))
+    op.add_column('users', sa.Column('scopes_txt', sa.String(),
+                                     nullable=True))
+    conn = op.get_bind()
+    for id_user, mask in conn.execute(sa.select(users.c.id_user,
+                                                users.c.scopes)):
+        scopes = [scope for scope in SCOPES if mask & BITS[scope]]
+        conn.execute(users.update()
+                     .where(users.c.id_user == id_user)
+                     .values(scopes_txt=','.join(scopes)))
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('scopes')
+        batch_op.alter_column('scopes_txt', new_column_name='scopes')
@@ -0,0 +1,60 @@
+"""prestamos_saldo
+
+Revision ID: 5d8f2a4c6b19
+Revises: 9c3e5a7b1d20
+Create Date: 2026-10-18 12:14:37.218645
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '5d8f2a4c6b19'
+down_revision: Union[str, None] = '9c3e5a7b1d20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('prestamos_saldo',
+                    sa.Column('id_prestamo', sa.Integer(), nullable=False),
+                    sa.Column('saldo', sa.Float(), nullable=True),
+                    sa.Column('cuotas_pagadas', sa.Integer(), nullable=True),
+                    sa.Column('ultimo_periodo', sa.Integer(), nullable=True),
+                    sa.Column('ultimo_periodo_fecha', sa.Date(),
+                              nullable=True),
+                    sa.ForeignKeyConstraint(['id_prestamo'],
+                                            ['prestamos.id_prestamo'], ),
+                    sa.PrimaryKeyConstraint('id_prestamo')
+                    )
+    # Saldo inicial a partir de los recibos ya generados
+    op.execute("""
+        INSERT INTO prestamos_saldo (id_prestamo, saldo, cuotas_pagadas,
+                                     ultimo_periodo, ultimo_periodo_fecha)
+        SELECT p.id_prestamo,
+               p.monto + COALESCE(SUM(rd.monto), 0),
+               COUNT(rd.id_recibos_detalle),
+               (SELECT d.periodo
+                  FROM recibos_detalle rd2
+                  JOIN recibos r ON r.id_recibo = rd2.id_recibo
+                  JOIN dispersiones d ON d.id_dispersion = r.id_dispersion
+                 WHERE rd2.id_prestamo = p.id_prestamo
+                 ORDER BY d.periodo_fecha DESC
+                 LIMIT 1),
+               (SELECT d.periodo_fecha
+                  FROM recibos_detalle rd2
+                  JOIN recibos r ON r.id_recibo = rd2.id_recibo
+                  JOIN dispersiones d ON d.id_dispersion = r.id_dispersion
+                 WHERE rd2.id_prestamo = p.id_prestamo
+                 ORDER BY d.periodo_fecha DESC
+                 LIMIT 1)
+          FROM prestamos p
+          LEFT JOIN recibos_detalle rd ON rd.id_prestamo = p.id_prestamo
+         GROUP BY p.id_prestamo, p.monto
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('prestamos_saldo')
@@ -0,0 +1,36 @@
+"""trabajos lease y periodo unico
+
+Revision ID: 6c1e4a8d3f27
+Revises: 5a9d3e7c2b84
+Create Date: 2026-10-18 21:05:17.284610
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '6c1e4a8d3f27'
+down_revision: Union[str, None] = '5a9d3e7c2b84'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('trabajos', sa.Column('propietario', sa.String(),
+                                        nullable=True))
+    op.add_column('trabajos', sa.Column('latido', sa.DateTime(),
+                                        nullable=True))
+    with op.batch_alter_table('dispersiones') as batch_op:
+        batch_op.create_unique_constraint('uq_dispersiones_periodo',
+                                          ['periodo', 'periodo_fecha'])
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('dispersiones') as batch_op:
+        batch_op.drop_constraint('uq_dispersiones_periodo', type_='unique')
+    with op.batch_alter_table('trabajos') as batch_op:
+        batch_op.drop_column('latido')
+        batch_op.drop_column('propietario')
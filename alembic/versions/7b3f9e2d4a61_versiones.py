@@ -0,0 +1,32 @@
+"""versiones
+
+Revision ID: 7b3f9e2d4a61
+Revises: 6c1e4a8d3f27
+Create Date: 2026-10-18 23:12:41.503917
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '7b3f9e2d4a61'
+down_revision: Union[str, None] = '6c1e4a8d3f27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    versiones = op.create_table(
+        'versiones',
+        sa.Column('recurso', sa.String(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=True),
+        sa.PrimaryKeyConstraint('recurso')
+    )
+    op.bulk_insert(versiones, [{'recurso': 'dispersiones', 'version': 0}])
+
+
+def downgrade() -> None:
+    op.drop_table('versiones')
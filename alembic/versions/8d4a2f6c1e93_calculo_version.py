@@ -0,0 +1,33 @@
+"""version de nomina en dispersiones_calculo
+
+Revision ID: 8d4a2f6c1e93
+Revises: 7b3f9e2d4a61
+Create Date: 2026-10-19 01:24:08.915342
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '8d4a2f6c1e93'
+down_revision: Union[str, None] = '7b3f9e2d4a61'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('dispersiones_calculo', sa.Column('version', sa.String(),
+                                                    nullable=True))
+    versiones = sa.table('versiones',
+                         sa.column('recurso', sa.String()),
+                         sa.column('version', sa.Integer()))
+    op.bulk_insert(versiones, [{'recurso': 'nomina', 'version': 0}])
+
+
+def downgrade() -> None:
+    op.execute("DELETE FROM versiones WHERE recurso = 'nomina'")
+    with op.batch_alter_table('dispersiones_calculo') as batch_op:
+        batch_op.drop_column('version')
@@ -0,0 +1,28 @@
+"""salarios_vigencia_index
+
+Revision ID: 9c3e5a7b1d20
+Revises: 4b1f0c9d2e7a
+Create Date: 2026-10-18 11:02:13.904418
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '9c3e5a7b1d20'
+down_revision: Union[str, None] = '4b1f0c9d2e7a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_salarios_id_empleado_fecha_valido',
+                    'salarios',
+                    ['id_empleado', 'fecha_valido'],
+                    unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_salarios_id_empleado_fecha_valido',
+                  table_name='salarios')
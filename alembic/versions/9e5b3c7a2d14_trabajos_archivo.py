@@ -0,0 +1,38 @@
+"""trabajos archivo
+
+Revision ID: 9e5b3c7a2d14
+Revises: 8d4a2f6c1e93
+Create Date: 2026-10-19 02:47:33.618205
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '9e5b3c7a2d14'
+down_revision: Union[str, None] = '8d4a2f6c1e93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'trabajos_archivo',
+        sa.Column('id_trabajo', sa.Integer(), nullable=False),
+        sa.Column('fecha', sa.DateTime(), nullable=True),
+        sa.Column('nombre', sa.String(), nullable=True),
+        sa.Column('contenido', sa.LargeBinary(), nullable=True),
+        sa.ForeignKeyConstraint(['id_trabajo'], ['trabajos.id_trabajo'], ),
+        sa.PrimaryKeyConstraint('id_trabajo')
+    )
+    op.create_index(op.f('ix_trabajos_archivo_fecha'), 'trabajos_archivo',
+                    ['fecha'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_trabajos_archivo_fecha'),
+                  table_name='trabajos_archivo')
+    op.drop_table('trabajos_archivo')
@@ -0,0 +1,28 @@
+"""ajustes_vigencia_index
+
+Revision ID: a73c1e9d5f08
+Revises: 5d8f2a4c6b19
+Create Date: 2026-10-18 12:41:05.537190
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'a73c1e9d5f08'
+down_revision: Union[str, None] = '5d8f2a4c6b19'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_ajustes_fecha_fin_fecha_inicio',
+                    'ajustes',
+                    ['fecha_fin', 'fecha_inicio'],
+                    unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_ajustes_fecha_fin_fecha_inicio',
+                  table_name='ajustes')
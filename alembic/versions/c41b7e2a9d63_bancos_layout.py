@@ -0,0 +1,29 @@
+"""bancos_layout
+
+Revision ID: c41b7e2a9d63
+Revises: a73c1e9d5f08
+Create Date: 2026-10-18 13:20:44.108372
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41b7e2a9d63'
+down_revision: Union[str, None] = 'a73c1e9d5f08'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('bancos',
+                  sa.Column('layout', sa.String(), server_default='csv',
+                            nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('bancos') as batch_op:
+        batch_op.drop_column('layout')
@@ -0,0 +1,54 @@
+"""trabajos
+
+Revision ID: d5e8a1f3b742
+Revises: c41b7e2a9d63
+Create Date: 2026-10-18 14:02:51.771930
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'd5e8a1f3b742'
+down_revision: Union[str, None] = 'c41b7e2a9d63'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('trabajos',
+                    sa.Column('id_trabajo', sa.Integer(), nullable=False),
+                    sa.Column('fecha', sa.DateTime(),
+                              server_default=sa.text('(CURRENT_TIMESTAMP)'),
+                              nullable=True),
+                    sa.Column('tipo', sa.String(), nullable=True),
+                    sa.Column('clave', sa.String(), nullable=True),
+                    sa.Column('parametros', sa.String(), nullable=True),
+                    sa.Column('estado', sa.String(), nullable=True),
+                    sa.Column('fase', sa.String(), nullable=True),
+                    sa.Column('procesados', sa.Integer(), nullable=True),
+                    sa.Column('total', sa.Integer(), nullable=True),
+                    sa.Column('resultado', sa.String(), nullable=True),
+                    sa.Column('error', sa.String(), nullable=True),
+                    sa.Column('id_usuario', sa.Integer(), nullable=True),
+                    sa.ForeignKeyConstraint(['id_usuario'],
+                                            ['users.id_user'], ),
+                    sa.PrimaryKeyConstraint('id_trabajo')
+                    )
+    op.create_index(op.f('ix_trabajos_id_trabajo'), 'trabajos',
+                    ['id_trabajo'], unique=False)
+    op.create_index('ix_trabajos_clave_activo', 'trabajos', ['clave'],
+                    unique=True,
+                    sqlite_where=sa.text("estado IN ('pendiente', "
+                                         "'en_proceso')"),
+                    postgresql_where=sa.text("estado IN ('pendiente', "
+                                             "'en_proceso')"))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_trabajos_clave_activo', table_name='trabajos')
+    op.drop_index(op.f('ix_trabajos_id_trabajo'), table_name='trabajos')
+    op.drop_table('trabajos')
@@ -0,0 +1,28 @@
+"""recibos_dispersion_index
+
+Revision ID: e2b9c4d7a815
+Revises: d5e8a1f3b742
+Create Date: 2026-10-18 14:48:09.316027
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2b9c4d7a815'
+down_revision: Union[str, None] = 'd5e8a1f3b742'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_recibos_id_dispersion_id_recibo',
+                    'recibos',
+                    ['id_dispersion', 'id_recibo'],
+                    unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_recibos_id_dispersion_id_recibo',
+                  table_name='recibos')
@@ -0,0 +1,28 @@
+"""recibos_empleado_index
+
+Revision ID: f6a3d8b1c290
+Revises: e2b9c4d7a815
+Create Date: 2026-10-18 15:10:32.640158
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'f6a3d8b1c290'
+down_revision: Union[str, None] = 'e2b9c4d7a815'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_recibos_id_empleado_id_dispersion',
+                    'recibos',
+                    ['id_empleado', 'id_dispersion'],
+                    unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_recibos_id_empleado_id_dispersion',
+                  table_name='recibos')
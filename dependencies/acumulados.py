@@ -0,0 +1,165 @@
+import argparse
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import bindparam, case, extract, func, insert, update
+from sqlalchemy.orm import Session
+from starlette import status
+
+from models.acumulados import AcumuladosDB
+from models.dispersiones import DispersionesDB
+from models.empleados import EmpleadosDB
+from models.recibos import RecibosDB, RecibosDetalleDB
+from schemas.acumulados import AcumuladoOut, DiferenciaAcumulado
+
+# Diferencia tolerada al comparar sumas de Float
+TOLERANCIA = 0.005
+
+
+def tipo_concepto():
+    return case((RecibosDetalleDB.id_cuenta.is_not(None), 'neto'),
+                (RecibosDetalleDB.id_salario.is_not(None), 'salario'),
+                (RecibosDetalleDB.id_ajuste.is_not(None), 'ajuste'),
+                else_='prestamo')
+
+
+def nombre_concepto():
+    return case((RecibosDetalleDB.id_cuenta.is_not(None), 'Neto'),
+                (RecibosDetalleDB.id_salario.is_not(None), 'Salario'),
+                (RecibosDetalleDB.id_ajuste.is_not(None),
+                 RecibosDetalleDB.texto),
+                else_='Préstamos')
+
+
+def query_acumulados(db: Session, id_disp: Optional[int] = None):
+    anio = extract('year', DispersionesDB.periodo_fecha)
+    tipo = tipo_concepto()
+    concepto = nombre_concepto()
+    query = db\
+        .query(RecibosDB.id_empleado,
+               anio.label('anio'),
+               tipo.label('tipo'),
+               concepto.label('concepto'),
+               func.sum(RecibosDetalleDB.monto).label('monto'),
+               func.count(func.distinct(RecibosDetalleDB.id_recibo))
+               .label('recibos'))\
+        .join(RecibosDB, RecibosDB.id_recibo == RecibosDetalleDB.id_recibo)\
+        .join(DispersionesDB,
+              DispersionesDB.id_dispersion == RecibosDB.id_dispersion)
+    if id_disp is not None:
+        query = query.filter(RecibosDB.id_dispersion == id_disp)
+    return query.group_by(RecibosDB.id_empleado, anio, tipo, concepto)
+
+
+def apply_acumulados(db: Session, id_disp: int, signo: int = 1):
+    # En la misma transacción que guarda (signo=1) o elimina (signo=-1)
+    # la dispersión; lee los detalles ya escritos de esa dispersión
+    deltas = query_acumulados(db, id_disp).all()
+    if not deltas:
+        return
+    llave = ('id_empleado', 'anio', 'tipo', 'concepto')
+    empleados = {delta.id_empleado for delta in deltas}
+    existentes = {
+        tuple(acumulado) for acumulado in db
+        .query(AcumuladosDB.id_empleado, AcumuladosDB.anio,
+               AcumuladosDB.tipo, AcumuladosDB.concepto)
+        .filter(AcumuladosDB.id_empleado.in_(empleados),
+                AcumuladosDB.anio.in_({delta.anio for delta in deltas}))
+    }
+    nuevos = [{key: getattr(delta, key) for key in llave}
+              for delta in deltas
+              if tuple(getattr(delta, key) for key in llave)
+              not in existentes]
+    if nuevos:
+        db.execute(insert(AcumuladosDB),
+                   [{**nuevo, 'monto': 0, 'recibos': 0} for nuevo in nuevos])
+    acumulados = AcumuladosDB.__table__
+    db.execute(update(acumulados)
+               .where(acumulados.c.id_empleado == bindparam('b_id_empleado'),
+                      acumulados.c.anio == bindparam('b_anio'),
+                      acumulados.c.tipo == bindparam('b_tipo'),
+                      acumulados.c.concepto == bindparam('b_concepto'))
+               .values(monto=acumulados.c.monto + bindparam('b_monto'),
+                       recibos=acumulados.c.recibos + bindparam('b_recibos')),
+               [{'b_id_empleado': delta.id_empleado,
+                 'b_anio': delta.anio,
+                 'b_tipo': delta.tipo,
+                 'b_concepto': delta.concepto,
+                 'b_monto': signo * delta.monto,
+                 'b_recibos': signo * delta.recibos}
+                for delta in deltas])
+    if signo < 0:
+        db.query(AcumuladosDB)\
+            .filter(AcumuladosDB.id_empleado.in_(empleados),
+                    AcumuladosDB.recibos <= 0)\
+            .delete(synchronize_session=False)
+
+
+def revert_acumulados(db: Session, id_disp: int):
+    apply_acumulados(db, id_disp, signo=-1)
+
+
+def get_acumulados_empleado(db: Session,
+                            id_empleado: int,
+                            anio: int) -> list[AcumuladoOut]:
+    acumulados_db = db\
+        .query(AcumuladosDB)\
+        .filter(AcumuladosDB.id_empleado == id_empleado,
+                AcumuladosDB.anio == anio)\
+        .order_by(AcumuladosDB.tipo.desc(), AcumuladosDB.concepto)\
+        .all()
+    if not acumulados_db and not db.get(EmpleadosDB, id_empleado):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f'Empleado con id: {id_empleado} '
+                                   'no encontrado')
+    return [AcumuladoOut.model_validate(acumulado)
+            for acumulado in acumulados_db]
+
+
+def rebuild_acumulados(db: Session,
+                       corregir: bool = False) -> list[DiferenciaAcumulado]:
+    # Recalcula todo desde recibos_detalle y lo compara con la tabla
+    esperados = {(fila.id_empleado, fila.anio, fila.tipo, fila.concepto):
+                 fila for fila in query_acumulados(db).all()}
+    guardados = {(fila.id_empleado, fila.anio, fila.tipo, fila.concepto):
+                 fila for fila in db.query(AcumuladosDB).all()}
+    diferencias = []
+    for llave in sorted(esperados.keys() | guardados.keys(),
+                        key=lambda llave: tuple(map(str, llave))):
+        esperado = esperados.get(llave)
+        guardado = guardados.get(llave)
+        monto = esperado.monto if esperado else 0
+        recibos = esperado.recibos if esperado else 0
+        if guardado and abs(guardado.monto - monto) <= TOLERANCIA \
+                and guardado.recibos == recibos:
+            continue
+        id_empleado, anio, tipo, concepto = llave
+        diferencias.append(DiferenciaAcumulado(
+            id_empleado=id_empleado, anio=anio, tipo=tipo,
+            concepto=concepto, monto=monto, recibos=recibos,
+            monto_guardado=guardado.monto if guardado else None,
+            recibos_guardado=guardado.recibos if guardado else None))
+    if corregir and diferencias:
+        db.query(AcumuladosDB).delete(synchronize_session=False)
+        if esperados:
+            db.execute(insert(AcumuladosDB),
+                       [dict(fila._mapping) for fila in esperados.values()])
+        db.commit()
+    return diferencias
+
+
+if __name__ == '__main__':  # pragma: no cover
+    from dependencies.database import SessionLocal
+
+    parser = argparse.ArgumentParser(
+        description='Verifica los acumulados contra recibos_detalle')
+    parser.add_argument('--corregir', action='store_true',
+                        help='reconstruye la tabla si hay diferencias')
+    args = parser.parse_args()
+    with SessionLocal() as db:
+        diferencias = rebuild_acumulados(db, args.corregir)
+    for diferencia in diferencias:
+        print(diferencia.model_dump_json())
+    print(f'{len(diferencias)} diferencias'
+          + (' corregidas' if args.corregir and diferencias else ''))
+    raise SystemExit(1 if diferencias and not args.corregir else 0)
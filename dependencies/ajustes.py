@@ -1,9 +1,16 @@
+from datetime import date
+from typing import Optional
+
 from fastapi import HTTPException
 from sqlalchemy.orm import Session
 from starlette import status
 
+from dependencies.versiones import cambio_nomina
 from models.ajustes import AjustesDB
+from models.empleados import EmpleadosDB
+from models.users import UserDB
 from schemas.ajustes import AjusteIn, AjusteOut
+from schemas.nomina import AjusteVigente
 from schemas.users import User
 
 ajustes_resp_edit = {
@@ -28,11 +35,47 @@ ajustes_resp_edit = {
 def get_ajustes(db: Session,
                 skip: int = 0,
                 limit: int = 10) -> list[AjusteOut]:
-    ajustes_db = db.\
-        query(AjustesDB)\
+    ajustes_db = db\
+        .query(AjustesDB.id_ajuste,
+               AjustesDB.fecha,
+               AjustesDB.fecha_inicio,
+               AjustesDB.fecha_fin,
+               AjustesDB.motivo,
+               AjustesDB.monto,
+               AjustesDB.id_empleado,
+               AjustesDB.id_usuario,
+               UserDB.username.label('usuario'),
+               EmpleadosDB.nombre_completo.label('empleado'))\
+        .join(UserDB, UserDB.id_user == AjustesDB.id_usuario)\
+        .join(EmpleadosDB, EmpleadosDB.id_empleado == AjustesDB.id_empleado)\
+        .order_by(AjustesDB.id_ajuste)\
         .offset(skip)\
         .limit(limit).all()
-    ajustes = [AjusteOut.model_validate(ajuste) for ajuste in ajustes_db]
+    ajustes = [AjusteOut.model_validate(dict(ajuste._mapping))
+               for ajuste in ajustes_db]
+    return ajustes
+
+
+def get_ajustes_activos(db: Session,
+                        fecha: date,
+                        ids_empleado: Optional[list[int]] = None
+                        ) -> dict[int, list[AjusteVigente]]:
+    # Cada rama del OR usa el índice (fecha_fin, fecha_inicio): los
+    # abiertos (fecha_fin nula) y los que terminan después de la fecha
+    query = db\
+        .query(AjustesDB.id_ajuste,
+               AjustesDB.id_empleado,
+               AjustesDB.motivo,
+               AjustesDB.monto)\
+        .filter((AjustesDB.fecha_inicio <= fecha)
+                & ((AjustesDB.fecha_fin.is_(None))
+                   | (AjustesDB.fecha_fin >= fecha)))
+    if ids_empleado is not None:
+        query = query.filter(AjustesDB.id_empleado.in_(ids_empleado))
+    ajustes = {}
+    for ajuste in query.order_by(AjustesDB.id_ajuste).all():
+        ajustes.setdefault(ajuste.id_empleado, [])\
+            .append(AjusteVigente.model_validate(ajuste))
     return ajustes
 
 
@@ -42,6 +85,7 @@ def create_ajuste(db: Session,
     ajuste_create = AjustesDB(**ajuste_data.model_dump(exclude_unset=True),
                               id_usuario=current_user.id_user)
     db.add(ajuste_create)
+    cambio_nomina(db)
     db.commit()
     db.refresh(ajuste_create)
     return ajuste_create
@@ -79,6 +123,7 @@ def edit_ajuste(id_ajs: int,
     for key, value in edited_data.items():
         setattr(ajuste_db, key, value)
     db.add(ajuste_db)
+    cambio_nomina(db)
     db.commit()
     db.refresh(ajuste_db)
     return ajuste_db
@@ -102,4 +147,5 @@ def delete_ajuste(db: Session, id_ajs: int):
     #                       detail=f'Ajuste con id: {id_ajs} ya aplicado, '
     #                              'no se puede eliminar')
     db.delete(ajuste_db)
+    cambio_nomina(db)
     db.commit()
@@ -2,6 +2,8 @@ from fastapi import HTTPException
 from sqlalchemy.orm import Session
 from starlette import status
 
+from dependencies.etags import cambio_dispersiones
+from dependencies.versiones import cambio_nomina
 from models.bancos import BancosDB
 from schemas.bancos import BancoIn, BancoOut
 
@@ -25,6 +27,7 @@ def create_banco(db: Session,
                                    ' ya existente')
     banco_create = BancosDB(**banco_data.model_dump(exclude_unset=True))
     db.add(banco_create)
+    cambio_nomina(db)
     db.commit()
     db.refresh(banco_create)
     return banco_create
@@ -49,6 +52,8 @@ def edit_banco(db: Session,
     edited_data = banco_data.model_dump(exclude_unset=True)
     [setattr(banco_db, key, value) for key, value in edited_data.items()]
     db.add(banco_db)
+    cambio_dispersiones(db)
+    cambio_nomina(db)
     db.commit()
     db.refresh(banco_db)
     return banco_db
@@ -66,4 +71,6 @@ def delete_banco(db: Session,
     # TODO: Verificar que no haya cuentas en ese banco
     # Eliminarlo
     db.delete(banco_db)
+    cambio_dispersiones(db)
+    cambio_nomina(db)
     db.commit()
@@ -0,0 +1,46 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+class CacheTTL:
+    # LRU en memoria con expiración por entrada; seguro entre hilos
+    def __init__(self, maximo: int, ttl: float):
+        self.maximo = maximo
+        self.ttl = ttl
+        self._datos: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, llave: Hashable) -> Optional[Any]:
+        with self._lock:
+            entrada = self._datos.get(llave)
+            if entrada is None:
+                return None
+            valor, expira = entrada
+            if expira <= time.monotonic():
+                del self._datos[llave]
+                return None
+            self._datos.move_to_end(llave)
+            return valor
+
+    def set(self, llave: Hashable, valor: Any):
+        if self.maximo <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._datos[llave] = (valor, time.monotonic() + self.ttl)
+            self._datos.move_to_end(llave)
+            while len(self._datos) > self.maximo:
+                self._datos.popitem(last=False)
+
+    def invalidate(self, condicion: Callable[[Hashable], bool]):
+        with self._lock:
+            for llave in [llave for llave in self._datos if condicion(llave)]:
+                del self._datos[llave]
+
+    def clear(self):
+        with self._lock:
+            self._datos.clear()
+
+    def __len__(self) -> int:
+        return len(self._datos)
@@ -0,0 +1,83 @@
+from decimal import ROUND_HALF_UP, Decimal
+from typing import NamedTuple, Optional
+
+# Sólo la biblioteca estándar: es lo único que importa cada proceso del
+# pool de nómina, sin fastapi, SQLAlchemy ni el engine. Las entradas y los
+# recibos cruzan el pool como tuplas, que se serializan mucho más rápido
+# que los modelos de pydantic
+CENTAVOS = Decimal('0.01')
+
+
+class SalarioCalculo(NamedTuple):
+    id_salario: int
+    monto: float
+
+
+class AjusteCalculo(NamedTuple):
+    id_ajuste: int
+    motivo: str
+    monto: float
+
+
+class CuotaCalculo(NamedTuple):
+    id_prestamo: int
+    comentarios: Optional[str]
+    monto_quincenal: float
+    saldo: float
+
+
+class EntradaCalculo(NamedTuple):
+    id_empleado: int
+    id_cuenta: int
+    id_banco: int
+    salario: SalarioCalculo
+    ajustes: list[AjusteCalculo]
+    prestamos: list[CuotaCalculo]
+
+
+class ConceptoCalculo(NamedTuple):
+    id_salario: Optional[int]
+    id_ajuste: Optional[int]
+    id_prestamo: Optional[int]
+    texto: str
+    monto: float
+
+
+class ReciboCalculo(NamedTuple):
+    id_empleado: int
+    id_cuenta: int
+    id_banco: int
+    monto: float
+    conceptos: list[ConceptoCalculo]
+
+
+def redondear(monto: float) -> float:
+    return float(Decimal(str(monto)).quantize(CENTAVOS, ROUND_HALF_UP))
+
+
+def calc_recibo(entrada: EntradaCalculo) -> ReciboCalculo:
+    conceptos = [ConceptoCalculo(entrada.salario.id_salario, None, None,
+                                 'Salario', redondear(entrada.salario.monto))]
+    for ajuste in entrada.ajustes:
+        conceptos.append(ConceptoCalculo(None, ajuste.id_ajuste, None,
+                                         ajuste.motivo,
+                                         redondear(ajuste.monto)))
+    for prestamo in entrada.prestamos:
+        cuota = redondear(min(prestamo.monto_quincenal, prestamo.saldo))
+        if cuota <= 0:
+            continue  # pragma: no cover
+        conceptos.append(ConceptoCalculo(None, None, prestamo.id_prestamo,
+                                         prestamo.comentarios or 'Préstamo',
+                                         -cuota))
+    monto = redondear(sum(concepto.monto for concepto in conceptos))
+    return ReciboCalculo(entrada.id_empleado, entrada.id_cuenta,
+                         entrada.id_banco, monto, conceptos)
+
+
+def calc_shard(entradas: list[EntradaCalculo]) -> list[ReciboCalculo]:
+    return [calc_recibo(entrada) for entrada in entradas]
+
+
+def calentar() -> None:
+    # Tarea vacía: obliga al pool a levantar sus procesos al arrancar
+    return None
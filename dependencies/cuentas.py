@@ -3,7 +3,12 @@ from sqlalchemy.orm import Session
 # from sqlalchemy.sql import func
 from starlette import status
 
+from dependencies.etags import cambio_dispersiones
+from dependencies.versiones import cambio_nomina
+from models.bancos import BancosDB
 from models.cuentas import CuentasDB
+from models.empleados import EmpleadosDB
+from models.users import UserDB
 from schemas.cuentas import CuentaIn, CuentaOut
 from schemas.users import User
 
@@ -29,11 +34,25 @@ cuentas_resp_edit = {
 def get_cuentas(db: Session,
                 skip: int = 0,
                 limit: int = 10) -> list[CuentaOut]:
-    cuentas_db = db.\
-        query(CuentasDB)\
+    cuentas_db = db\
+        .query(CuentasDB.id_cuenta,
+               CuentasDB.fecha,
+               CuentasDB.numero,
+               CuentasDB.tipo,
+               CuentasDB.activa,
+               CuentasDB.id_banco,
+               CuentasDB.id_empleado,
+               CuentasDB.id_usuario,
+               UserDB.username.label('usuario'),
+               EmpleadosDB.nombre_completo.label('empleado'),
+               BancosDB.nombre.label('banco'))\
+        .join(UserDB, UserDB.id_user == CuentasDB.id_usuario)\
+        .join(EmpleadosDB, EmpleadosDB.id_empleado == CuentasDB.id_empleado)\
+        .join(BancosDB, BancosDB.id_banco == CuentasDB.id_banco)\
+        .order_by(CuentasDB.id_cuenta)\
         .offset(skip)\
         .limit(limit).all()
-    cuentas = [CuentaOut.model_validate(cuenta)
+    cuentas = [CuentaOut.model_validate(dict(cuenta._mapping))
                for cuenta in cuentas_db]
     return cuentas
 
@@ -45,6 +64,7 @@ def create_cuenta(db: Session,
                                                       exclude=['tipo_txt']),
                               id_usuario=current_user.id_user)
     db.add(cuenta_create)
+    cambio_nomina(db)
     db.commit()
     db.refresh(cuenta_create)
     return cuenta_create
@@ -75,6 +95,8 @@ def edit_cuenta(id_cta: int,
         for key, value in edited_data.items():
             setattr(cuenta_db, key, value)
     db.add(cuenta_db)
+    cambio_dispersiones(db)
+    cambio_nomina(db)
     db.commit()
     db.refresh(cuenta_db)
     return cuenta_db
@@ -98,4 +120,6 @@ def delete_cuenta(db: Session, id_cta: int):
     #                       detail=f'Cuenta con id: {id_cta} ya utilizada, '
     #                              'no se puede eliminar')
     db.delete(cuenta_db)
+    cambio_dispersiones(db)
+    cambio_nomina(db)
     db.commit()
@@ -1,5 +1,6 @@
 from decouple import config
 from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import declarative_base, sessionmaker
 
 DATABASE_URL = config('DB_URL')
@@ -12,6 +13,9 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+# Dialectos con INSERT ... ON CONFLICT (upsert)
+INSERTS_UPSERT = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
 
 def get_db():  # pragma: no cover
     db = SessionLocal()
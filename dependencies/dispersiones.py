@@ -1,22 +1,151 @@
+import json
+import zipfile
+from concurrent.futures import Executor
+from typing import Callable, Iterator
+
 from fastapi import HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, aliased
 from starlette import status
 
-from models.dispersiones import DispersionesDB
-from schemas.dispersiones import (DispersionConDetalles, DispersionIn,
-                                  DispersionOut)
+from dependencies.acumulados import (TOLERANCIA, apply_acumulados,
+                                     nombre_concepto, revert_acumulados,
+                                     tipo_concepto)
+from dependencies.calculo import redondear
+from dependencies.etags import cambio_dispersiones
+from dependencies.layouts import LAYOUTS, Layout
+from dependencies.nomina import get_recibos_periodo, prune_calculos
+from dependencies.prestamos import (apply_saldos_prestamos,
+                                    revert_saldos_prestamos)
+from dependencies.recibos import create_recibos_bulk
+from dependencies.trabajos import create_trabajo, register_tarea, sin_avance
+from dependencies.versiones import cambio_nomina
+from models.bancos import BancosDB
+from models.cuentas import CuentasDB
+from models.dispersiones import DispersionesDB, DispersionesDetalleDB
+from models.empleados import EmpleadosDB
+from models.recibos import RecibosDB, RecibosDetalleDB
+from models.trabajos import TrabajosDB
+from models.users import UserDB
+from schemas.dispersiones import (DiferenciaConcepto, DiferenciaRecibo,
+                                  DiferenciasDispersion,
+                                  DispersionConDetalles, DispersionCreada,
+                                  DispersionIn, DispersionOut,
+                                  ResumenConceptos, ResumenDispersion,
+                                  TotalBanco, TotalConcepto)
+from schemas.nomina import ReciboCalculado, ResumenCalculo
+from schemas.users import User
+
+dispersiones_resp_create = {
+    status.HTTP_200_OK: {
+        'description': 'Vista previa (dry_run): un recibo calculado por '
+                       'línea y al final una línea con el resumen',
+        'content': {
+            'application/x-ndjson': {
+                'example': '{"id_empleado": 1, "monto": 1050.0, ...}\n'
+                           '{"resumen": {"total": 1050.0, "bancos": []}}\n'
+            }
+        }
+    },
+    status.HTTP_400_BAD_REQUEST: {
+        'content': {
+            'application/json': {
+                'schema': {
+                    'type': 'object',
+                    'properties': {
+                        'detail': {
+                            'type': "string"
+                        }
+                    }
+                },
+                'examples': {
+                    'existente': {
+                        'value': {
+                            'detail': "Dispersión del periodo 1 ya "
+                                      "existente"
+                        }
+                    },
+                    'en_proceso': {
+                        'value': {
+                            'detail': "Dispersión del periodo 1 en proceso"
+                        }
+                    }
+                }
+            }
+        }
+    }
+}
+
+dispersiones_resp_404 = {
+    status.HTTP_404_NOT_FOUND: {
+        'content': {
+            'application/json': {
+                'schema': {
+                    'type': 'object',
+                    'properties': {
+                        'detail': {
+                            'type': "string"
+                        }
+                    }
+                },
+                'example': {
+                    'detail': "Dispersión con id: 1 no encontrada"
+                }
+            }
+        }
+    }
+}
+
+dispersiones_resp_archivo = {
+    status.HTTP_200_OK: {
+        'description': 'Archivo de transferencia en el layout del banco '
+                       '(o un zip con uno por banco)',
+        'content': {
+            'text/csv': {},
+            'text/plain': {},
+            'application/zip': {}
+        }
+    },
+    status.HTTP_404_NOT_FOUND: {
+        'content': {
+            'application/json': {
+                'schema': {
+                    'type': 'object',
+                    'properties': {
+                        'detail': {
+                            'type': "string"
+                        }
+                    }
+                },
+                'example': {
+                    'detail': "Dispersión con id: 1 no encontrada"
+                }
+            }
+        }
+    }
+}
+# Filas por viaje al servidor al exportar los depósitos
+DEPOSITOS_POR_LOTE = 500
 
 
 def get_dispersiones(db: Session,
                      skip: int = 0,
                      limit: int = 10) -> list[DispersionOut]:
     dispersiones_db = db\
-        .query(DispersionesDB)\
+        .query(DispersionesDB.id_dispersion,
+               DispersionesDB.fecha,
+               DispersionesDB.periodo,
+               DispersionesDB.periodo_fecha,
+               DispersionesDB.total,
+               DispersionesDB.id_usuario,
+               UserDB.username.label('usuario'))\
+        .join(UserDB, UserDB.id_user == DispersionesDB.id_usuario)\
         .order_by(DispersionesDB.id_dispersion.desc())\
         .offset(skip)\
         .limit(limit)\
         .all()
-    dispersiones = [DispersionOut.model_validate(dispersion)
+    dispersiones = [DispersionOut.model_validate(dict(dispersion._mapping))
                     for dispersion in dispersiones_db]
     return dispersiones
 
@@ -34,11 +163,455 @@ def get_dispersion(db: Session, id_disp: int) -> DispersionConDetalles:
     return dispersion
 
 
+def get_resumen_dispersion(db: Session, id_disp: int) -> ResumenConceptos:
+    dispersion = db\
+        .query(DispersionesDB.id_dispersion,
+               DispersionesDB.periodo,
+               DispersionesDB.periodo_fecha)\
+        .filter(DispersionesDB.id_dispersion == id_disp)\
+        .first()
+    if not dispersion:
+        msg = f'Dispersión con id: {id_disp} no encontrada'
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=msg)
+    # Los conceptos se agrupan en la base: salario, cada motivo de ajuste
+    # y las cuotas de préstamo; los depósitos van por banco
+    tipo = tipo_concepto()
+    concepto = nombre_concepto()
+    conceptos_db = db\
+        .query(tipo.label('tipo'),
+               concepto.label('concepto'),
+               func.count(func.distinct(RecibosDetalleDB.id_recibo))
+               .label('recibos'),
+               func.sum(RecibosDetalleDB.monto).label('total'))\
+        .join(RecibosDB, RecibosDB.id_recibo == RecibosDetalleDB.id_recibo)\
+        .filter(RecibosDB.id_dispersion == id_disp,
+                RecibosDetalleDB.id_cuenta.is_(None))\
+        .group_by(tipo, concepto)\
+        .order_by(tipo.desc(), concepto)\
+        .all()
+    bancos_db = db\
+        .query(BancosDB.id_banco,
+               BancosDB.nombre.label('banco'),
+               func.sum(RecibosDetalleDB.monto).label('total'))\
+        .join(RecibosDB, RecibosDB.id_recibo == RecibosDetalleDB.id_recibo)\
+        .join(CuentasDB, CuentasDB.id_cuenta == RecibosDetalleDB.id_cuenta)\
+        .join(BancosDB, BancosDB.id_banco == CuentasDB.id_banco)\
+        .filter(RecibosDB.id_dispersion == id_disp)\
+        .group_by(BancosDB.id_banco, BancosDB.nombre)\
+        .order_by(BancosDB.id_banco)\
+        .all()
+    return ResumenConceptos(
+        **dispersion._mapping,
+        conceptos=[TotalConcepto(**{**concepto._mapping,
+                                    'total': redondear(concepto.total)})
+                   for concepto in conceptos_db],
+        bancos=[TotalBanco(**{**banco._mapping,
+                              'total': redondear(banco.total)})
+                for banco in bancos_db]
+    )
+
+
+def query_recibos_diferencia(id_disp: int):
+    # Neto y cuenta de depósito de cada empleado en la dispersión
+    return select(RecibosDB.id_empleado,
+                  RecibosDB.monto,
+                  RecibosDetalleDB.id_cuenta)\
+        .outerjoin(RecibosDetalleDB,
+                   (RecibosDetalleDB.id_recibo == RecibosDB.id_recibo)
+                   & RecibosDetalleDB.id_cuenta.is_not(None))\
+        .where(RecibosDB.id_dispersion == id_disp)\
+        .subquery()
+
+
+def query_conceptos_diferencia(id_disp: int):
+    tipo = tipo_concepto()
+    concepto = nombre_concepto()
+    return select(RecibosDB.id_empleado,
+                  tipo.label('tipo'),
+                  concepto.label('concepto'),
+                  func.sum(RecibosDetalleDB.monto).label('monto'))\
+        .join(RecibosDB, RecibosDB.id_recibo == RecibosDetalleDB.id_recibo)\
+        .where(RecibosDB.id_dispersion == id_disp,
+               RecibosDetalleDB.id_cuenta.is_(None))\
+        .group_by(RecibosDB.id_empleado, tipo, concepto)\
+        .subquery()
+
+
+def get_diferencias_dispersion(db: Session,
+                               id_disp: int,
+                               id_base: int) -> DiferenciasDispersion:
+    existentes = db.scalars(
+        select(DispersionesDB.id_dispersion)
+        .where(DispersionesDB.id_dispersion.in_([id_disp, id_base]))
+    ).all()
+    for id_dispersion in (id_disp, id_base):
+        if id_dispersion not in existentes:
+            msg = f'Dispersión con id: {id_dispersion} no encontrada'
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                                detail=msg)
+    # Todo el diff en una consulta: FULL OUTER JOIN de los recibos de
+    # ambas dispersiones por empleado y, con LEFT JOIN, el FULL OUTER JOIN
+    # de sus conceptos; sólo regresan los empleados con algún cambio
+    base = query_recibos_diferencia(id_base)
+    nuevo = query_recibos_diferencia(id_disp)
+    c_base = query_conceptos_diferencia(id_base)
+    c_nuevo = query_conceptos_diferencia(id_disp)
+    c_monto_base = func.coalesce(c_base.c.monto, 0)
+    c_monto = func.coalesce(c_nuevo.c.monto, 0)
+    conceptos = select(func.coalesce(c_nuevo.c.id_empleado,
+                                     c_base.c.id_empleado)
+                       .label('id_empleado'),
+                       func.coalesce(c_nuevo.c.tipo, c_base.c.tipo)
+                       .label('tipo'),
+                       func.coalesce(c_nuevo.c.concepto, c_base.c.concepto)
+                       .label('concepto'),
+                       c_monto_base.label('monto_base'),
+                       c_monto.label('monto'))\
+        .select_from(c_base)\
+        .join(c_nuevo,
+              (c_nuevo.c.id_empleado == c_base.c.id_empleado)
+              & (c_nuevo.c.tipo == c_base.c.tipo)
+              & (c_nuevo.c.concepto == c_base.c.concepto),
+              full=True)\
+        .where(func.abs(c_monto - c_monto_base) > TOLERANCIA)\
+        .subquery()
+    id_empleado = func.coalesce(nuevo.c.id_empleado, base.c.id_empleado)
+    monto_base = func.coalesce(base.c.monto, 0)
+    monto = func.coalesce(nuevo.c.monto, 0)
+    cuenta_base = aliased(CuentasDB)
+    cuenta = aliased(CuentasDB)
+    filas = db.execute(
+        select(id_empleado.label('id_empleado'),
+               EmpleadosDB.nombre_completo.label('empleado'),
+               base.c.monto.label('monto_base'),
+               nuevo.c.monto,
+               cuenta_base.numero.label('cuenta_base'),
+               cuenta.numero.label('cuenta'),
+               conceptos.c.tipo,
+               conceptos.c.concepto,
+               conceptos.c.monto_base.label('concepto_base'),
+               conceptos.c.monto.label('concepto_monto'))
+        .select_from(base)
+        .join(nuevo, nuevo.c.id_empleado == base.c.id_empleado, full=True)
+        .join(EmpleadosDB, EmpleadosDB.id_empleado == id_empleado)
+        .outerjoin(cuenta_base,
+                   cuenta_base.id_cuenta == base.c.id_cuenta)
+        .outerjoin(cuenta, cuenta.id_cuenta == nuevo.c.id_cuenta)
+        .outerjoin(conceptos, conceptos.c.id_empleado == id_empleado)
+        .where(base.c.id_empleado.is_(None)
+               | nuevo.c.id_empleado.is_(None)
+               | (func.abs(monto - monto_base) > TOLERANCIA)
+               | base.c.id_cuenta.is_distinct_from(nuevo.c.id_cuenta)
+               | conceptos.c.id_empleado.is_not(None))
+        .order_by(id_empleado,
+                  conceptos.c.tipo.desc(),
+                  conceptos.c.concepto)
+    ).all()
+    recibos = {}
+    for fila in filas:
+        recibo = recibos.get(fila.id_empleado)
+        if not recibo:
+            recibo = recibos[fila.id_empleado] = DiferenciaRecibo(
+                id_empleado=fila.id_empleado,
+                empleado=fila.empleado,
+                monto_base=fila.monto_base,
+                monto=fila.monto,
+                diferencia=redondear((fila.monto or 0)
+                                     - (fila.monto_base or 0)),
+                cuenta_base=fila.cuenta_base,
+                cuenta=fila.cuenta)
+        if fila.tipo:
+            recibo.conceptos.append(DiferenciaConcepto(
+                tipo=fila.tipo,
+                concepto=fila.concepto,
+                monto_base=redondear(fila.concepto_base),
+                monto=redondear(fila.concepto_monto),
+                diferencia=redondear(fila.concepto_monto
+                                     - fila.concepto_base)))
+    return DiferenciasDispersion(
+        id_dispersion=id_disp,
+        id_base=id_base,
+        diferencia=redondear(sum(recibo.diferencia
+                                 for recibo in recibos.values())),
+        recibos=list(recibos.values()))
+
+
+def validate_periodo(db: Session, create_request: DispersionIn):
+    existente = db\
+        .query(DispersionesDB.id_dispersion)\
+        .filter(DispersionesDB.periodo == create_request.periodo,
+                DispersionesDB.periodo_fecha == create_request.periodo_fecha)\
+        .first()
+    if existente:
+        raise periodo_existente(create_request)
+
+
+def periodo_existente(create_request: DispersionIn) -> HTTPException:
+    msg = f'Dispersión del periodo {create_request.periodo} ya existente'
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                         detail=msg)
+
+
+def preview_dispersion(db: Session,
+                       create_request: DispersionIn) -> Iterator[str]:
+    # Validaciones y lecturas antes de empezar a responder, así los
+    # errores siguen llegando como HTTPException
+    validate_periodo(db, create_request)
+    calculo = ResumenCalculo()
+    total, recibos = get_recibos_periodo(db, create_request, calculo)
+    return stream_recibos(db, create_request, total, recibos, calculo)
+
+
+def stream_recibos(db: Session,
+                   create_request: DispersionIn,
+                   total: int,
+                   recibos: Iterator[ReciboCalculado],
+                   calculo: ResumenCalculo) -> Iterator[str]:
+    totales = {}
+    for recibo in recibos:
+        if recibo.monto > 0:
+            totales[recibo.id_banco] = redondear(
+                totales.get(recibo.id_banco, 0) + recibo.monto)
+        yield recibo.model_dump_json() + '\n'
+    bancos = dict(db
+                  .query(BancosDB.id_banco, BancosDB.nombre)
+                  .filter(BancosDB.id_banco.in_(list(totales)))
+                  .all())
+    resumen = ResumenDispersion(
+        **create_request.model_dump(),
+        recibos=total,
+        **calculo.model_dump(),
+        total=redondear(sum(totales.values())),
+        bancos=[TotalBanco(id_banco=id_banco,
+                           banco=bancos[id_banco],
+                           total=total_banco)
+                for id_banco, total_banco in sorted(totales.items())])
+    # Sólo se guardan los cálculos del periodo, no la dispersión
+    db.commit()
+    yield json.dumps({'resumen': resumen.model_dump(mode='json')}) + '\n'
+
+
+def create_trabajo_dispersion(db: Session,
+                              create_request: DispersionIn,
+                              current_user: User,
+                              executor: Executor) -> TrabajosDB:
+    validate_periodo(db, create_request)
+    clave = f'dispersion:{create_request.periodo}:' \
+            f'{create_request.periodo_fecha}'
+    msg = f'Dispersión del periodo {create_request.periodo} en proceso'
+    return create_trabajo(db, 'dispersion', clave, create_request,
+                          current_user, msg, executor)
+
+
+def run_trabajo_dispersion(db: Session,
+                           trabajo: TrabajosDB,
+                           avance: Callable) -> str:
+    create_request = DispersionIn.model_validate_json(trabajo.parametros)
+    current_user = User.model_validate(trabajo.usuario)
+    dispersion = create_dispersion(db, create_request, current_user, avance)
+    return DispersionCreada.model_validate(dispersion).model_dump_json()
+
+
+register_tarea('dispersion', run_trabajo_dispersion)
+
+
 def create_dispersion(db: Session,
                       create_request: DispersionIn,
-                      dry_run: bool = True):
-    pass
+                      current_user: User,
+                      avance: Callable = sin_avance) -> DispersionesDB:
+    validate_periodo(db, create_request)
+    avance('cargando')
+    calculo = ResumenCalculo()
+    # Los cálculos del periodo no se guardan: se descartan al dispersarlo
+    total, calculados = get_recibos_periodo(db, create_request, calculo,
+                                            guardar=False)
+    recibos = []
+    # El avance se escribe en trabajos con otra conexión: 'guardando' se
+    # reporta con el último recibo, antes de que esta sesión escriba
+    avance('calculando' if total else 'guardando', 0, total)
+    for recibo in calculados:
+        recibos.append(recibo)
+        avance('calculando' if len(recibos) < total
+               else 'guardando', len(recibos), total)
+    avance('guardando', len(recibos), total)
+
+    dispersion_create = DispersionesDB(
+        **create_request.model_dump(),
+        total=redondear(sum(recibo.monto for recibo in recibos
+                            if recibo.monto > 0)),
+        id_usuario=current_user.id_user)
+    db.add(dispersion_create)
+    try:
+        db.flush()
+    except IntegrityError:
+        # Otra corrida guardó el periodo después de validate_periodo
+        db.rollback()
+        raise periodo_existente(create_request)
+    create_recibos_bulk(db, dispersion_create.id_dispersion, recibos)
+    apply_saldos_prestamos(db, create_request, recibos)
+    apply_acumulados(db, dispersion_create.id_dispersion)
+    depositos = {}
+    for recibo in recibos:
+        if recibo.monto > 0:
+            depositos[recibo.id_cuenta] = redondear(
+                depositos.get(recibo.id_cuenta, 0) + recibo.monto)
+    if depositos:
+        db.execute(insert(DispersionesDetalleDB), [
+            {'id_dispersion': dispersion_create.id_dispersion,
+             'id_cuenta': id_cuenta,
+             'monto': monto}
+            for id_cuenta, monto in depositos.items()
+        ])
+    prune_calculos(db)
+    cambio_dispersiones(db)
+    cambio_nomina(db)
+    db.commit()
+    db.refresh(dispersion_create)
+    dispersion_create.reutilizados = calculo.reutilizados
+    dispersion_create.recalculados = calculo.recalculados
+    return dispersion_create
 
 
 def delete_dispersion(db: Session, id_disp: int):
-    pass
+    existe = db\
+        .query(DispersionesDB.id_dispersion)\
+        .filter(DispersionesDB.id_dispersion == id_disp)\
+        .first()
+    if not existe:
+        msg = f'Dispersión con id: {id_disp} no encontrada'
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=msg)
+    # Saldos y acumulados se revierten leyendo los detalles antes de
+    # borrarlos; después un DELETE por tabla en la misma transacción, sin
+    # cargar los hijos por las relaciones
+    revert_saldos_prestamos(db, id_disp)
+    revert_acumulados(db, id_disp)
+    recibos = select(RecibosDB.id_recibo)\
+        .where(RecibosDB.id_dispersion == id_disp)
+    db.query(RecibosDetalleDB)\
+        .filter(RecibosDetalleDB.id_recibo.in_(recibos))\
+        .delete(synchronize_session=False)
+    db.query(RecibosDB)\
+        .filter(RecibosDB.id_dispersion == id_disp)\
+        .delete(synchronize_session=False)
+    db.query(DispersionesDetalleDB)\
+        .filter(DispersionesDetalleDB.id_dispersion == id_disp)\
+        .delete(synchronize_session=False)
+    db.query(DispersionesDB)\
+        .filter(DispersionesDB.id_dispersion == id_disp)\
+        .delete(synchronize_session=False)
+    cambio_dispersiones(db)
+    cambio_nomina(db)
+    db.commit()
+
+
+def get_bancos_dispersion(db: Session, id_disp: int) -> list:
+    existe = db\
+        .query(DispersionesDB.id_dispersion)\
+        .filter(DispersionesDB.id_dispersion == id_disp)\
+        .first()
+    if not existe:
+        msg = f'Dispersión con id: {id_disp} no encontrada'
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=msg)
+    bancos = db\
+        .query(BancosDB.id_banco, BancosDB.nombre, BancosDB.layout)\
+        .join(CuentasDB, CuentasDB.id_banco == BancosDB.id_banco)\
+        .join(DispersionesDetalleDB,
+              DispersionesDetalleDB.id_cuenta == CuentasDB.id_cuenta)\
+        .filter(DispersionesDetalleDB.id_dispersion == id_disp)\
+        .distinct()\
+        .order_by(BancosDB.id_banco)\
+        .all()
+    return bancos
+
+
+def get_layout(banco) -> Layout:
+    return LAYOUTS.get(banco.layout, LAYOUTS['csv'])
+
+
+def nombre_archivo(id_disp: int, banco) -> str:
+    extension = get_layout(banco).extension
+    return f'dispersion_{id_disp}_banco_{banco.id_banco}.{extension}'
+
+
+def iter_depositos(db: Session, id_disp: int, id_banco: int) -> Iterator:
+    # Sólo las columnas del layout y en lotes: nunca se arma el grafo
+    # cuenta -> empleado -> colonia de get_dispersion
+    depositos = db\
+        .query(CuentasDB.numero,
+               EmpleadosDB.nombre_completo.label('beneficiario'),
+               EmpleadosDB.rfc,
+               DispersionesDetalleDB.monto)\
+        .join(CuentasDB,
+              CuentasDB.id_cuenta == DispersionesDetalleDB.id_cuenta)\
+        .join(EmpleadosDB, EmpleadosDB.id_empleado == CuentasDB.id_empleado)\
+        .filter(DispersionesDetalleDB.id_dispersion == id_disp,
+                CuentasDB.id_banco == id_banco)\
+        .order_by(DispersionesDetalleDB.id_dispersiones_detalle)\
+        .execution_options(yield_per=DEPOSITOS_POR_LOTE)
+    yield from depositos
+
+
+def stream_archivo_banco(db: Session,
+                         id_disp: int,
+                         banco) -> Iterator[bytes]:
+    layout = get_layout(banco)
+    for linea in layout.generar(iter_depositos(db, id_disp, banco.id_banco)):
+        yield linea.encode()
+
+
+def export_archivo_banco(db: Session,
+                         id_disp: int,
+                         id_banco: int) -> tuple[Layout, str,
+                                                 Iterator[bytes]]:
+    bancos = get_bancos_dispersion(db, id_disp)
+    banco = next((banco for banco in bancos if banco.id_banco == id_banco),
+                 None)
+    if not banco:
+        msg = f'Banco con id: {id_banco} sin depósitos en la dispersión ' \
+              f'{id_disp}'
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=msg)
+    return (get_layout(banco),
+            nombre_archivo(id_disp, banco),
+            stream_archivo_banco(db, id_disp, banco))
+
+
+class SalidaZip:
+    # Destino no posicionable para ZipFile: acumula lo escrito hasta que
+    # el generador lo entrega
+    def __init__(self):
+        self.partes = []
+
+    def write(self, datos: bytes) -> int:
+        self.partes.append(bytes(datos))
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self) -> bytes:
+        datos = b''.join(self.partes)
+        self.partes.clear()
+        return datos
+
+
+def export_archivos_zip(db: Session,
+                        id_disp: int) -> tuple[str, Iterator[bytes]]:
+    bancos = get_bancos_dispersion(db, id_disp)
+    return f'dispersion_{id_disp}.zip', stream_zip(db, id_disp, bancos)
+
+
+def stream_zip(db: Session, id_disp: int, bancos: list) -> Iterator[bytes]:
+    salida = SalidaZip()
+    with zipfile.ZipFile(salida, 'w', zipfile.ZIP_DEFLATED) as archivo:
+        for banco in bancos:
+            with archivo.open(nombre_archivo(id_disp, banco), 'w') as destino:
+                for linea in stream_archivo_banco(db, id_disp, banco):
+                    destino.write(linea)
+                    datos = salida.vaciar()
+                    if datos:
+                        yield datos
+    yield salida.vaciar()
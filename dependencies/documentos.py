@@ -0,0 +1,255 @@
+import asyncio
+import multiprocessing
+import tempfile
+import zipfile
+from concurrent.futures import (FIRST_COMPLETED, Executor, ProcessPoolExecutor,
+                                wait)
+from datetime import datetime, timedelta
+from html import escape
+from typing import Callable, Iterator, Optional
+
+from decouple import config
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from starlette import status
+
+from dependencies.trabajos import create_trabajo, get_trabajo, register_tarea
+from models.dispersiones import DispersionesDB
+from models.empleados import EmpleadosDB
+from models.recibos import RecibosDB, RecibosDetalleDB
+from models.trabajos import TrabajosArchivoDB, TrabajosDB
+from schemas.recibos import (ConceptoDocumento, DocumentosIn, DocumentosOut,
+                             ReciboDocumento)
+from schemas.users import User
+
+RENDER_WORKERS = config('RENDER_WORKERS', default=1, cast=int)
+# Segundos que se conserva un zip terminado antes de borrarlo
+RENDER_TTL = config('RENDER_TTL', default=24 * 3600, cast=int)
+# Segundos entre limpiezas de zips vencidos, desde el lifespan
+RENDER_LIMPIEZA = config('RENDER_LIMPIEZA', default=3600, cast=int)
+# Recibos por lote: una consulta de recibos y una de detalles por lote
+RENDER_LOTE = 200
+
+PLANTILLA = """<!DOCTYPE html>
+<html lang="es">
+<head>
+<meta charset="utf-8">
+<title>Recibo {id_recibo}</title>
+<style>
+body {{ font-family: sans-serif; font-size: 12px; }}
+table {{ border-collapse: collapse; width: 100%; }}
+td {{ border-bottom: 1px solid #ccc; padding: 4px; }}
+td.monto {{ text-align: right; }}
+</style>
+</head>
+<body>
+<h1>Recibo de nómina</h1>
+<p>{empleado}<br>RFC: {rfc}</p>
+<p>Periodo {periodo} ({periodo_fecha})</p>
+<table>
+{conceptos}
+<tr><td><strong>Neto</strong></td>
+<td class="monto"><strong>{monto}</strong></td></tr>
+</table>
+</body>
+</html>
+"""
+CONCEPTO = '<tr><td>{texto}</td><td class="monto">{monto}</td></tr>'
+
+
+def formato_monto(monto: float) -> str:
+    signo = '-' if monto < 0 else ''
+    return f'{signo}${abs(monto):,.2f}'
+
+
+def render_recibo(recibo: ReciboDocumento) -> str:
+    conceptos = '\n'.join(CONCEPTO.format(texto=escape(concepto.texto or ''),
+                                          monto=formato_monto(concepto.monto))
+                          for concepto in recibo.conceptos)
+    return PLANTILLA.format(id_recibo=recibo.id_recibo,
+                            empleado=escape(recibo.empleado),
+                            rfc=escape(recibo.rfc or ''),
+                            periodo=recibo.periodo,
+                            periodo_fecha=recibo.periodo_fecha,
+                            conceptos=conceptos,
+                            monto=formato_monto(recibo.monto))
+
+
+def nombre_documento(recibo: ReciboDocumento) -> str:
+    return f'recibo_{recibo.id_recibo}_{recibo.rfc or ""}.html'
+
+
+def render_lote(recibos: list[ReciboDocumento]) -> list[tuple[str, str]]:
+    return [(nombre_documento(recibo), render_recibo(recibo))
+            for recibo in recibos]
+
+
+def iter_lotes_documentos(db: Session,
+                          id_disp: int,
+                          lote: int = RENDER_LOTE
+                          ) -> Iterator[list[ReciboDocumento]]:
+    dispersion = db\
+        .query(DispersionesDB.periodo, DispersionesDB.periodo_fecha)\
+        .filter(DispersionesDB.id_dispersion == id_disp)\
+        .one()
+    despues = 0
+    while True:
+        recibos_db = db\
+            .query(RecibosDB.id_recibo,
+                   EmpleadosDB.nombre_completo.label('empleado'),
+                   EmpleadosDB.rfc,
+                   RecibosDB.monto)\
+            .join(EmpleadosDB,
+                  EmpleadosDB.id_empleado == RecibosDB.id_empleado)\
+            .filter(RecibosDB.id_dispersion == id_disp,
+                    RecibosDB.id_recibo > despues)\
+            .order_by(RecibosDB.id_recibo)\
+            .limit(lote)\
+            .all()
+        if not recibos_db:
+            return
+        conceptos = {}
+        # El depósito no es un concepto del recibo
+        for detalle in db\
+                .query(RecibosDetalleDB.id_recibo,
+                       RecibosDetalleDB.texto,
+                       RecibosDetalleDB.monto)\
+                .filter(RecibosDetalleDB.id_recibo.in_(
+                    [recibo.id_recibo for recibo in recibos_db]),
+                    RecibosDetalleDB.id_cuenta.is_(None))\
+                .order_by(RecibosDetalleDB.id_recibos_detalle):
+            conceptos.setdefault(detalle.id_recibo, [])\
+                .append(ConceptoDocumento(texto=detalle.texto,
+                                          monto=detalle.monto))
+        yield [ReciboDocumento(**recibo._mapping,
+                               **dispersion._mapping,
+                               conceptos=conceptos.get(recibo.id_recibo, []))
+               for recibo in recibos_db]
+        despues = recibos_db[-1].id_recibo
+
+
+def iter_documentos(lotes: Iterator[list[ReciboDocumento]],
+                    workers: int = RENDER_WORKERS
+                    ) -> Iterator[list[tuple[str, str]]]:
+    if workers <= 1:
+        for recibos in lotes:
+            yield render_lote(recibos)
+        return
+    contexto = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=contexto) as pool:
+        # A lo más dos lotes por proceso en vuelo: la lectura de la base
+        # no se adelanta al render y cada lote se entrega al terminar
+        pendientes = set()
+        for recibos in lotes:
+            pendientes.add(pool.submit(render_lote, recibos))
+            if len(pendientes) >= workers * 2:
+                listos, pendientes = wait(pendientes,
+                                          return_when=FIRST_COMPLETED)
+                for listo in listos:
+                    yield listo.result()
+        for listo in wait(pendientes).done:
+            yield listo.result()
+
+
+def nombre_archivo(id_trabajo: int) -> str:
+    return f'recibos_{id_trabajo}.zip'
+
+
+def limpiar_documentos(db: Session, ahora: Optional[datetime] = None) -> int:
+    # Los zips viven en la base: cualquier worker los puede borrar
+    if ahora is None:
+        ahora = datetime.utcnow()
+    borrados = db\
+        .query(TrabajosArchivoDB)\
+        .filter(TrabajosArchivoDB.fecha <
+                ahora - timedelta(seconds=RENDER_TTL))\
+        .delete(synchronize_session=False)
+    db.commit()
+    return borrados
+
+
+async def limpiar_documentos_periodico(abrir_db: Callable):
+    # Desde el lifespan, como la recarga de revocaciones
+    while True:
+        await asyncio.sleep(RENDER_LIMPIEZA)
+        await run_in_threadpool(limpiar_documentos_db, abrir_db)
+
+
+def limpiar_documentos_db(abrir_db: Callable):
+    db_gen = abrir_db()
+    try:
+        limpiar_documentos(next(db_gen))
+    except SQLAlchemyError:  # pragma: no cover
+        # Se reintenta en la siguiente vuelta
+        pass
+    finally:
+        db_gen.close()
+
+
+def run_trabajo_documentos(db: Session,
+                           trabajo: TrabajosDB,
+                           avance: Callable) -> str:
+    documentos_in = DocumentosIn.model_validate_json(trabajo.parametros)
+    id_disp = documentos_in.id_dispersion
+    total = db\
+        .query(RecibosDB.id_recibo)\
+        .filter(RecibosDB.id_dispersion == id_disp)\
+        .count()
+    avance('renderizando', 0, total)
+    # El zip se arma en un temporal local y se guarda completo en la base,
+    # de donde lo descarga cualquier host
+    procesados = 0
+    with tempfile.TemporaryFile() as temporal:
+        with zipfile.ZipFile(temporal, 'w', zipfile.ZIP_DEFLATED) as archivo:
+            for documentos in iter_documentos(
+                    iter_lotes_documentos(db, id_disp)):
+                for nombre, contenido in documentos:
+                    archivo.writestr(nombre, contenido)
+                procesados += len(documentos)
+                avance('renderizando', procesados, total)
+        temporal.seek(0)
+        # merge: una corrida anterior del trabajo pudo guardarlo ya
+        db.merge(TrabajosArchivoDB(id_trabajo=trabajo.id_trabajo,
+                                   fecha=datetime.utcnow(),
+                                   nombre=nombre_archivo(trabajo.id_trabajo),
+                                   contenido=temporal.read()))
+    db.commit()
+    return DocumentosOut(archivo=nombre_archivo(trabajo.id_trabajo),
+                         recibos=procesados).model_dump_json()
+
+
+register_tarea('documentos', run_trabajo_documentos)
+
+
+def create_trabajo_documentos(db: Session,
+                              id_disp: int,
+                              current_user: User,
+                              executor: Executor) -> TrabajosDB:
+    existe = db\
+        .query(DispersionesDB.id_dispersion)\
+        .filter(DispersionesDB.id_dispersion == id_disp)\
+        .first()
+    if not existe:
+        msg = f'Dispersión con id: {id_disp} no encontrada'
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=msg)
+    msg = f'Recibos de la dispersión {id_disp} en proceso'
+    return create_trabajo(db, 'documentos', f'documentos:{id_disp}',
+                          DocumentosIn(id_dispersion=id_disp),
+                          current_user, msg, executor)
+
+
+def get_archivo_documentos(db: Session,
+                           id_trabajo: int) -> TrabajosArchivoDB:
+    trabajo = get_trabajo(db, id_trabajo, 'documentos')
+    archivo = None
+    if trabajo.estado == 'terminado':
+        archivo = db.get(TrabajosArchivoDB, id_trabajo)
+    if not archivo:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f'Archivo del trabajo {id_trabajo} '
+                                   'no disponible')
+    return archivo
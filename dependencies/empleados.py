@@ -2,6 +2,8 @@ from fastapi import HTTPException
 from sqlalchemy.orm import Session
 from starlette import status
 
+from dependencies.etags import cambio_dispersiones
+from dependencies.versiones import cambio_nomina
 from models.empleados import EmpleadosDB
 from schemas.empleados import Empleado, EmpleadoIn
 
@@ -63,6 +65,7 @@ def create_empleado(db: Session,
                             detail='CURP ya registrado')
     empleado_create = EmpleadosDB(**empleado_data.model_dump())
     db.add(empleado_create)
+    cambio_nomina(db)
     db.commit()
     db.refresh(empleado_create)
     return empleado_create
@@ -92,6 +95,8 @@ def edit_empleado(id_emp: int,
     for key, value in edited_data.items():
         setattr(empleado_db, key, value)
     db.add(empleado_db)
+    cambio_dispersiones(db)
+    cambio_nomina(db)
     db.commit()
     db.refresh(empleado_db)
     return empleado_db
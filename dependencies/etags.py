@@ -0,0 +1,73 @@
+from typing import Optional
+
+from fastapi import Response
+from sqlalchemy.orm import Session
+from starlette import status
+
+from dependencies.versiones import DISPERSIONES, cambio_version, get_version
+
+# Las dispersiones y sus recibos sólo cambian al crear o eliminar una
+# dispersión o al editar los datos unidos (usuario, empleado, cuenta,
+# banco). Cada una de esas escrituras sube un contador en la base, el
+# mismo para todos los workers: el 304 se decide leyendo sólo ese
+# contador, sin consultar, validar ni serializar la respuesta
+# Cambiarla cuando cambie la forma de las respuestas con ETag
+VERSION_RESPUESTAS = '2'
+
+etags_resp = {
+    status.HTTP_304_NOT_MODIFIED: {
+        'description': 'Sin cambios desde el ETag enviado en If-None-Match'
+    }
+}
+
+
+def cambio_dispersiones(db: Session):
+    cambio_version(db, DISPERSIONES)
+
+
+def version_dispersiones(db: Session) -> int:
+    return get_version(db, DISPERSIONES)
+
+
+def etag(db: Session, *partes) -> str:
+    llave = '-'.join(str(parte) for parte in partes)
+    return f'"{llave}.{VERSION_RESPUESTAS}.{version_dispersiones(db)}"'
+
+
+def etag_coincide(if_none_match: Optional[str], actual: str) -> bool:
+    if not if_none_match:
+        return False
+    # '*' no se acepta: sin consultar no se sabe si el recurso existe
+    etags = [valor.strip().removeprefix('W/')
+             for valor in if_none_match.split(',')]
+    return actual in etags
+
+
+def acepta_codificacion(accept_encoding: str, codificacion: str) -> bool:
+    # q=0 rechaza la codificación; '*' cubre las no mencionadas
+    calidades = {}
+    for parte in accept_encoding.split(','):
+        nombre, _, parametros = parte.partition(';')
+        calidad = 1.0
+        for parametro in parametros.split(';'):
+            llave, _, valor = parametro.partition('=')
+            if llave.strip().lower() == 'q':
+                try:
+                    calidad = float(valor)
+                except ValueError:
+                    calidad = 0
+        if nombre.strip():
+            calidades[nombre.strip().lower()] = calidad
+    return calidades.get(codificacion, calidades.get('*', 0)) > 0
+
+
+def not_modified(if_none_match: Optional[str],
+                 actual: str,
+                 response: Response) -> Optional[Response]:
+    # 304 antes de consultar la base; si no coincide el ETag se agrega a
+    # la respuesta normal
+    if etag_coincide(if_none_match, actual):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED,
+                        headers={'ETag': actual})
+    response.headers['ETag'] = actual
+    return None
@@ -0,0 +1,58 @@
+import csv
+import io
+import unicodedata
+from typing import Callable, Iterable, Iterator, NamedTuple
+
+
+class Layout(NamedTuple):
+    extension: str
+    media_type: str
+    generar: Callable[[Iterable], Iterator[str]]
+
+
+def centavos(monto: float) -> int:
+    return int(round(monto * 100))
+
+
+def layout_csv(depositos: Iterable) -> Iterator[str]:
+    salida = io.StringIO()
+    escritor = csv.writer(salida, lineterminator='\r\n')
+    escritor.writerow(['cuenta', 'beneficiario', 'rfc', 'monto'])
+    for deposito in depositos:
+        escritor.writerow([deposito.numero,
+                           deposito.beneficiario,
+                           deposito.rfc,
+                           f'{deposito.monto:.2f}'])
+        yield salida.getvalue()
+        salida.seek(0)
+        salida.truncate()
+    # Sin depósitos sólo se envía el encabezado
+    if salida.getvalue():
+        yield salida.getvalue()
+
+
+def ascii_banco(texto: str) -> str:
+    # Las columnas del layout fijo son bytes: Ñ o un acento recorrerían
+    # todas las siguientes. Se quitan los diacríticos (Ñ -> N) y lo que
+    # no tenga equivalente ASCII
+    descompuesto = unicodedata.normalize('NFKD', texto)
+    return descompuesto.encode('ascii', 'ignore').decode('ascii')
+
+
+def layout_fijo(depositos: Iterable) -> Iterator[str]:
+    # cuenta(18) beneficiario(40) rfc(13) monto en centavos(15)
+    for deposito in depositos:
+        yield ''.join([ascii_banco(deposito.numero).rjust(18, '0')[-18:],
+                       ascii_banco(deposito.beneficiario.upper())
+                       .ljust(40)[:40],
+                       ascii_banco((deposito.rfc or '').upper())
+                       .ljust(13)[:13],
+                       str(centavos(deposito.monto)).rjust(15, '0'),
+                       '\r\n'])
+
+
+# Uno por cada schemas.bancos.TIPOS_LAYOUT
+LAYOUTS = {
+    'csv': Layout('csv', 'text/csv', layout_csv),
+    'fijo': Layout('txt', 'text/plain', layout_fijo),
+}
@@ -0,0 +1,296 @@
+import hashlib
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, wait
+from datetime import date
+from typing import Iterable, Iterator, Optional
+
+from decouple import config
+from fastapi import HTTPException
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import Session
+from starlette import status
+
+from dependencies.ajustes import get_ajustes_activos
+from dependencies.calculo import (AjusteCalculo, CuotaCalculo, EntradaCalculo,
+                                  ReciboCalculo, SalarioCalculo, calc_recibo,
+                                  calc_shard, calentar)
+from dependencies.database import INSERTS_UPSERT
+from dependencies.prestamos import get_cuotas_prestamos
+from dependencies.salarios import get_salarios_vigentes
+from dependencies.versiones import version_nomina
+from models.bancos import BancosDB
+from models.cuentas import CuentasDB
+from models.dispersiones import DispersionesCalculoDB, DispersionesDB
+from schemas.dispersiones import DispersionIn
+from schemas.nomina import (ConceptoRecibo, CuentaNomina, EntradaNomina,
+                            ReciboCalculado, ResumenCalculo)
+
+NOMINA_WORKERS = config('NOMINA_WORKERS', default=1, cast=int)
+# Empleados mínimos para usar el pool. Construir los modelos de pydantic
+# de cada recibo se queda en este proceso y cuesta más que el cálculo que
+# se reparte: el pool sólo conviene con plantillas muy grandes
+NOMINA_MINIMO = config('NOMINA_MINIMO', default=20000, cast=int)
+# Cambiarla cuando cambie calc_recibo invalida los cálculos guardados
+VERSION_CALCULO = '1'
+# Pool de procesos de larga vida, creado en el lifespan
+pool_nomina: Optional[ProcessPoolExecutor] = None
+
+
+def get_entradas_nomina(db: Session,
+                        periodo_fecha: date) -> list[EntradaNomina]:
+    # Una consulta por tipo de dato para toda la plantilla, nunca una
+    # por empleado
+    salarios = get_salarios_vigentes(db, periodo_fecha, solo_activos=True)
+
+    ajustes = get_ajustes_activos(db, periodo_fecha)
+    prestamos = get_cuotas_prestamos(db, periodo_fecha)
+
+    cuentas_db = db\
+        .query(CuentasDB.id_cuenta,
+               CuentasDB.id_empleado,
+               CuentasDB.id_banco,
+               BancosDB.nombre.label('banco'),
+               CuentasDB.numero,
+               CuentasDB.tipo)\
+        .join(BancosDB, BancosDB.id_banco == CuentasDB.id_banco)\
+        .filter(CuentasDB.activa, BancosDB.activo)\
+        .order_by(CuentasDB.id_empleado,
+                  CuentasDB.tipo.desc(),
+                  CuentasDB.id_cuenta.desc())\
+        .all()
+
+    # Preferencia: cuenta de nómina y después la más reciente
+    cuentas = {}
+    for cuenta in cuentas_db:
+        cuentas.setdefault(cuenta.id_empleado, cuenta)
+
+    sin_cuenta = [id_empleado for id_empleado in salarios
+                  if id_empleado not in cuentas]
+    if sin_cuenta:
+        ids = ', '.join(str(id_emp) for id_emp in sin_cuenta)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f'Empleados sin cuenta activa: {ids}')
+
+    entradas = [
+        EntradaNomina(
+            id_empleado=id_empleado,
+            salario=salario,
+            ajustes=ajustes.get(id_empleado, []),
+            prestamos=prestamos.get(id_empleado, []),
+            cuenta=CuentaNomina.model_validate(cuentas[id_empleado])
+        )
+        for id_empleado, salario in salarios.items()
+    ]
+    return entradas
+
+
+def entrada_calculo(entrada: EntradaNomina) -> EntradaCalculo:
+    salario = entrada.salario
+    return EntradaCalculo(
+        entrada.id_empleado, entrada.cuenta.id_cuenta, entrada.cuenta.id_banco,
+        SalarioCalculo(salario.id_salario, salario.monto),
+        [AjusteCalculo(ajuste.id_ajuste, ajuste.motivo, ajuste.monto)
+         for ajuste in entrada.ajustes],
+        [CuotaCalculo(prestamo.id_prestamo, prestamo.comentarios,
+                      prestamo.monto_quincenal, prestamo.saldo)
+         for prestamo in entrada.prestamos])
+
+
+def recibo_calculado(recibo: ReciboCalculo) -> ReciboCalculado:
+    return ReciboCalculado(
+        id_empleado=recibo.id_empleado,
+        id_cuenta=recibo.id_cuenta,
+        id_banco=recibo.id_banco,
+        monto=recibo.monto,
+        conceptos=[ConceptoRecibo(**concepto._asdict())
+                   for concepto in recibo.conceptos])
+
+
+def split_shards(entradas: list, shards: int) -> list[list]:
+    # Las entradas vienen ordenadas por id_empleado, cada shard es un
+    # rango contiguo de empleados
+    tamanio, extra = divmod(len(entradas), shards)
+    particion = []
+    inicio = 0
+    for i in range(shards):
+        fin = inicio + tamanio + (1 if i < extra else 0)
+        if fin > inicio:
+            particion.append(entradas[inicio:fin])
+        inicio = fin
+    return particion
+
+
+def crear_pool_nomina(workers: int) -> ProcessPoolExecutor:
+    # spawn: no heredar hilos ni conexiones del proceso de uvicorn. Cada
+    # proceso carga sólo dependencies.calculo y se levanta aquí, una vez
+    contexto = multiprocessing.get_context('spawn')
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=contexto)
+    wait([pool.submit(calentar) for _ in range(workers)])
+    return pool
+
+
+def start_pool_nomina(workers: int = NOMINA_WORKERS):
+    global pool_nomina
+    if workers > 1 and pool_nomina is None:
+        pool_nomina = crear_pool_nomina(workers)
+
+
+def stop_pool_nomina():
+    global pool_nomina
+    if pool_nomina is not None:
+        pool_nomina.shutdown(cancel_futures=True)
+        pool_nomina = None
+
+
+def iter_recibos(entradas: list[EntradaNomina],
+                 pool: Optional[Executor] = None,
+                 workers: int = NOMINA_WORKERS,
+                 minimo: int = NOMINA_MINIMO) -> Iterator[ReciboCalculado]:
+    pool = pool or pool_nomina
+    if pool is None or workers <= 1 or len(entradas) < minimo:
+        for entrada in entradas:
+            yield recibo_calculado(calc_recibo(entrada_calculo(entrada)))
+        return
+    shards = split_shards([entrada_calculo(entrada) for entrada in entradas],
+                          workers)
+    # map entrega los shards en orden, el resultado es idéntico al de un
+    # solo proceso
+    for recibos in pool.map(calc_shard, shards):
+        for recibo in recibos:
+            yield recibo_calculado(recibo)
+
+
+def calc_recibos(entradas: list[EntradaNomina],
+                 pool: Optional[Executor] = None,
+                 workers: int = NOMINA_WORKERS,
+                 minimo: int = NOMINA_MINIMO) -> list[ReciboCalculado]:
+    return list(iter_recibos(entradas, pool, workers, minimo))
+
+
+def huella_entrada(entrada: EntradaNomina) -> str:
+    datos = VERSION_CALCULO + entrada.model_dump_json()
+    return hashlib.sha256(datos.encode()).hexdigest()
+
+
+def version_calculo(db: Session) -> str:
+    return f'{VERSION_CALCULO}.{version_nomina(db)}'
+
+
+def get_recibos_periodo(db: Session,
+                        create_request: DispersionIn,
+                        resumen: ResumenCalculo,
+                        guardar: bool = True
+                        ) -> tuple[int, Iterator[ReciboCalculado]]:
+    # Si el contador de nómina no cambió desde la última corrida del
+    # periodo, ningún dato de entrada cambió: los recibos salen de
+    # dispersiones_calculo sin leer las entradas. Las escrituras que no
+    # pasan por dependencies deben llamar a cambio_nomina
+    version = version_calculo(db)
+    previos = db\
+        .query(DispersionesCalculoDB.id_empleado,
+               DispersionesCalculoDB.huella,
+               DispersionesCalculoDB.version,
+               DispersionesCalculoDB.recibo)\
+        .filter(DispersionesCalculoDB.periodo == create_request.periodo,
+                DispersionesCalculoDB.periodo_fecha ==
+                create_request.periodo_fecha)\
+        .order_by(DispersionesCalculoDB.id_empleado)\
+        .all()
+    if previos and all(previo.version == version for previo in previos):
+        resumen.reutilizados = len(previos)
+        return len(previos), (ReciboCalculado.model_validate_json(
+            previo.recibo) for previo in previos)
+    entradas = get_entradas_nomina(db, create_request.periodo_fecha)
+    return len(entradas), iter_recibos_periodo(db, create_request, entradas,
+                                               resumen, version, previos,
+                                               guardar)
+
+
+def iter_recibos_periodo(db: Session,
+                         create_request: DispersionIn,
+                         entradas: list[EntradaNomina],
+                         resumen: ResumenCalculo,
+                         version: str,
+                         previos: list,
+                         guardar: bool = True
+                         ) -> Iterator[ReciboCalculado]:
+    # Con cambios en las entradas, reutiliza el recibo de la corrida
+    # anterior de cada empleado cuyas filas (salario, ajustes, préstamos y
+    # cuenta) no cambiaron; sólo se recalculan los demás
+    huellas = {entrada.id_empleado: huella_entrada(entrada)
+               for entrada in entradas}
+    previos = {previo.id_empleado: previo for previo in previos
+               if previo.huella == huellas.get(previo.id_empleado)}
+    pendientes = [entrada for entrada in entradas
+                  if entrada.id_empleado not in previos]
+    resumen.reutilizados = len(entradas) - len(pendientes)
+    resumen.recalculados = len(pendientes)
+
+    calculados = iter_recibos(pendientes)
+    nuevos = []
+    for entrada in entradas:
+        previo = previos.get(entrada.id_empleado)
+        if previo:
+            yield ReciboCalculado.model_validate_json(previo.recibo)
+            continue
+        recibo = next(calculados)
+        nuevos.append(recibo)
+        yield recibo
+    calculados.close()
+    if guardar:
+        save_calculos(db, create_request, nuevos, huellas, previos.keys(),
+                      version)
+
+
+def save_calculos(db: Session,
+                  create_request: DispersionIn,
+                  recibos: list[ReciboCalculado],
+                  huellas: dict[int, str],
+                  vigentes: Iterable[int],
+                  version: str):
+    del_periodo = (DispersionesCalculoDB.periodo == create_request.periodo,
+                   DispersionesCalculoDB.periodo_fecha ==
+                   create_request.periodo_fecha)
+    db.query(DispersionesCalculoDB)\
+        .filter(*del_periodo,
+                DispersionesCalculoDB.id_empleado.not_in(list(vigentes)))\
+        .delete(synchronize_session=False)
+    if recibos:
+        # Upsert: un dry run simultáneo del mismo periodo pudo guardar ya
+        # al empleado; gana el último en lugar de romper la respuesta
+        upsert = INSERTS_UPSERT.get(db.get_bind().dialect.name)
+        if upsert:
+            stmt = upsert(DispersionesCalculoDB)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['periodo', 'periodo_fecha', 'id_empleado'],
+                set_={'huella': stmt.excluded.huella,
+                      'recibo': stmt.excluded.recibo,
+                      'fecha': func.now()})
+        else:  # pragma: no cover
+            stmt = insert(DispersionesCalculoDB)
+        db.execute(stmt, [
+            {**create_request.model_dump(),
+             'id_empleado': recibo.id_empleado,
+             'huella': huellas[recibo.id_empleado],
+             'recibo': recibo.model_dump_json()}
+            for recibo in recibos
+        ])
+    # Los reutilizados también quedan validados con la versión leída
+    # antes de las entradas
+    db.query(DispersionesCalculoDB)\
+        .filter(*del_periodo)\
+        .update({DispersionesCalculoDB.version: version},
+                synchronize_session=False)
+
+
+def prune_calculos(db: Session):
+    # Los cálculos sólo sirven para repetir el dry run de un periodo; una
+    # vez dispersado ya no se pueden usar
+    dispersado = select(DispersionesDB.id_dispersion)\
+        .where(DispersionesDB.periodo == DispersionesCalculoDB.periodo,
+               DispersionesDB.periodo_fecha ==
+               DispersionesCalculoDB.periodo_fecha)\
+        .exists()
+    db.query(DispersionesCalculoDB)\
+        .filter(dispersado)\
+        .delete(synchronize_session=False)
@@ -1,9 +1,19 @@
+from datetime import date
+
 from fastapi import HTTPException
+from sqlalchemy import bindparam, exists, insert, select, update
 from sqlalchemy.orm import Session
-# from sqlalchemy.sql import func
+from sqlalchemy.sql import func
 from starlette import status
 
-from models.prestamos import PrestamosDB
+from dependencies.versiones import cambio_nomina
+from models.dispersiones import DispersionesDB
+from models.empleados import EmpleadosDB
+from models.prestamos import PrestamosDB, PrestamosSaldoDB
+from models.recibos import RecibosDB, RecibosDetalleDB
+from models.users import UserDB
+from schemas.dispersiones import DispersionIn
+from schemas.nomina import CuotaPrestamo, ReciboCalculado
 from schemas.prestamos import PrestamoIn, PrestamoOut
 from schemas.users import User
 
@@ -29,11 +39,24 @@ prestamos_resp_edit = {
 def get_prestamos(db: Session,
                   skip: int = 0,
                   limit: int = 10) -> list[PrestamoOut]:
-    prestamos_db = db.\
-        query(PrestamosDB)\
+    prestamos_db = db\
+        .query(PrestamosDB.id_prestamo,
+               PrestamosDB.fecha,
+               PrestamosDB.fecha_inicio,
+               PrestamosDB.monto,
+               PrestamosDB.monto_quincenal,
+               PrestamosDB.comentarios,
+               PrestamosDB.id_empleado,
+               PrestamosDB.id_usuario,
+               UserDB.username.label('usuario'),
+               EmpleadosDB.nombre_completo.label('empleado'))\
+        .join(UserDB, UserDB.id_user == PrestamosDB.id_usuario)\
+        .join(EmpleadosDB,
+              EmpleadosDB.id_empleado == PrestamosDB.id_empleado)\
+        .order_by(PrestamosDB.id_prestamo)\
         .offset(skip)\
         .limit(limit).all()
-    prestamos = [PrestamoOut.model_validate(prestamo)
+    prestamos = [PrestamoOut.model_validate(dict(prestamo._mapping))
                  for prestamo in prestamos_db]
     return prestamos
 
@@ -44,6 +67,11 @@ def create_prestamo(db: Session,
     prestamo_create = PrestamosDB(**input_data.model_dump(exclude_unset=True),
                                   id_usuario=current_user.id_user)
     db.add(prestamo_create)
+    db.flush()
+    db.add(PrestamosSaldoDB(id_prestamo=prestamo_create.id_prestamo,
+                            saldo=prestamo_create.monto,
+                            cuotas_pagadas=0))
+    cambio_nomina(db)
     db.commit()
     db.refresh(prestamo_create)
     return prestamo_create
@@ -58,20 +86,19 @@ def edit_prestamo(id_pres: int,
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail=f'Prestamo con id: {id_pres} no encontrado')
     del input_data.id_empleado
-    # TODO: validar monto
-    # monto_pagado = db\
-    #     .query(func.sum(RecibosDB.monto).label('Total'))\
-    #     .filter(RecibosDB.id_prestamo == id_pres)\
-    #     .first().Total
-    # if input_data.monto < monto_pagado:
-    #     raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
-    #                         detail='EL monto total no puede ser menor a la '
-    #                                f'suma de lo ya pagado (${monto_pagado})')
+    saldo_db = get_saldo_prestamo(db, prestamo_db)
+    monto_pagado = prestamo_db.monto - saldo_db.saldo
+    if input_data.monto < monto_pagado:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail='EL monto total no puede ser menor a la '
+                                   f'suma de lo ya pagado (${monto_pagado})')
+    saldo_db.saldo = input_data.monto - monto_pagado
     # TODO: Validar Fecha Ini si ya aplicada
     edited_data = input_data.model_dump(exclude_unset=True)
     for key, value in edited_data.items():
         setattr(prestamo_db, key, value)
     db.add(prestamo_db)
+    cambio_nomina(db)
     db.commit()
     db.refresh(prestamo_db)
     return prestamo_db
@@ -85,14 +112,124 @@ def delete_prestamo(db: Session, id_pres: int):
     if not prestamo_db:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail=f'Prestamo con id: {id_pres} no encontrado')
-    # TODO: Validar que no esté aplicada
-    # aplicado = db\
-    #     .query(RecibosDB)\
-    #     .filter(RecibosDB.id_prestamo == id_pres)\
-    #     .first()
-    # if aplicado:
-    #   raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
-    #                       detail=f'Prestamo con id: {id_pres} ya aplicado, '
-    #                              'no se puede eliminar')
+    saldo_db = db.get(PrestamosSaldoDB, id_pres)
+    if saldo_db and saldo_db.cuotas_pagadas:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f'Prestamo con id: {id_pres} ya aplicado, '
+                                   'no se puede eliminar')
+    if saldo_db:
+        db.delete(saldo_db)
     db.delete(prestamo_db)
+    cambio_nomina(db)
     db.commit()
+
+
+def get_saldo_prestamo(db: Session,
+                       prestamo_db: PrestamosDB) -> PrestamosSaldoDB:
+    saldo_db = db.get(PrestamosSaldoDB, prestamo_db.id_prestamo)
+    if not saldo_db:
+        saldo_db = PrestamosSaldoDB(id_prestamo=prestamo_db.id_prestamo,
+                                    saldo=prestamo_db.monto,
+                                    cuotas_pagadas=0)
+        db.add(saldo_db)
+    return saldo_db
+
+
+def get_cuotas_prestamos(db: Session,
+                         fecha: date) -> dict[int, list[CuotaPrestamo]]:
+    saldo = func.coalesce(PrestamosSaldoDB.saldo, PrestamosDB.monto)
+    prestamos_db = db\
+        .query(PrestamosDB.id_prestamo,
+               PrestamosDB.id_empleado,
+               PrestamosDB.comentarios,
+               PrestamosDB.monto_quincenal,
+               saldo.label('saldo'))\
+        .outerjoin(PrestamosSaldoDB,
+                   PrestamosSaldoDB.id_prestamo == PrestamosDB.id_prestamo)\
+        .filter(PrestamosDB.fecha_inicio <= fecha)\
+        .filter(saldo > 0)\
+        .order_by(PrestamosDB.id_prestamo)\
+        .all()
+    cuotas = {}
+    for prestamo in prestamos_db:
+        cuotas.setdefault(prestamo.id_empleado, [])\
+            .append(CuotaPrestamo.model_validate(prestamo))
+    return cuotas
+
+
+def sync_saldos_prestamos(db: Session, ids_prestamo: list[int]):
+    # Préstamos dados de alta sin pasar por create_prestamo
+    faltantes = select(PrestamosDB.id_prestamo,
+                       PrestamosDB.monto,
+                       0)\
+        .where(PrestamosDB.id_prestamo.in_(ids_prestamo),
+               ~exists().where(PrestamosSaldoDB.id_prestamo ==
+                               PrestamosDB.id_prestamo))
+    db.execute(insert(PrestamosSaldoDB)
+               .from_select(['id_prestamo', 'saldo', 'cuotas_pagadas'],
+                            faltantes))
+
+
+def apply_saldos_prestamos(db: Session,
+                           create_request: DispersionIn,
+                           recibos: list[ReciboCalculado]):
+    pagos = [{'b_id_prestamo': concepto.id_prestamo,
+              'b_pago': -concepto.monto}
+             for recibo in recibos
+             for concepto in recibo.conceptos
+             if concepto.id_prestamo]
+    if not pagos:
+        return
+    sync_saldos_prestamos(db, [pago['b_id_prestamo'] for pago in pagos])
+    saldos = PrestamosSaldoDB.__table__
+    db.execute(update(saldos)
+               .where(saldos.c.id_prestamo == bindparam('b_id_prestamo'))
+               .values(saldo=saldos.c.saldo - bindparam('b_pago'),
+                       cuotas_pagadas=saldos.c.cuotas_pagadas + 1,
+                       ultimo_periodo=create_request.periodo,
+                       ultimo_periodo_fecha=create_request.periodo_fecha),
+               pagos)
+
+
+def revert_saldos_prestamos(db: Session, id_disp: int):
+    pagos_db = db\
+        .query(RecibosDetalleDB.id_prestamo,
+               func.sum(RecibosDetalleDB.monto).label('monto'),
+               func.count(RecibosDetalleDB.id_recibos_detalle)
+               .label('cuotas'))\
+        .join(RecibosDB, RecibosDB.id_recibo == RecibosDetalleDB.id_recibo)\
+        .filter(RecibosDB.id_dispersion == id_disp,
+                RecibosDetalleDB.id_prestamo.is_not(None))\
+        .group_by(RecibosDetalleDB.id_prestamo)\
+        .all()
+    if not pagos_db:
+        return
+    saldos = PrestamosSaldoDB.__table__
+    db.execute(update(saldos)
+               .where(saldos.c.id_prestamo == bindparam('b_id_prestamo'))
+               .values(saldo=saldos.c.saldo - bindparam('b_monto'),
+                       cuotas_pagadas=saldos.c.cuotas_pagadas
+                       - bindparam('b_cuotas')),
+               [{'b_id_prestamo': pago.id_prestamo,
+                 'b_monto': pago.monto,
+                 'b_cuotas': pago.cuotas}
+                for pago in pagos_db])
+    # El último periodo aplicado vuelve a ser el de la dispersión previa
+    ultima = select(DispersionesDB.periodo, DispersionesDB.periodo_fecha)\
+        .join(RecibosDB,
+              RecibosDB.id_dispersion == DispersionesDB.id_dispersion)\
+        .join(RecibosDetalleDB,
+              RecibosDetalleDB.id_recibo == RecibosDB.id_recibo)\
+        .where(RecibosDetalleDB.id_prestamo == saldos.c.id_prestamo,
+               DispersionesDB.id_dispersion != id_disp)\
+        .order_by(DispersionesDB.periodo_fecha.desc())\
+        .limit(1)
+    db.execute(update(saldos)
+               .where(saldos.c.id_prestamo.in_(
+                   [pago.id_prestamo for pago in pagos_db]))
+               .values(ultimo_periodo=ultima
+                       .with_only_columns(DispersionesDB.periodo)
+                       .scalar_subquery(),
+                       ultimo_periodo_fecha=ultima
+                       .with_only_columns(DispersionesDB.periodo_fecha)
+                       .scalar_subquery()))
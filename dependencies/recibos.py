@@ -1,7 +1,19 @@
+import zlib
+from datetime import date
+from typing import Optional
+
 from fastapi import HTTPException
+from sqlalchemy import insert, update
 from sqlalchemy.orm import Session
 
-from models.recibos import RecibosDB
+from dependencies.etags import cambio_dispersiones
+from models.bancos import BancosDB
+from models.cuentas import CuentasDB
+from models.dispersiones import DispersionesDB
+from models.empleados import EmpleadosDB
+from models.recibos import RecibosDB, RecibosDetalleDB
+from schemas.cuentas import tipo_dict
+from schemas.nomina import ReciboCalculado
 from schemas.recibos import ReciboOut, ReciboConDetalles
 
 from starlette import status
@@ -10,13 +22,24 @@ from starlette import status
 def get_recibos(db: Session,
                 skip: int = 0,
                 limit: int = 10) -> list[ReciboOut]:
-    recibos_db = db.\
-        query(RecibosDB)\
+    recibos_db = db\
+        .query(RecibosDB.id_recibo,
+               RecibosDB.id_empleado,
+               RecibosDB.id_dispersion,
+               RecibosDB.monto,
+               EmpleadosDB.nombre_completo.label('empleado'),
+               DispersionesDB.periodo,
+               DispersionesDB.periodo_fecha,
+               DispersionesDB.fecha)\
+        .join(DispersionesDB,
+              DispersionesDB.id_dispersion == RecibosDB.id_dispersion)\
+        .join(EmpleadosDB, EmpleadosDB.id_empleado == RecibosDB.id_empleado)\
         .order_by(RecibosDB.id_recibo.desc())\
         .offset(skip)\
         .limit(limit)\
         .all()
-    recibos = [ReciboOut.model_validate(recibo) for recibo in recibos_db]
+    recibos = [ReciboOut.model_validate(dict(recibo._mapping))
+               for recibo in recibos_db]
     return recibos
 
 
@@ -33,9 +56,185 @@ def get_recibo(db: Session, id_recibo: int) -> ReciboConDetalles:
     return recibo
 
 
-def get_recibos_dispersion(db: Session, id_dispersio: int):
-    pass
+def get_snapshot_recibo(db: Session, id_recibo: int) -> Optional[bytes]:
+    # JSON comprimido (zlib) tal como se pagó, o None para los recibos
+    # anteriores a los snapshots
+    recibo_db = db\
+        .query(RecibosDB.snapshot)\
+        .filter(RecibosDB.id_recibo == id_recibo)\
+        .first()
+    if not recibo_db:
+        msg = f'Recibo con id: {id_recibo} no encontrado'
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=msg)
+    return recibo_db.snapshot
+
+
+def get_recibos_dispersion(db: Session,
+                           id_disp: int,
+                           despues: int = 0,
+                           limit: int = 100) -> list[ReciboOut]:
+    # Dos consultas por página sin importar el tamaño de la dispersión: la
+    # dispersión una vez y los recibos por columnas, paginados por
+    # id_recibo sobre el índice (id_dispersion, id_recibo)
+    dispersion = db\
+        .query(DispersionesDB.periodo,
+               DispersionesDB.periodo_fecha,
+               DispersionesDB.fecha)\
+        .filter(DispersionesDB.id_dispersion == id_disp)\
+        .first()
+    if not dispersion:
+        msg = f'Dispersión con id: {id_disp} no encontrada'
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=msg)
+    recibos_db = db\
+        .query(RecibosDB.id_recibo,
+               RecibosDB.id_empleado,
+               RecibosDB.id_dispersion,
+               RecibosDB.monto,
+               EmpleadosDB.nombre_completo.label('empleado'))\
+        .join(EmpleadosDB, EmpleadosDB.id_empleado == RecibosDB.id_empleado)\
+        .filter(RecibosDB.id_dispersion == id_disp,
+                RecibosDB.id_recibo > despues)\
+        .order_by(RecibosDB.id_recibo)\
+        .limit(limit)\
+        .all()
+    recibos = [ReciboOut.model_validate({**recibo._mapping,
+                                         **dispersion._mapping})
+               for recibo in recibos_db]
+    return recibos
+
+
+def get_recibos_empleado(db: Session,
+                         id_empleado: int,
+                         desde: Optional[date] = None,
+                         hasta: Optional[date] = None) -> list[ReciboOut]:
+    # Una sola consulta: los recibos del empleado por el índice
+    # (id_empleado, id_dispersion) y el periodo de cada uno por llave
+    # primaria, sin tocar RecibosDB.dispersion fila por fila
+    query = db\
+        .query(RecibosDB.id_recibo,
+               RecibosDB.id_empleado,
+               RecibosDB.id_dispersion,
+               RecibosDB.monto,
+               EmpleadosDB.nombre_completo.label('empleado'),
+               DispersionesDB.periodo,
+               DispersionesDB.periodo_fecha,
+               DispersionesDB.fecha)\
+        .join(DispersionesDB,
+              DispersionesDB.id_dispersion == RecibosDB.id_dispersion)\
+        .join(EmpleadosDB, EmpleadosDB.id_empleado == RecibosDB.id_empleado)\
+        .filter(RecibosDB.id_empleado == id_empleado)
+    if desde:
+        query = query.filter(DispersionesDB.periodo_fecha >= desde)
+    if hasta:
+        query = query.filter(DispersionesDB.periodo_fecha <= hasta)
+    recibos_db = query\
+        .order_by(DispersionesDB.periodo_fecha, RecibosDB.id_recibo)\
+        .all()
+    if not recibos_db and not db.get(EmpleadosDB, id_empleado):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f'Empleado con id: {id_empleado} '
+                                   'no encontrado')
+    recibos = [ReciboOut.model_validate(dict(recibo._mapping))
+               for recibo in recibos_db]
+    return recibos
 
 
-def get_recibos_empleado(db: Session, id_empleado: int):
-    pass
+def create_recibos_bulk(db: Session,
+                        id_dispersion: int,
+                        recibos: list[ReciboCalculado]) -> list[int]:
+    # INSERT multi-fila por lotes (insertmanyvalues) con RETURNING en el
+    # mismo orden de los parámetros, sin un round trip por objeto
+    if not recibos:
+        return []
+    ids = db.scalars(
+        insert(RecibosDB)
+        .returning(RecibosDB.id_recibo, sort_by_parameter_order=True),
+        [{'id_empleado': recibo.id_empleado,
+          'id_dispersion': id_dispersion,
+          'monto': recibo.monto}
+         for recibo in recibos]
+    ).all()
+    detalles = []
+    for id_recibo, recibo in zip(ids, recibos):
+        detalles.extend({**concepto.model_dump(), 'id_recibo': id_recibo}
+                        for concepto in recibo.conceptos)
+        if recibo.monto > 0:
+            detalles.append({'id_recibo': id_recibo,
+                             'id_cuenta': recibo.id_cuenta,
+                             'texto': 'Depósito',
+                             'monto': recibo.monto})
+    ids_detalle = db.scalars(
+        insert(RecibosDetalleDB)
+        .returning(RecibosDetalleDB.id_recibos_detalle,
+                   sort_by_parameter_order=True),
+        detalles
+    ).all()
+    for id_detalle, detalle in zip(ids_detalle, detalles):
+        detalle['id_recibos_detalle'] = id_detalle
+    save_snapshots(db, id_dispersion, ids, recibos, detalles)
+    return ids
+
+
+def save_snapshots(db: Session,
+                   id_dispersion: int,
+                   ids: list[int],
+                   recibos: list[ReciboCalculado],
+                   detalles: list[dict]):
+    # Dos consultas para toda la dispersión (nombres y cuentas) y un
+    # UPDATE por llave primaria en lote
+    dispersion = db\
+        .query(DispersionesDB.periodo,
+               DispersionesDB.periodo_fecha,
+               DispersionesDB.fecha)\
+        .filter(DispersionesDB.id_dispersion == id_dispersion)\
+        .one()
+    empleados = dict(db
+                     .query(EmpleadosDB.id_empleado,
+                            EmpleadosDB.nombre_completo)
+                     .filter(EmpleadosDB.id_empleado
+                             .in_({recibo.id_empleado
+                                   for recibo in recibos}))
+                     .all())
+    cuentas = {
+        cuenta.id_cuenta: cuenta
+        for cuenta in db
+        .query(CuentasDB.id_cuenta,
+               CuentasDB.numero,
+               CuentasDB.tipo,
+               BancosDB.nombre.label('banco'))
+        .join(BancosDB, BancosDB.id_banco == CuentasDB.id_banco)
+        .filter(CuentasDB.id_cuenta.in_({recibo.id_cuenta
+                                         for recibo in recibos}))
+        .all()
+    }
+    por_recibo = {}
+    for detalle in detalles:
+        cuenta = cuentas.get(detalle.get('id_cuenta'))
+        por_recibo.setdefault(detalle['id_recibo'], []).append({
+            **detalle,
+            'id_externo': detalle.get('id_salario')
+            or detalle.get('id_ajuste') or detalle.get('id_prestamo')
+            or detalle.get('id_cuenta'),
+            'banco': cuenta.banco if cuenta else None,
+            'cuenta': cuenta.numero if cuenta else None,
+            'tipo': tipo_dict.get(cuenta.tipo) if cuenta else None
+        })
+    snapshots = []
+    for id_recibo, recibo in zip(ids, recibos):
+        recibo_out = ReciboConDetalles.model_validate({
+            **dispersion._mapping,
+            'id_recibo': id_recibo,
+            'id_empleado': recibo.id_empleado,
+            'id_dispersion': id_dispersion,
+            'monto': recibo.monto,
+            'empleado': empleados[recibo.id_empleado],
+            'detalles': por_recibo.get(id_recibo, [])
+        })
+        snapshots.append({
+            'id_recibo': id_recibo,
+            'snapshot': zlib.compress(recibo_out.model_dump_json().encode())
+        })
+    db.execute(update(RecibosDB), snapshots)
+    cambio_dispersiones(db)
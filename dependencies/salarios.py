@@ -1,9 +1,16 @@
+from datetime import date
+from typing import Optional
+
 from fastapi import HTTPException
-from sqlalchemy.orm import Session, lazyload
-# from sqlalchemy.sql import func
+from sqlalchemy import func
+from sqlalchemy.orm import Session, aliased, lazyload
 from starlette import status
 
+from dependencies.versiones import cambio_nomina
+from models.empleados import EmpleadosDB
 from models.salarios import SalariosDB
+from models.users import UserDB
+from schemas.nomina import SalarioVigente
 from schemas.salarios import SalarioIn, SalarioOut
 from schemas.users import User
 
@@ -29,33 +36,75 @@ salarios_resp_edit = {
 def get_salarios(db: Session,
                  skip: int = 0,
                  limit: int = 10) -> list[SalarioOut]:
-    salario_db = db.\
-        query(SalariosDB)\
+    # Sólo las columnas de la respuesta: usuario y nombre del empleado
+    # salen de la base, sin cargar UserDB, EmpleadosDB ni ColoniaDB
+    salario_db = db\
+        .query(SalariosDB.id_salario,
+               SalariosDB.fecha,
+               SalariosDB.fecha_valido,
+               SalariosDB.monto,
+               SalariosDB.id_empleado,
+               SalariosDB.id_usuario,
+               UserDB.username.label('usuario'),
+               EmpleadosDB.nombre_completo.label('empleado'))\
+        .join(UserDB, UserDB.id_user == SalariosDB.id_usuario)\
+        .join(EmpleadosDB, EmpleadosDB.id_empleado == SalariosDB.id_empleado)\
+        .order_by(SalariosDB.id_salario)\
         .offset(skip)\
         .limit(limit).all()
-    salarios = [SalarioOut.model_validate(salario)
+    salarios = [SalarioOut.model_validate(dict(salario._mapping))
                 for salario in salario_db]
     return salarios
 
 
+def get_salarios_vigentes(db: Session,
+                          fecha: date,
+                          ids_empleado: Optional[list[int]] = None,
+                          solo_activos: bool = False
+                          ) -> dict[int, SalarioVigente]:
+    # Recorre empleados y resuelve cada uno con el índice
+    # (id_empleado, fecha_valido): una búsqueda por empleado sin importar
+    # cuántos años de historial tenga
+    anterior = aliased(SalariosDB)
+    vigencia = db\
+        .query(func.max(anterior.fecha_valido))\
+        .filter(anterior.id_empleado == EmpleadosDB.id_empleado,
+                anterior.fecha_valido <= fecha)\
+        .correlate(EmpleadosDB)\
+        .scalar_subquery()
+    query = db\
+        .query(SalariosDB.id_salario,
+               SalariosDB.id_empleado,
+               SalariosDB.fecha_valido,
+               SalariosDB.monto)\
+        .select_from(EmpleadosDB)\
+        .join(SalariosDB,
+              (SalariosDB.id_empleado == EmpleadosDB.id_empleado)
+              & (SalariosDB.fecha_valido == vigencia))
+    if ids_empleado is not None:
+        query = query.filter(EmpleadosDB.id_empleado.in_(ids_empleado))
+    if solo_activos:
+        query = query.filter(EmpleadosDB.activo)
+    salarios_db = query.order_by(EmpleadosDB.id_empleado).all()
+    return {salario.id_empleado: SalarioVigente.model_validate(salario)
+            for salario in salarios_db}
+
+
 def create_salario(db: Session,
                    input_data: SalarioIn,
                    current_user: User) -> SalariosDB:
     salario_create = SalariosDB(**input_data.model_dump(exclude_unset=True),
                                 id_usuario=current_user.id_user)
-    salarios_db = db\
-        .query(SalariosDB)\
+    ultima_fecha = db\
+        .query(func.max(SalariosDB.fecha_valido))\
         .filter(SalariosDB.id_empleado == input_data.id_empleado)\
-        .order_by(SalariosDB.fecha_valido.desc())\
-        .options(lazyload(SalariosDB.usuario))\
-        .options(lazyload(SalariosDB.empleado))\
-        .all()
-    for salario in salarios_db:
-        msg = f'La fecha de inicio debe ser mayor a {salario.fecha_valido}'
-        if input_data.fecha_valido <= salario.fecha_valido:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
-                                detail=msg)
+        .scalar()
+    if ultima_fecha and input_data.fecha_valido <= ultima_fecha:
+        msg = f'La fecha de inicio debe ser mayor a {ultima_fecha}'
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=msg)
     db.add(salario_create)
+    cambio_nomina(db)
     db.commit()
     db.refresh(salario_create)
     return salario_create
@@ -98,6 +147,7 @@ def edit_salario(id_sal: int,
     for key, value in edited_data.items():
         setattr(salario_db, key, value)
     db.add(salario_db)
+    cambio_nomina(db)
     db.commit()
     db.refresh(salario_db)
     return salario_db
@@ -121,4 +171,5 @@ def delete_salario(db: Session, id_sal: int):
     #                       detail=f'Salario con id: {id_sal} ya aplicado, '
     #                              'no se puede eliminar')
     db.delete(salario_db)
+    cambio_nomina(db)
     db.commit()
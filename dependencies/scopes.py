@@ -0,0 +1,53 @@
+from functools import lru_cache
+
+from fastapi.dependencies.models import Dependant
+from fastapi.routing import iter_route_contexts
+
+from schemas.scopes import BITS
+
+ADMIN = BITS['Admin']
+
+
+@lru_cache(maxsize=None)
+def required_mask(scopes: tuple[str, ...]) -> int:
+    # Se calcula una vez por cada combinación de scopes de las rutas; un
+    # scope fuera del registro en una ruta es un error de programación
+    mask = 0
+    for scope in scopes:
+        if scope not in BITS:
+            raise ValueError(f'Scope no registrado: {scope}')
+        mask |= BITS[scope]
+    return mask
+
+
+def autorizado(mask: int, requerido: int) -> bool:
+    # Admin puede todo; basta con uno de los scopes requeridos
+    return not requerido or bool(mask & (ADMIN | requerido))
+
+
+def scopes_dependencia(dependant: Dependant,
+                       heredados: tuple[str, ...] = ()):
+    # Mismo orden que los SecurityScopes que recibe la dependencia: los
+    # del padre primero y luego los propios que falten
+    scopes = list(dependant.parent_oauth_scopes or heredados)
+    for scope in dependant.own_oauth_scopes or []:
+        if scope not in scopes:
+            scopes.append(scope)
+    if dependant.security_scopes_param_name:
+        yield tuple(scopes)
+    for sub in dependant.dependencies:
+        yield from scopes_dependencia(sub, tuple(scopes))
+
+
+def compile_scopes(routes) -> None:
+    # Se recorre al arrancar: deja calculadas las máscaras de todas las
+    # rutas y un scope no registrado impide levantar la app
+    for route in iter_route_contexts(routes):
+        dependant = getattr(route, 'dependant', None)
+        if dependant is None:
+            continue
+        for scopes in scopes_dependencia(dependant):
+            try:
+                required_mask(scopes)
+            except ValueError as e:
+                raise RuntimeError(f'{route.path}: {e}') from e
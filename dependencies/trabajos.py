@@ -0,0 +1,284 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+from decouple import config
+from fastapi import HTTPException
+from pydantic import BaseModel
+from sqlalchemy import and_, event, or_, update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session
+from starlette import status
+
+from models.trabajos import TrabajosDB
+from schemas.trabajos import TrabajoOut
+from schemas.users import User
+
+TRABAJOS_WORKERS = config('TRABAJOS_WORKERS', default=2, cast=int)
+# Un trabajo en_proceso es de su propietario mientras renueve el latido;
+# otro proceso sólo lo reclama cuando pasan TRABAJOS_LEASE segundos sin
+# latido. Un hilo lo renueva cada TRABAJOS_LATIDO segundos mientras corre
+# la tarea, aunque ésta no reporte avance
+TRABAJOS_LEASE = config('TRABAJOS_LEASE', default=300, cast=int)
+TRABAJOS_LATIDO = config('TRABAJOS_LATIDO', default=10, cast=int)
+ACTIVOS = ('pendiente', 'en_proceso')
+ARRANQUE = uuid.uuid4().hex[:8]
+
+trabajos_resp = {
+    status.HTTP_404_NOT_FOUND: {
+        'content': {
+            'application/json': {
+                'schema': {
+                    'type': 'object',
+                    'properties': {
+                        'detail': {
+                            'type': "string"
+                        }
+                    }
+                },
+                'example': {'detail': "Trabajo con id: 1 no encontrado"}
+            }
+        }
+    }
+}
+
+# tipo -> función(db, trabajo, avance) que regresa el resultado en JSON
+TAREAS: dict[str, Callable] = {}
+executor = ThreadPoolExecutor(max_workers=TRABAJOS_WORKERS,
+                              thread_name_prefix='trabajos')
+futuros: dict[int, Future] = {}
+reanudacion = threading.Event()
+
+
+def get_executor():  # pragma: no cover
+    return executor
+
+
+def propietario() -> str:
+    # Por llamada: un fork después de importar cambia el pid
+    return f'{socket.gethostname()}:{os.getpid()}:{ARRANQUE}'
+
+
+def lease_vencido(ahora: datetime):
+    vencido = ahora - timedelta(seconds=TRABAJOS_LEASE)
+    return and_(TrabajosDB.estado == 'en_proceso',
+                or_(TrabajosDB.latido.is_(None),
+                    TrabajosDB.latido < vencido))
+
+
+def reclamable(ahora: datetime):
+    return or_(TrabajosDB.estado == 'pendiente', lease_vencido(ahora))
+
+
+def del_propietario(id_trabajo: int):
+    return and_(TrabajosDB.id_trabajo == id_trabajo,
+                TrabajosDB.propietario == propietario())
+
+
+class TrabajoReclamado(Exception):
+    pass
+
+
+class Avance:
+    # Escribe fase, conteo y latido en la fila del trabajo con una sesión
+    # propia, así cualquier worker lo lee de la tabla. Las tareas sólo
+    # reportan avance antes de empezar a escribir en su transacción
+    def __init__(self, bind, id_trabajo: int):
+        self.bind = bind
+        self.id_trabajo = id_trabajo
+        self.actual = {}
+        self.escrito = time.monotonic()
+        self.detenido = threading.Event()
+
+    def __call__(self, fase: str, procesados: int = 0,
+                 total: Optional[int] = None):
+        nuevo = {'fase': fase, 'procesados': procesados, 'total': total}
+        if nuevo == self.actual:
+            return
+        cambio_fase = fase != self.actual.get('fase')
+        self.actual = nuevo
+        if cambio_fase or \
+                time.monotonic() - self.escrito >= TRABAJOS_LATIDO:
+            self.escribir()
+
+    def escribir(self):
+        try:
+            with Session(bind=self.bind) as db:
+                db.execute(update(TrabajosDB)
+                           .where(del_propietario(self.id_trabajo))
+                           .values(**self.actual, latido=datetime.utcnow()))
+                db.commit()
+        except SQLAlchemyError:  # pragma: no cover
+            # El avance es informativo; no debe tumbar el trabajo
+            pass
+        self.escrito = time.monotonic()
+
+    def latir(self):
+        # Hilo de latido: con SQLite espera al candado de escritura de la
+        # tarea y puede fallar; la confirmación antes del commit lo cubre
+        while not self.detenido.wait(TRABAJOS_LATIDO):
+            self.escribir()
+
+
+def sin_avance(fase: str, procesados: int = 0, total: Optional[int] = None):
+    pass
+
+
+def register_tarea(tipo: str, tarea: Callable):
+    TAREAS[tipo] = tarea
+
+
+def get_trabajo(db: Session, id_trabajo: int, tipo: str) -> TrabajoOut:
+    trabajo_db = db\
+        .query(TrabajosDB)\
+        .filter(TrabajosDB.id_trabajo == id_trabajo,
+                TrabajosDB.tipo == tipo)\
+        .first()
+    if not trabajo_db:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f'Trabajo con id: {id_trabajo} '
+                                   'no encontrado')
+    return TrabajoOut.model_validate(trabajo_db)
+
+
+def create_trabajo(db: Session,
+                   tipo: str,
+                   clave: str,
+                   parametros: BaseModel,
+                   current_user: User,
+                   detail_activo: str,
+                   executor: Executor) -> TrabajosDB:
+    activo = db\
+        .query(TrabajosDB.id_trabajo,
+               lease_vencido(datetime.utcnow()).label('vencido'))\
+        .filter(TrabajosDB.clave == clave,
+                TrabajosDB.estado.in_(ACTIVOS))\
+        .first()
+    if activo and activo.vencido:
+        # Su propietario murió: se vuelve a correr en este proceso y se
+        # responde como a un trabajo nuevo
+        if activo.id_trabajo not in futuros:
+            submit_trabajo(db, activo.id_trabajo, executor)
+        return db.get(TrabajosDB, activo.id_trabajo)
+    if activo:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=detail_activo)
+    trabajo_create = TrabajosDB(tipo=tipo,
+                                clave=clave,
+                                parametros=parametros.model_dump_json(),
+                                estado='pendiente',
+                                fase='en cola',
+                                id_usuario=current_user.id_user)
+    db.add(trabajo_create)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Otra petición registró el mismo trabajo entre la consulta y el
+        # insert; el índice único parcial lo impide
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=detail_activo)
+    db.refresh(trabajo_create)
+    submit_trabajo(db, trabajo_create.id_trabajo, executor)
+    return trabajo_create
+
+
+def submit_trabajo(db: Session,
+                   id_trabajo: int,
+                   executor: Executor) -> Future:
+    # El trabajo abre su propia sesión sobre la misma conexión/engine
+    futuro = executor.submit(run_trabajo, db.get_bind(), id_trabajo)
+    futuros[id_trabajo] = futuro
+    futuro.add_done_callback(lambda _: futuros.pop(id_trabajo, None))
+    return futuro
+
+
+def wait_trabajo(id_trabajo: int, timeout: Optional[float] = None):
+    futuro = futuros.get(id_trabajo)
+    if futuro:
+        futuro.result(timeout)
+
+
+def run_trabajo(bind, id_trabajo: int):
+    db = Session(bind=bind, autoflush=False)
+    try:
+        # Sólo un worker toma el trabajo: pendiente o con el lease vencido
+        ahora = datetime.utcnow()
+        tomado = db.execute(update(TrabajosDB)
+                            .where(TrabajosDB.id_trabajo == id_trabajo,
+                                   reclamable(ahora))
+                            .values(estado='en_proceso', fase='iniciando',
+                                    propietario=propietario(),
+                                    latido=ahora))
+        db.commit()
+        if not tomado.rowcount:
+            return
+
+        def confirmar_propietario(session: Session):
+            # Dentro de la transacción de la tarea: si otro proceso reclamó
+            # el trabajo no se guarda nada, y el candado de la fila impide
+            # que lo reclame mientras se hace el commit
+            renovado = session.execute(update(TrabajosDB)
+                                       .where(del_propietario(id_trabajo))
+                                       .values(latido=datetime.utcnow()))
+            if not renovado.rowcount:
+                raise TrabajoReclamado(f'Trabajo {id_trabajo} reclamado '
+                                       'por otro proceso')
+
+        avance = Avance(bind, id_trabajo)
+        latido = threading.Thread(target=avance.latir, daemon=True,
+                                  name=f'latido-{id_trabajo}')
+        trabajo = db.get(TrabajosDB, id_trabajo)
+        event.listen(db, 'before_commit', confirmar_propietario)
+        latido.start()
+        try:
+            resultado = TAREAS[trabajo.tipo](db, trabajo, avance)
+        except Exception as e:
+            db.rollback()
+            final = {'estado': 'error',
+                     'error': e.detail if isinstance(e, HTTPException)
+                     else f'{type(e).__name__}: {e}'}
+        else:
+            final = {'estado': 'terminado', 'resultado': resultado}
+        finally:
+            avance.detenido.set()
+            latido.join()
+            event.remove(db, 'before_commit', confirmar_propietario)
+        final.update(avance.actual)
+        if final['estado'] == 'terminado':
+            final['fase'] = 'terminado'
+        # Si otro proceso lo reclamó, el estado final es el de esa corrida
+        db.execute(update(TrabajosDB)
+                   .where(del_propietario(id_trabajo))
+                   .values(**final, latido=datetime.utcnow()))
+        db.commit()
+    finally:
+        db.close()
+
+
+def resume_trabajos(db: Session, executor: Executor) -> list[int]:
+    # Pendientes y en_proceso cuyo propietario dejó de renovar el lease;
+    # el trabajo es transaccional, se vuelve a correr desde el inicio y
+    # run_trabajo decide quién lo toma
+    pendientes = [trabajo.id_trabajo for trabajo in db
+                  .query(TrabajosDB.id_trabajo)
+                  .filter(reclamable(datetime.utcnow()))
+                  .order_by(TrabajosDB.id_trabajo)
+                  .all()
+                  if trabajo.id_trabajo not in futuros]
+    for id_trabajo in pendientes:
+        submit_trabajo(db, id_trabajo, executor)
+    return pendientes
+
+
+def start_trabajos(db: Session, executor: Executor):
+    # Una vez por proceso, al arrancar la aplicación
+    if reanudacion.is_set():
+        return
+    reanudacion.set()
+    resume_trabajos(db, executor)
@@ -1,24 +1,67 @@
+import asyncio
+import hashlib
+import hmac
+import secrets
+import threading
+import time
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Annotated
+from typing import Annotated, Callable, Optional
 
 from decouple import config
 from fastapi import Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer, SecurityScopes
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from pydantic import ValidationError
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
 from starlette import status
 
+from dependencies.cache import CacheTTL
 from dependencies.database import get_db
-from models.users import UserDB
+from dependencies.etags import cambio_dispersiones
+from dependencies.scopes import autorizado, required_mask
+from models.users import RefreshTokensDB, RevocacionesDB, UserDB
+from schemas.scopes import scopes_mask
 from schemas.users import Token, TokenData, User, UserIn
 
 SECRET_KEY = config('SECRET_KEY')
 ALGORITHM = 'HS256'
+USERS_CACHE_TTL = config('USERS_CACHE_TTL', default=60, cast=int)
+USERS_CACHE_SIZE = config('USERS_CACHE_SIZE', default=1024, cast=int)
+ACCESS_TOKEN_MINUTES = 20
+# Renovar con el refresh token cuesta un HMAC en lugar de un bcrypt; cada
+# uso lo rota y reusar uno ya rotado revoca toda la familia (el login)
+REFRESH_TOKEN_HOURS = config('REFRESH_TOKEN_HOURS', default=12, cast=int)
+# Autoriza con los claims del token, sin leer users. Las revocaciones se
+# releen a lo más cada REVOCACIONES_REFRESH segundos: es lo que tarda un
+# cambio hecho en otro worker en desalojar el usuario del cache local
+AUTH_STATELESS = config('AUTH_STATELESS', default=False, cast=bool)
+REVOCACIONES_REFRESH = config('REVOCACIONES_REFRESH', default=5, cast=int)
+# Revocaciones que todavía afectan a un token vigente o a un usuario en
+# cache
+VENTANA_REVOCACIONES = timedelta(seconds=max(ACCESS_TOKEN_MINUTES * 60,
+                                             USERS_CACHE_TTL))
+# Hashes bcrypt simultáneos, en un pool propio: el login es async y espera
+# el hash sin ocupar hilos del threadpool de FastAPI ni una conexión
+BCRYPT_WORKERS = config('BCRYPT_WORKERS', default=2, cast=int)
 
 bcrypt_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
+bcrypt_executor = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS,
+                                     thread_name_prefix='bcrypt')
 oauth2_bearer = OAuth2PasswordBearer(tokenUrl='users/token')
+# (username, jti) -> (User ya validado, fecha UTC de lectura); evita leer
+# users en cada request
+usuarios_cache = CacheTTL(USERS_CACHE_SIZE, USERS_CACHE_TTL)
+# jti revocados y, por usuario, la última fecha (UTC) de cambio
+revocaciones = {'jtis': set(), 'usuarios': {}, 'locales': [],
+                'cargadas': None}
+Revocacion = namedtuple('Revocacion', ['jti', 'id_user', 'fecha'])
+revocaciones_lock = threading.Lock()
 
 
 user_responses = {
@@ -88,7 +131,7 @@ user_resp_edit = {
 }
 
 
-async def get_current_user(
+def get_current_user(
         security_scopes: SecurityScopes,
         token: Annotated[str, Depends(oauth2_bearer)],
         db: Annotated[Session, Depends(get_db)]) -> User:
@@ -109,25 +152,42 @@ async def get_current_user(
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         token_data = TokenData.model_validate(payload)
-        user_db = get_user_by_username(token_data.username, db)
-        if user_db is None:
+        if token_revocado(db, token_data):
             raise credentials_exception
-        user = User.model_validate(user_db)
-        found = False
-        if 'Admin' not in user.scopes and len(security_scopes.scopes) != 0:
-            for scope in security_scopes.scopes:
-                if scope in user.scopes:
-                    found = True
-                    break
-            if not found:
-                raise scope_exception
+        llave = (token_data.username, token_data.jti)
+        user = None
+        cacheado = usuarios_cache.get(llave)
+        if cacheado is not None and not usuario_cambiado(*cacheado):
+            user = cacheado[0]
+        if user is None and AUTH_STATELESS and token_data.iat is not None:
+            user = user_from_token(token_data)
+        if user is None:
+            leido = datetime.utcnow()
+            user_db = get_user_by_username(token_data.username, db)
+            if user_db is None:
+                raise credentials_exception
+            user = User.model_validate(user_db)
+            usuarios_cache.set(llave, (user, leido))
+        requerido = required_mask(tuple(security_scopes.scopes))
+        if not autorizado(user.permisos, requerido):
+            raise scope_exception
         return user
     except (ValidationError, JWTError):
         raise credentials_exception
 
 
 def get_users(db: Session, skip: int = 0, limit: int = 10) -> list[User]:
-    users_db = db.query(UserDB).offset(skip).limit(limit).all()
+    # Sin password_h
+    users_db = db\
+        .query(UserDB.id_user,
+               UserDB.username,
+               UserDB.nombre,
+               UserDB.scopes,
+               UserDB.activo)\
+        .order_by(UserDB.id_user)\
+        .offset(skip)\
+        .limit(limit)\
+        .all()
     users = []
     for user in users_db:
         users.append(User.model_validate(user))
@@ -143,12 +203,134 @@ def get_current_active_user(
     return current_user
 
 
+def refresh_revocaciones(db: Session, forzar: bool = False):
+    # Sólo las revocaciones que pueden afectar a un token vigente. La
+    # consulta corre fuera del candado; sólo el cambio de copia lo toma
+    cargadas = revocaciones['cargadas']
+    if not forzar and cargadas is not None and \
+            time.monotonic() - cargadas < REVOCACIONES_REFRESH:
+        return
+    inicio = datetime.utcnow()
+    filas = db\
+        .query(RevocacionesDB.jti,
+               RevocacionesDB.id_user,
+               RevocacionesDB.fecha)\
+        .filter(RevocacionesDB.fecha >= inicio - VENTANA_REVOCACIONES)\
+        .all()
+    with revocaciones_lock:
+        # Las hechas en este proceso durante la consulta no se pierden
+        locales = [local for local in revocaciones['locales']
+                   if local.fecha >= inicio]
+        jtis = set()
+        usuarios = {}
+        for fila in filas + locales:
+            if fila.jti:
+                jtis.add(fila.jti)
+            if fila.id_user is not None:
+                usuarios[fila.id_user] = max(fila.fecha,
+                                             usuarios.get(fila.id_user,
+                                                          fila.fecha))
+        revocaciones['jtis'] = jtis
+        revocaciones['usuarios'] = usuarios
+        revocaciones['locales'] = locales
+        revocaciones['cargadas'] = time.monotonic()
+
+
+async def refresh_revocaciones_periodico(abrir_db: Callable):
+    # Desde el lifespan: los requests sólo leen la copia en memoria
+    while True:
+        await asyncio.sleep(REVOCACIONES_REFRESH)
+        await run_in_threadpool(recargar_revocaciones, abrir_db)
+
+
+def recargar_revocaciones(abrir_db: Callable):
+    db_gen = abrir_db()
+    try:
+        refresh_revocaciones(next(db_gen), forzar=True)
+    except SQLAlchemyError:  # pragma: no cover
+        # Se reintenta en la siguiente vuelta con la copia anterior
+        pass
+    finally:
+        db_gen.close()
+
+
+def token_revocado(db: Session, token_data: TokenData) -> bool:
+    # Sin lifespan (p. ej. scripts) se cargan una vez al primer uso
+    if revocaciones['cargadas'] is None:
+        refresh_revocaciones(db, forzar=True)
+    if token_data.jti in revocaciones['jtis']:
+        return True
+    # Los cambios al usuario sólo invalidan tokens en modo sin estado; en
+    # el modo normal el usuario se vuelve a leer de la base (ver
+    # usuario_cambiado). iat trae fracciones de segundo: un token emitido
+    # justo después del cambio sigue valiendo
+    cambio = revocaciones['usuarios'].get(token_data.id)
+    return AUTH_STATELESS and cambio is not None and \
+        token_data.iat is not None and \
+        cambio >= datetime.utcfromtimestamp(token_data.iat)
+
+
+def usuario_cambiado(user: User, leido: datetime) -> bool:
+    # edit_user en cualquier worker deja una revocación por id_user;
+    # el usuario en cache es viejo si se leyó antes de ella
+    cambio = revocaciones['usuarios'].get(user.id_user)
+    return cambio is not None and cambio >= leido
+
+
+def revoke_token(db: Session,
+                 jti: Optional[str] = None,
+                 id_user: Optional[int] = None):
+    fecha = datetime.utcnow()
+    db.add(RevocacionesDB(jti=jti, id_user=id_user, fecha=fecha))
+    # Las anteriores al último token vigente ya no sirven
+    db.query(RevocacionesDB)\
+        .filter(RevocacionesDB.fecha < fecha - VENTANA_REVOCACIONES)\
+        .delete(synchronize_session=False)
+    db.commit()
+    # Efecto inmediato en este proceso; los demás lo ven al refrescar
+    with revocaciones_lock:
+        revocaciones['locales'].append(
+            Revocacion(jti=jti, id_user=id_user, fecha=fecha))
+        if jti:
+            revocaciones['jtis'].add(jti)
+        if id_user is not None:
+            revocaciones['usuarios'][id_user] = fecha
+
+
+def revoke_access_token(db: Session, token: str):
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    token_data = TokenData.model_validate(payload)
+    if token_data.jti:
+        revoke_token(db, jti=token_data.jti)
+    usuarios_cache.invalidate(lambda llave: llave == (token_data.username,
+                                                      token_data.jti))
+
+
+def user_from_token(token_data: TokenData) -> User:
+    return User(id_user=token_data.id,
+                username=token_data.username,
+                nombre=token_data.nombre,
+                scopes=token_data.scopes or 0,
+                activo=token_data.activo)
+
+
+def invalidate_usuario(username: str):
+    usuarios_cache.invalidate(lambda llave: llave[0] == username)
+
+
 def verify_password(plain_password, hashed_password):
-    return bcrypt_context.verify(plain_password, hashed_password)
+    return bcrypt_executor.submit(bcrypt_context.verify, plain_password,
+                                  hashed_password).result()
+
+
+async def verify_password_async(plain_password, hashed_password):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(bcrypt_executor, bcrypt_context.verify,
+                                      plain_password, hashed_password)
 
 
 def get_password_hash(password):
-    return bcrypt_context.hash(password)
+    return bcrypt_executor.submit(bcrypt_context.hash, password).result()
 
 
 def get_user_by_username(username: str, db: Session) -> UserDB:
@@ -157,11 +339,36 @@ def get_user_by_username(username: str, db: Session) -> UserDB:
         return user
 
 
-def authenticate_user(username: str, password: str, db: Session) -> UserDB:
-    user = get_user_by_username(username, db)
-    if not user:
+def get_credenciales(username: str,
+                     db: Session) -> Optional[tuple[User, str]]:
+    # Termina la transacción antes de hashear: la conexión vuelve al pool
+    # mientras corre bcrypt
+    user_db = get_user_by_username(username, db)
+    credenciales = None
+    if user_db:
+        credenciales = (User.model_validate(user_db), user_db.password_h)
+    db.rollback()
+    return credenciales
+
+
+def authenticate_user(username: str, password: str, db: Session) -> User:
+    credenciales = get_credenciales(username, db)
+    if not credenciales:
         return False
-    if not verify_password(password, user.password_h):
+    user, password_h = credenciales
+    if not verify_password(password, password_h):
+        return False
+    return user
+
+
+async def authenticate_user_async(username: str,
+                                  password: str,
+                                  db: Session) -> User:
+    credenciales = await run_in_threadpool(get_credenciales, username, db)
+    if not credenciales:
+        return False
+    user, password_h = credenciales
+    if not await verify_password_async(password, password_h):
         return False
     return user
 
@@ -169,24 +376,121 @@ def authenticate_user(username: str, password: str, db: Session) -> UserDB:
 def encode_token(data: dict, exp: timedelta):
     encode = data.copy()
     expires = datetime.utcnow() + exp
-    encode.update({'exp': expires})
+    # iat con fracciones de segundo (NumericDate lo permite) para compararlo
+    # con la fecha de las revocaciones
+    encode.update({'exp': expires, 'iat': time.time()})
     jwt_encode = jwt.encode(encode, SECRET_KEY, algorithm=ALGORITHM)
     return jwt_encode
 
 
+def access_token_usuario(user: User) -> str:
+    return encode_token(
+        {
+            "username": user.username,
+            "id": user.id_user,
+            "nombre": user.nombre,
+            "scopes": user.permisos,
+            "activo": user.activo,
+            "jti": uuid.uuid4().hex
+        }, timedelta(minutes=ACCESS_TOKEN_MINUTES))
+
+
+def hash_refresh_token(refresh_token: str) -> str:
+    return hmac.new(SECRET_KEY.encode(), refresh_token.encode(),
+                    hashlib.sha256).hexdigest()
+
+
+def issue_refresh_token(db: Session,
+                        id_user: int,
+                        familia: Optional[str] = None) -> str:
+    # Sólo se guarda el HMAC; el token en claro no vuelve a existir
+    refresh_token = secrets.token_urlsafe(32)
+    db.add(RefreshTokensDB(
+        hash=hash_refresh_token(refresh_token),
+        familia=familia or uuid.uuid4().hex,
+        id_user=id_user,
+        expira=datetime.utcnow() + timedelta(hours=REFRESH_TOKEN_HOURS)))
+    return refresh_token
+
+
+def token_usuario(db: Session, user: User) -> Token:
+    refresh_token = issue_refresh_token(db, user.id_user)
+    db.commit()
+    return Token(access_token=access_token_usuario(user),
+                 token_type="bearer",
+                 refresh_token=refresh_token)
+
+
 def create_access_token(form_data: dict, db: Session) -> Token:
     user = authenticate_user(form_data.username, form_data.password, db)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                             detail='Usuario y/o Password no validos')
-    token = encode_token(
-        {
-            "username": user.username,
-            "id": user.id_user,
-            "nombre": user.nombre,
-            "scopes": user.scopes
-        }, timedelta(minutes=20))
-    return Token(access_token=token, token_type="bearer")
+    return token_usuario(db, user)
+
+
+async def login_access_token(form_data: dict, db: Session) -> Token:
+    user = await authenticate_user_async(form_data.username,
+                                         form_data.password, db)
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+                            detail='Usuario y/o Password no validos')
+    return await run_in_threadpool(token_usuario, db, user)
+
+
+def refresh_access_token(db: Session, refresh_token: str) -> Token:
+    refresh_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail='Refresh token no valido')
+    registro = db.query(RefreshTokensDB)\
+        .filter(RefreshTokensDB.hash == hash_refresh_token(refresh_token))\
+        .first()
+    if not registro or registro.revocado or \
+            registro.expira <= datetime.utcnow():
+        raise refresh_exception
+    # Marcar como usado sólo si nadie lo usó antes; un segundo uso indica
+    # que el token se filtró y se revoca toda la familia
+    usado = db.query(RefreshTokensDB)\
+        .filter(RefreshTokensDB.id_refresh == registro.id_refresh,
+                RefreshTokensDB.usado.is_(False))\
+        .update({'usado': True}, synchronize_session=False)
+    if not usado:
+        revoke_refresh_tokens(db, familia=registro.familia)
+        raise refresh_exception
+    user = db.query(UserDB).filter(UserDB.id_user == registro.id_user).first()
+    if not user or not user.activo:
+        db.rollback()
+        raise refresh_exception
+    nuevo = issue_refresh_token(db, user.id_user, registro.familia)
+    db.commit()
+    user = User.model_validate(user)
+    return Token(access_token=access_token_usuario(user),
+                 token_type="bearer",
+                 refresh_token=nuevo)
+
+
+def revoke_refresh_tokens(db: Session,
+                          familia: Optional[str] = None,
+                          id_user: Optional[int] = None):
+    query = db.query(RefreshTokensDB)
+    if familia is not None:
+        query = query.filter(RefreshTokensDB.familia == familia)
+    if id_user is not None:
+        query = query.filter(RefreshTokensDB.id_user == id_user)
+    query.update({'revocado': True}, synchronize_session=False)
+    # Los vencidos ya no se pueden usar ni reusar
+    db.query(RefreshTokensDB)\
+        .filter(RefreshTokensDB.expira < datetime.utcnow())\
+        .delete(synchronize_session=False)
+    db.commit()
+
+
+def revoke_refresh_token(db: Session, refresh_token: str):
+    registro = db.query(RefreshTokensDB.familia)\
+        .filter(RefreshTokensDB.hash == hash_refresh_token(refresh_token))\
+        .first()
+    if registro:
+        revoke_refresh_tokens(db, familia=registro.familia)
 
 
 def create_user(user_data: UserIn, db: Session) -> UserDB:
@@ -198,10 +502,11 @@ def create_user(user_data: UserIn, db: Session) -> UserDB:
     user_data_extra.update(
         {'password_h': get_password_hash(user_data.password)})
     del user_data_extra['password']
-    user_data_extra.update({'scopes': ','.join(user_data.scopes)})
+    user_data_extra.update({'scopes': scopes_mask(user_data.scopes)})
     user_create = UserDB(**user_data_extra)
     db.add(user_create)
     db.commit()
+    invalidate_usuario(user_create.username)
     db.refresh(user_create)
     return user_create
 
@@ -217,10 +522,17 @@ def edit_user(id_user: int, user_data: UserIn, db: Session) -> UserDB:
              {'password_h': get_password_hash(user_data.password)}
         )
         del updated_data['password']
-    updated_data.update({'scopes': ','.join(user_data.scopes)})
+    updated_data.update({'scopes': scopes_mask(user_data.scopes)})
+    username = db_user.username
     for key, value in updated_data.items():
         setattr(db_user, key, value)
     db.add(db_user)
+    cambio_dispersiones(db)
     db.commit()
+    invalidate_usuario(username)
+    invalidate_usuario(db_user.username)
+    # Los tokens emitidos antes del cambio traen claims viejos
+    revoke_token(db, id_user=id_user)
+    revoke_refresh_tokens(db, id_user=id_user)
     db.refresh(db_user)
     return db_user
@@ -0,0 +1,46 @@
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from dependencies.database import INSERTS_UPSERT
+from models.versiones import VersionesDB
+
+# Contadores por recurso, compartidos por todos los workers. Cada
+# escritura de un recurso sube su contador en la misma transacción, así
+# los lectores saben si algo cambió leyendo una sola fila
+DISPERSIONES = 'dispersiones'
+# Datos de entrada del cálculo: empleados, salarios, ajustes, préstamos
+# y sus saldos, cuentas y bancos
+NOMINA = 'nomina'
+
+
+def cambio_version(db: Session, recurso: str):
+    # No confirma: el contador sube sólo si la escritura se confirma
+    upsert = INSERTS_UPSERT.get(db.get_bind().dialect.name)
+    if upsert:
+        stmt = upsert(VersionesDB).values(recurso=recurso, version=1)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['recurso'],
+            set_={'version': VersionesDB.version + 1})
+        db.execute(stmt)
+        return
+    actualizados = db\
+        .query(VersionesDB)\
+        .filter(VersionesDB.recurso == recurso)\
+        .update({VersionesDB.version: VersionesDB.version + 1},
+                synchronize_session=False)
+    if not actualizados:  # pragma: no cover
+        db.add(VersionesDB(recurso=recurso, version=1))
+
+
+def get_version(db: Session, recurso: str) -> int:
+    version = db.execute(select(VersionesDB.version)
+                         .where(VersionesDB.recurso == recurso)).scalar()
+    return version or 0
+
+
+def cambio_nomina(db: Session):
+    cambio_version(db, NOMINA)
+
+
+def version_nomina(db: Session) -> int:
+    return get_version(db, NOMINA)
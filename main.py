@@ -1,10 +1,46 @@
+import asyncio
+from contextlib import asynccontextmanager, suppress
+
 import uvicorn
 from fastapi import FastAPI
 
+from dependencies.database import get_db
+from dependencies.documentos import limpiar_documentos_periodico
+from dependencies.nomina import start_pool_nomina, stop_pool_nomina
+from dependencies.scopes import compile_scopes
+from dependencies.trabajos import get_executor, start_trabajos
+from dependencies.users import (refresh_revocaciones,
+                                refresh_revocaciones_periodico)
 from routers import (ajustes, bancos, cuentas, dispersiones, empleados,
                      prestamos, recibos, salarios, users)
 
-app = FastAPI(title='GBIC Nomina API')
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    compile_scopes(app.routes)
+    abrir_db = app.dependency_overrides.get(get_db, get_db)
+    db_gen = abrir_db()
+    executor = app.dependency_overrides.get(get_executor, get_executor)()
+    try:
+        db = next(db_gen)
+        start_trabajos(db, executor)
+        refresh_revocaciones(db, forzar=True)
+    finally:
+        db_gen.close()
+    start_pool_nomina()
+    periodicas = [
+        asyncio.create_task(refresh_revocaciones_periodico(abrir_db)),
+        asyncio.create_task(limpiar_documentos_periodico(abrir_db)),
+    ]
+    yield
+    for tarea in periodicas:
+        tarea.cancel()
+        with suppress(asyncio.CancelledError):
+            await tarea
+    stop_pool_nomina()
+
+
+app = FastAPI(title='GBIC Nomina API', lifespan=lifespan)
 
 app.include_router(ajustes.router)
 app.include_router(cuentas.router)
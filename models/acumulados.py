@@ -0,0 +1,17 @@
+from sqlalchemy import Column, Float, ForeignKey, Integer, String
+
+from dependencies.database import Base
+from models.empleados import EmpleadosDB
+
+
+class AcumuladosDB(Base):
+    __tablename__ = 'acumulados'
+
+    id_empleado = Column(Integer,
+                         ForeignKey(EmpleadosDB.id_empleado),
+                         primary_key=True)
+    anio = Column(Integer, primary_key=True)
+    tipo = Column(String, primary_key=True)
+    concepto = Column(String, primary_key=True)
+    monto = Column(Float, default=0)
+    recibos = Column(Integer, default=0)
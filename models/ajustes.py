@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Date, Float, ForeignKey, Integer, String
+from sqlalchemy import (Column, Date, Float, ForeignKey, Index, Integer,
+                        String)
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
@@ -9,6 +10,10 @@ from models.users import UserDB
 
 class AjustesDB(Base):
     __tablename__ = 'ajustes'
+    __table_args__ = (
+        Index('ix_ajustes_fecha_fin_fecha_inicio',
+              'fecha_fin', 'fecha_inicio'),
+    )
 
     id_ajuste = Column(Integer, primary_key=True, index=True)
     fecha = Column(Date, server_default=func.current_date())
@@ -9,3 +9,4 @@ class BancosDB(Base):
     id_banco = Column(Integer, primary_key=True, index=True)
     nombre = Column(String, unique=True)
     activo = Column(Boolean, default=True)
+    layout = Column(String, default='csv', server_default='csv')
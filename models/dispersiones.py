@@ -1,14 +1,18 @@
-from sqlalchemy import Column, Date, Float, ForeignKey, Integer
+from sqlalchemy import (Column, Date, DateTime, Float, ForeignKey, Integer,
+                        String, UniqueConstraint)
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
 from dependencies.database import Base
 from models.cuentas import CuentasDB
+from models.empleados import EmpleadosDB
 from models.users import UserDB
 
 
 class DispersionesDB(Base):
     __tablename__ = 'dispersiones'
+    __table_args__ = (UniqueConstraint('periodo', 'periodo_fecha',
+                                       name='uq_dispersiones_periodo'),)
 
     id_dispersion = Column(Integer, primary_key=True, index=True)
     fecha = Column(Date, server_default=func.current_date())
@@ -24,7 +28,24 @@ class DispersionesDetalleDB(Base):
     __tablename__ = 'dispersiones_detalle'
 
     id_dispersiones_detalle = Column(Integer, primary_key=True, index=True)
-    id_dispersion = Column(Integer, ForeignKey(DispersionesDB.id_dispersion))
+    id_dispersion = Column(Integer, ForeignKey(DispersionesDB.id_dispersion),
+                           index=True)
     id_cuenta = Column(Integer, ForeignKey(CuentasDB.id_cuenta))
     monto = Column(Float)
     cuenta = relationship('CuentasDB', lazy='joined')
+
+
+class DispersionesCalculoDB(Base):
+    __tablename__ = 'dispersiones_calculo'
+    __table_args__ = (UniqueConstraint('periodo', 'periodo_fecha',
+                                       'id_empleado'),)
+
+    id_calculo = Column(Integer, primary_key=True, index=True)
+    fecha = Column(DateTime, server_default=func.now())
+    periodo = Column(Integer)
+    periodo_fecha = Column(Date)
+    id_empleado = Column(Integer, ForeignKey(EmpleadosDB.id_empleado))
+    huella = Column(String)
+    # VERSION_CALCULO y contador de nómina con que se validó el recibo
+    version = Column(String)
+    recibo = Column(String)
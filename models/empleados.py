@@ -1,5 +1,7 @@
 from sqlalchemy import Boolean, Column, ForeignKey, Integer, String
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
 
 from dependencies.database import Base
 from models.colonias import ColoniaDB
@@ -22,3 +24,17 @@ class EmpleadosDB(Base):
     celular = Column(String, nullable=True)
     activo = Column(Boolean, default=True)
     colonia = relationship("ColoniaDB", lazy='joined')
+
+    @hybrid_property
+    def nombre_completo(self):
+        return ' '.join(filter(None, [self.nombre, self.paterno,
+                                      self.materno]))
+
+    @nombre_completo.inplace.expression
+    @classmethod
+    def _nombre_completo(cls):
+        # Igual que en Python: las partes nulas o vacías no dejan espacio.
+        # Cada parte lleva su separador y se quita el primero
+        partes = [func.coalesce(' ' + func.nullif(parte, ''), '')
+                  for parte in (cls.nombre, cls.paterno, cls.materno)]
+        return func.substr(partes[0] + partes[1] + partes[2], 2)
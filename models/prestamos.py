@@ -20,3 +20,15 @@ class PrestamosDB(Base):
     id_empleado = Column(Integer, ForeignKey(EmpleadosDB.id_empleado))
     usuario = relationship("UserDB", lazy='joined')
     empleado = relationship("EmpleadosDB", lazy='joined')
+
+
+class PrestamosSaldoDB(Base):
+    __tablename__ = 'prestamos_saldo'
+
+    id_prestamo = Column(Integer,
+                         ForeignKey(PrestamosDB.id_prestamo),
+                         primary_key=True)
+    saldo = Column(Float)
+    cuotas_pagadas = Column(Integer, default=0)
+    ultimo_periodo = Column(Integer, nullable=True)
+    ultimo_periodo_fecha = Column(Date, nullable=True)
@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Float, ForeignKey, Integer, String
-from sqlalchemy.orm import relationship
+from sqlalchemy import (Column, Float, ForeignKey, Index, Integer,
+                        LargeBinary, String)
+from sqlalchemy.orm import deferred, relationship
 
 from dependencies.database import Base
 from models.ajustes import AjustesDB
@@ -12,11 +13,20 @@ from models.salarios import SalariosDB
 
 class RecibosDB(Base):
     __tablename__ = 'recibos'
+    __table_args__ = (
+        Index('ix_recibos_id_dispersion_id_recibo',
+              'id_dispersion', 'id_recibo'),
+        Index('ix_recibos_id_empleado_id_dispersion',
+              'id_empleado', 'id_dispersion'),
+    )
 
     id_recibo = Column(Integer, primary_key=True, index=True)
     id_empleado = Column(Integer, ForeignKey(EmpleadosDB.id_empleado))
     id_dispersion = Column(Integer, ForeignKey(DispersionesDB.id_dispersion))
     monto = Column(Float)
+    # ReciboConDetalles en JSON comprimido con zlib, escrito una sola vez
+    # al crear la dispersión; diferido para no cargarlo en los listados
+    snapshot = deferred(Column(LargeBinary, nullable=True))
     empleado = relationship('EmpleadosDB', lazy='joined')
     dispersion = relationship('DispersionesDB', lazy='joined')
     detalles = relationship('RecibosDetalleDB')
@@ -28,7 +38,8 @@ class RecibosDetalleDB(Base):
     id_recibos_detalle = Column(Integer, primary_key=True, index=True)
     id_recibo = Column(Integer,
                        ForeignKey(RecibosDB.id_recibo),
-                       nullable=False)
+                       nullable=False,
+                       index=True)
     id_ajuste = Column(Integer,
                        ForeignKey(AjustesDB.id_ajuste),
                        nullable=True)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Date, Float, ForeignKey, Integer
+from sqlalchemy import Column, Date, Float, ForeignKey, Index, Integer
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
@@ -9,6 +9,8 @@ from models.users import UserDB
 
 class SalariosDB(Base):
     __tablename__ = 'salarios'
+    __table_args__ = (Index('ix_salarios_id_empleado_fecha_valido',
+                            'id_empleado', 'fecha_valido'),)
 
     id_salario = Column(Integer, primary_key=True, index=True)
     fecha = Column(Date, server_default=func.current_date())
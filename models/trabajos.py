@@ -0,0 +1,46 @@
+from sqlalchemy import (Column, DateTime, ForeignKey, Index, Integer,
+                        LargeBinary, String, text)
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+
+from dependencies.database import Base
+from models.users import UserDB
+
+
+class TrabajosDB(Base):
+    __tablename__ = 'trabajos'
+    __table_args__ = (
+        # Un solo trabajo activo por clave (p. ej. el periodo)
+        Index('ix_trabajos_clave_activo', 'clave', unique=True,
+              sqlite_where=text("estado IN ('pendiente', 'en_proceso')"),
+              postgresql_where=text("estado IN ('pendiente', "
+                                    "'en_proceso')")),
+    )
+
+    id_trabajo = Column(Integer, primary_key=True, index=True)
+    fecha = Column(DateTime, server_default=func.now())
+    tipo = Column(String)
+    clave = Column(String)
+    parametros = Column(String)
+    estado = Column(String, default='pendiente')
+    fase = Column(String, nullable=True)
+    procesados = Column(Integer, default=0)
+    total = Column(Integer, nullable=True)
+    resultado = Column(String, nullable=True)
+    error = Column(String, nullable=True)
+    propietario = Column(String, nullable=True)
+    latido = Column(DateTime, nullable=True)
+    id_usuario = Column(Integer, ForeignKey(UserDB.id_user))
+    usuario = relationship('UserDB', lazy='joined')
+
+
+class TrabajosArchivoDB(Base):
+    # Archivo resultado de un trabajo, en la base para que lo descargue
+    # cualquier host
+    __tablename__ = 'trabajos_archivo'
+
+    id_trabajo = Column(Integer, ForeignKey(TrabajosDB.id_trabajo),
+                        primary_key=True)
+    fecha = Column(DateTime, index=True)
+    nombre = Column(String)
+    contenido = Column(LargeBinary)
@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, Integer, String
+from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, String
 
 from dependencies.database import Base
 
@@ -10,5 +10,31 @@ class UserDB(Base):
     username = Column(String, unique=True)
     nombre = Column(String)
     password_h = Column(String)
-    scopes = Column(String)
+    # Máscara de bits de schemas.scopes
+    scopes = Column(Integer, nullable=False, default=0)
     activo = Column(Boolean, default=True)
+
+
+class RevocacionesDB(Base):
+    __tablename__ = 'revocaciones'
+
+    # Un token (jti) o todos los de un usuario emitidos antes de fecha (UTC)
+    id_revocacion = Column(Integer, primary_key=True, index=True)
+    jti = Column(String, nullable=True)
+    id_user = Column(Integer, ForeignKey(UserDB.id_user), nullable=True)
+    fecha = Column(DateTime, nullable=False, index=True)
+
+
+class RefreshTokensDB(Base):
+    __tablename__ = 'refresh_tokens'
+
+    # Sólo se guarda el HMAC del token; familia agrupa las rotaciones de
+    # un mismo login
+    id_refresh = Column(Integer, primary_key=True, index=True)
+    hash = Column(String, unique=True, nullable=False)
+    familia = Column(String, nullable=False, index=True)
+    id_user = Column(Integer, ForeignKey(UserDB.id_user), nullable=False,
+                     index=True)
+    expira = Column(DateTime, nullable=False)
+    usado = Column(Boolean, nullable=False, default=False)
+    revocado = Column(Boolean, nullable=False, default=False)
@@ -0,0 +1,10 @@
+from sqlalchemy import Column, Integer, String
+
+from dependencies.database import Base
+
+
+class VersionesDB(Base):
+    __tablename__ = 'versiones'
+
+    recurso = Column(String, primary_key=True)
+    version = Column(Integer, default=0)
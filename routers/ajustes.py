@@ -1,3 +1,4 @@
+from datetime import date
 from typing import Annotated
 
 from fastapi import APIRouter, Depends, Security
@@ -5,10 +6,12 @@ from sqlalchemy.orm import Session
 from starlette import status
 
 from dependencies.ajustes import (ajustes_resp_edit, create_ajuste,
-                                  delete_ajuste, edit_ajuste, get_ajustes)
+                                  delete_ajuste, edit_ajuste, get_ajustes,
+                                  get_ajustes_activos)
 from dependencies.database import get_db
 from dependencies.users import get_current_active_user, user_responses
 from schemas.ajustes import AjusteIn, AjusteOut
+from schemas.nomina import AjusteVigente
 from schemas.users import User
 
 router = APIRouter(
@@ -33,6 +36,18 @@ def get_all_ajustes(
     return ajustes
 
 
+@router.get('/activos',
+            responses=user_responses,
+            response_model=dict[int, list[AjusteVigente]])
+def get_all_ajustes_activos(
+    db: db_dependency,
+    current_user: Annotated[User, Security(get_current_active_user,
+                                           scopes=["ajustes:read"])],
+    fecha: date
+):
+    return get_ajustes_activos(db, fecha)
+
+
 @router.post('/',
              status_code=status.HTTP_201_CREATED,
              responses=user_responses,
@@ -1,15 +1,30 @@
+from concurrent.futures import Executor
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, Security
+from fastapi import APIRouter, Depends, Header, Response, Security
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from starlette import status
 
 from dependencies.database import get_db
-from dependencies.dispersiones import (create_dispersion, delete_dispersion,
-                                       get_dispersion, get_dispersiones)
+from dependencies.dispersiones import (create_trabajo_dispersion,
+                                       delete_dispersion,
+                                       dispersiones_resp_404,
+                                       dispersiones_resp_archivo,
+                                       dispersiones_resp_create,
+                                       export_archivo_banco,
+                                       export_archivos_zip, get_dispersion,
+                                       get_diferencias_dispersion,
+                                       get_dispersiones,
+                                       get_resumen_dispersion,
+                                       preview_dispersion)
+from dependencies.etags import etag, etags_resp, not_modified
+from dependencies.trabajos import get_executor, get_trabajo, trabajos_resp
 from dependencies.users import get_current_active_user, user_responses
-from schemas.dispersiones import (DispersionConDetalles, DispersionIn,
-                                  DispersionOut)
+from schemas.dispersiones import (DiferenciasDispersion,
+                                  DispersionConDetalles, DispersionIn,
+                                  DispersionOut, ResumenConceptos)
+from schemas.trabajos import TrabajoOut
 from schemas.users import User
 
 router = APIRouter(
@@ -18,55 +33,156 @@ router = APIRouter(
 )
 
 db_dependency = Annotated[Session, Depends(get_db)]
+executor_dependency = Annotated[Executor, Depends(get_executor)]
 
 
 @router.get('/',
             response_model=list[DispersionOut],
-            responses=user_responses)
+            responses={**user_responses, **etags_resp})
 def get_all_dispersiones(
     db: db_dependency,
     current_user: Annotated[User, Security(get_current_active_user,
                                            scopes=['dispersiones:read'])],
+    response: Response,
     skip: int = 0,
-    limit: int = 10
+    limit: int = 10,
+    if_none_match: Annotated[str, Header(include_in_schema=False)] = ''
 ):
+    sin_cambios = not_modified(if_none_match,
+                               etag(db, 'dispersiones', skip, limit),
+                               response)
+    if sin_cambios:
+        return sin_cambios
     dispersiones = get_dispersiones(db, skip, limit)
     return dispersiones
 
 
+@router.get('/trabajos/{id_trabajo}',
+            response_model=TrabajoOut,
+            responses={**user_responses, **trabajos_resp})
+def get_trabajo_dispersion(
+    db: db_dependency,
+    current_user: Annotated[User, Security(get_current_active_user,
+                                           scopes=['dispersiones:read'])],
+    id_trabajo: int
+):
+    return get_trabajo(db, id_trabajo, 'dispersion')
+
+
 @router.get('/{id_disp}',
             response_model=DispersionConDetalles,
-            responses=user_responses)
+            responses={**user_responses, **etags_resp})
 def get_one_dispersion(
     db: db_dependency,
     current_user: Annotated[User, Security(get_current_active_user,
                                            scopes=['dispersiones:read'])],
-    id_disp: int
+    response: Response,
+    id_disp: int,
+    if_none_match: Annotated[str, Header(include_in_schema=False)] = ''
 ):
+    sin_cambios = not_modified(if_none_match,
+                               etag(db, 'dispersion', id_disp),
+                               response)
+    if sin_cambios:
+        return sin_cambios
     dispersion = get_dispersion(db, id_disp)
     return dispersion
 
 
+@router.get('/{id_disp}/resumen',
+            response_model=ResumenConceptos,
+            responses={**user_responses, **dispersiones_resp_404})
+def get_resumen(
+    db: db_dependency,
+    current_user: Annotated[User, Security(get_current_active_user,
+                                           scopes=['dispersiones:read'])],
+    id_disp: int
+):
+    return get_resumen_dispersion(db, id_disp)
+
+
+@router.get('/{id_disp}/diferencias',
+            response_model=DiferenciasDispersion,
+            responses={**user_responses, **dispersiones_resp_404,
+                       **etags_resp})
+def get_diferencias(
+    db: db_dependency,
+    current_user: Annotated[User, Security(get_current_active_user,
+                                           scopes=['dispersiones:read'])],
+    response: Response,
+    id_disp: int,
+    base: int,
+    if_none_match: Annotated[str, Header(include_in_schema=False)] = ''
+):
+    # base: dispersión contra la que se compara, normalmente la quincena
+    # anterior
+    sin_cambios = not_modified(if_none_match,
+                               etag(db, 'diferencias', id_disp, base),
+                               response)
+    if sin_cambios:
+        return sin_cambios
+    diferencias = get_diferencias_dispersion(db, id_disp, base)
+    return diferencias
+
+
+@router.get('/{id_disp}/archivos',
+            response_class=StreamingResponse,
+            responses={**user_responses, **dispersiones_resp_archivo})
+def get_archivos_dispersion(
+    db: db_dependency,
+    current_user: Annotated[User, Security(get_current_active_user,
+                                           scopes=['dispersiones:read'])],
+    id_disp: int
+):
+    nombre, contenido = export_archivos_zip(db, id_disp)
+    return StreamingResponse(contenido,
+                             media_type='application/zip',
+                             headers={'Content-Disposition':
+                                      f'attachment; filename="{nombre}"'})
+
+
+@router.get('/{id_disp}/archivos/{id_banco}',
+            response_class=StreamingResponse,
+            responses={**user_responses, **dispersiones_resp_archivo})
+def get_archivo_banco(
+    db: db_dependency,
+    current_user: Annotated[User, Security(get_current_active_user,
+                                           scopes=['dispersiones:read'])],
+    id_disp: int,
+    id_banco: int
+):
+    layout, nombre, contenido = export_archivo_banco(db, id_disp, id_banco)
+    return StreamingResponse(contenido,
+                             media_type=layout.media_type,
+                             headers={'Content-Disposition':
+                                      f'attachment; filename="{nombre}"'})
+
+
 @router.post('/',
-             status_code=status.HTTP_201_CREATED,
-             response_model=DispersionOut,
-             responses=user_responses)
+             status_code=status.HTTP_202_ACCEPTED,
+             response_model=TrabajoOut,
+             responses={**user_responses, **dispersiones_resp_create})
 def post_create_dispersion(
     db: db_dependency,
+    executor: executor_dependency,
     create_request: DispersionIn,
     current_user: Annotated[User, Security(get_current_active_user,
                                            scopes=['dispersiones:write'])],
     dry_run: bool = True
 ):
-    new_dispersion = create_dispersion(db, create_request, dry_run)
-    return DispersionOut.model_validate(new_dispersion)
+    if dry_run:
+        return StreamingResponse(preview_dispersion(db, create_request),
+                                 media_type='application/x-ndjson')
+    trabajo = create_trabajo_dispersion(db, create_request, current_user,
+                                        executor)
+    return TrabajoOut.model_validate(trabajo)
 
 
 @router.delete('/{id_dispersion}',
                status_code=status.HTTP_204_NO_CONTENT,
-               responses={**user_responses}
+               responses={**user_responses, **dispersiones_resp_404}
                )
-def delete_delete_prestamo(
+def delete_delete_dispersion(
     db: db_dependency,
     id_dispersion: int,
     current_user: Annotated[User,
@@ -1,13 +1,26 @@
-from typing import Annotated
+import zlib
+from concurrent.futures import Executor
+from datetime import date
+from typing import Annotated, Optional
 
-from fastapi import APIRouter, Depends, Security
+from fastapi import APIRouter, Depends, Header, Response, Security
 from sqlalchemy.orm import Session
+from starlette import status
 
+from dependencies.acumulados import get_acumulados_empleado
 from dependencies.database import get_db
+from dependencies.documentos import (create_trabajo_documentos,
+                                     get_archivo_documentos)
+from dependencies.etags import (acepta_codificacion, etag, etags_resp,
+                                not_modified)
 from dependencies.recibos import (get_recibo, get_recibos,
-                                  get_recibos_dispersion, get_recibos_empleado)
+                                  get_recibos_dispersion, get_recibos_empleado,
+                                  get_snapshot_recibo)
+from dependencies.trabajos import get_executor, get_trabajo, trabajos_resp
 from dependencies.users import get_current_active_user, user_responses
+from schemas.acumulados import AcumuladoOut
 from schemas.recibos import ReciboConDetalles, ReciboOut
+from schemas.trabajos import TrabajoOut
 from schemas.users import User
 
 router = APIRouter(
@@ -16,56 +29,164 @@ router = APIRouter(
 )
 
 db_dependency = Annotated[Session, Depends(get_db)]
+executor_dependency = Annotated[Executor, Depends(get_executor)]
 
 
 @router.get('/',
             response_model=list[ReciboOut],
-            responses=user_responses)
+            responses={**user_responses, **etags_resp})
 def get_all_recibos(
     db: db_dependency,
     current_user: Annotated[User, Security(get_current_active_user,
                                            scopes=['recibos:read'])],
+    response: Response,
     skip: int = 0,
-    limit: int = 10
+    limit: int = 10,
+    if_none_match: Annotated[str, Header(include_in_schema=False)] = ''
 ):
+    sin_cambios = not_modified(if_none_match,
+                               etag(db, 'recibos', skip, limit),
+                               response)
+    if sin_cambios:
+        return sin_cambios
     recibos = get_recibos(db, skip, limit)
     return recibos
 
 
 @router.get('/{id_recibo}',
             response_model=ReciboConDetalles,
-            responses=user_responses)
+            responses={**user_responses, **etags_resp})
 def get_on_recibo(
     db: db_dependency,
     current_user: Annotated[User, Security(get_current_active_user,
                                            scopes=['recibos:read'])],
-    id_recibo: int
+    response: Response,
+    id_recibo: int,
+    accept_encoding: Annotated[str, Header(include_in_schema=False)] = '',
+    if_none_match: Annotated[str, Header(include_in_schema=False)] = ''
 ):
-    recibos = get_recibo(db, id_recibo)
-    return recibos
+    # Un ETag fuerte por codificación negociada: deflate y JSON plano son
+    # representaciones distintas
+    deflate = acepta_codificacion(accept_encoding, 'deflate')
+    actual = etag(db, 'recibo', id_recibo, 'deflate' if deflate else 'json')
+    response.headers['Vary'] = 'Accept-Encoding'
+    sin_cambios = not_modified(if_none_match, actual, response)
+    if sin_cambios:
+        sin_cambios.headers['Vary'] = 'Accept-Encoding'
+        return sin_cambios
+    snapshot = get_snapshot_recibo(db, id_recibo)
+    if snapshot is None:
+        return get_recibo(db, id_recibo)
+    # El snapshot ya es deflate (zlib): se envía tal cual si el cliente
+    # lo acepta, si no se descomprime sin volver a validar
+    cabeceras = {'ETag': actual, 'Vary': 'Accept-Encoding'}
+    if deflate:
+        return Response(snapshot,
+                        media_type='application/json',
+                        headers={**cabeceras, 'Content-Encoding': 'deflate'})
+    return Response(zlib.decompress(snapshot),
+                    media_type='application/json',
+                    headers=cabeceras)
 
 
-@router.get('/empleado/{id_emp}',
+@router.get('/empleado/{id_empleado}',
             response_model=list[ReciboOut],
-            responses=user_responses)
+            responses={**user_responses, **etags_resp})
 def get_all_recibos_empleado(
     db: db_dependency,
     current_user: Annotated[User, Security(get_current_active_user,
                                            scopes=['recibos:read'])],
-    id_empleado: int
+    response: Response,
+    id_empleado: int,
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None,
+    if_none_match: Annotated[str, Header(include_in_schema=False)] = ''
 ):
-    recibos = get_recibos_empleado(db, id_empleado)
+    sin_cambios = not_modified(if_none_match,
+                               etag(db, 'recibos_empleado', id_empleado,
+                                    desde, hasta),
+                               response)
+    if sin_cambios:
+        return sin_cambios
+    recibos = get_recibos_empleado(db, id_empleado, desde, hasta)
     return recibos
 
 
+@router.get('/empleado/{id_empleado}/acumulados/{anio}',
+            response_model=list[AcumuladoOut],
+            responses=user_responses)
+def get_all_acumulados_empleado(
+    db: db_dependency,
+    current_user: Annotated[User, Security(get_current_active_user,
+                                           scopes=['recibos:read'])],
+    id_empleado: int,
+    anio: int
+):
+    return get_acumulados_empleado(db, id_empleado, anio)
+
+
 @router.get('/dispersion/{id_disp}',
             response_model=list[ReciboOut],
-            responses=user_responses)
+            responses={**user_responses, **etags_resp})
 def get_all_recibos_dispersion(
     db: db_dependency,
     current_user: Annotated[User, Security(get_current_active_user,
                                            scopes=['recibos:read'])],
-    id_disp: int
+    response: Response,
+    id_disp: int,
+    despues: int = 0,
+    limit: int = 100,
+    if_none_match: Annotated[str, Header(include_in_schema=False)] = ''
 ):
-    recibos = get_recibos_dispersion(db, id_disp)
+    # despues: último id_recibo de la página anterior
+    sin_cambios = not_modified(if_none_match,
+                               etag(db, 'recibos_dispersion', id_disp,
+                                    despues, limit),
+                               response)
+    if sin_cambios:
+        return sin_cambios
+    recibos = get_recibos_dispersion(db, id_disp, despues, limit)
     return recibos
+
+
+@router.post('/dispersion/{id_disp}/documentos',
+             status_code=status.HTTP_202_ACCEPTED,
+             response_model=TrabajoOut,
+             responses=user_responses)
+def post_documentos_dispersion(
+    db: db_dependency,
+    executor: executor_dependency,
+    current_user: Annotated[User, Security(get_current_active_user,
+                                           scopes=['dispersiones:write'])],
+    id_disp: int
+):
+    trabajo = create_trabajo_documentos(db, id_disp, current_user, executor)
+    return TrabajoOut.model_validate(trabajo)
+
+
+@router.get('/trabajos/{id_trabajo}',
+            response_model=TrabajoOut,
+            responses={**user_responses, **trabajos_resp})
+def get_trabajo_documentos(
+    db: db_dependency,
+    current_user: Annotated[User, Security(get_current_active_user,
+                                           scopes=['recibos:read'])],
+    id_trabajo: int
+):
+    return get_trabajo(db, id_trabajo, 'documentos')
+
+
+@router.get('/trabajos/{id_trabajo}/archivo',
+            response_class=Response,
+            responses={**user_responses, **trabajos_resp})
+def get_archivo_trabajo_documentos(
+    db: db_dependency,
+    current_user: Annotated[User, Security(get_current_active_user,
+                                           scopes=['recibos:read'])],
+    id_trabajo: int
+):
+    archivo = get_archivo_documentos(db, id_trabajo)
+    return Response(archivo.contenido,
+                    media_type='application/zip',
+                    headers={'Content-Disposition':
+                             f'attachment; filename="{archivo.nombre}"'})
@@ -6,10 +6,14 @@ from sqlalchemy.orm import Session
 from starlette import status
 
 from dependencies.database import get_db
-from dependencies.users import (create_access_token, create_user, edit_user,
+from dependencies.users import (create_user, edit_user,
                                 get_current_active_user, get_users,
+                                login_access_token, oauth2_bearer,
+                                refresh_access_token,
+                                revoke_access_token, revoke_refresh_token,
                                 user_resp_edit, user_responses)
-from schemas.users import Token, User, UserIn, UserOut, UserUpdate
+from schemas.users import (RefreshIn, Token, User, UserIn, UserOut,
+                           UserUpdate)
 
 router = APIRouter(
     prefix='/users',
@@ -38,13 +42,13 @@ user_dependency = Annotated[dict, Depends(get_current_active_user)]
              status_code=status.HTTP_201_CREATED,
              responses=user_responses,
              response_model=UserOut)
-async def post_create_user(db: db_dependency,
-                           create_user_request: UserIn,
-                           current_user: Annotated[User, Security(
-                               get_current_active_user,
-                               scopes=["users:write"]
-                                )]
-                           ):
+def post_create_user(db: db_dependency,
+                     create_user_request: UserIn,
+                     current_user: Annotated[User, Security(
+                         get_current_active_user,
+                         scopes=["users:write"]
+                          )]
+                     ):
     new_user = create_user(create_user_request, db)
     return UserOut.model_validate(new_user)
 
@@ -53,14 +57,14 @@ async def post_create_user(db: db_dependency,
             status_code=status.HTTP_202_ACCEPTED,
             responses={**user_responses, **user_resp_edit},
             response_model=UserOut)
-async def put_edit_user(db: db_dependency,
-                        edit_user_request: UserUpdate,
-                        current_user: Annotated[User, Security(
-                            get_current_active_user,
-                            scopes=['users:write']
-                        )],
-                        id_user: int
-                        ):
+def put_edit_user(db: db_dependency,
+                  edit_user_request: UserUpdate,
+                  current_user: Annotated[User, Security(
+                      get_current_active_user,
+                      scopes=['users:write']
+                  )],
+                  id_user: int
+                  ):
     if id_user == 1 and current_user.id_user != 1:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                             detail='No puedes editar al Administardor')
@@ -71,17 +75,36 @@ async def put_edit_user(db: db_dependency,
 @router.post('/token', response_model=Token, responses=user_responses)
 async def login(form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
                 db: db_dependency,):
-    token = create_access_token(form_data, db)
+    # async: mientras espera bcrypt no ocupa un hilo del threadpool
+    token = await login_access_token(form_data, db)
     return token
 
 
+@router.post('/token/refresh', response_model=Token, responses=user_responses)
+def refresh(refresh_request: RefreshIn, db: db_dependency):
+    token = refresh_access_token(db, refresh_request.refresh_token)
+    return token
+
+
+@router.post('/logout',
+             status_code=status.HTTP_204_NO_CONTENT,
+             responses=user_responses)
+def logout(db: db_dependency,
+           current_user: user_dependency,
+           token: Annotated[str, Depends(oauth2_bearer)],
+           refresh_request: RefreshIn | None = None):
+    revoke_access_token(db, token)
+    if refresh_request:
+        revoke_refresh_token(db, refresh_request.refresh_token)
+
+
 @router.get('/me', response_model=UserOut, responses=user_responses,)
 def me(current_user: user_dependency, db: db_dependency):
     return current_user
 
 
 @router.get('/', response_model=list[UserOut], responses=user_responses,)
-async def get_all_users(
+def get_all_users(
         db: db_dependency,
         current_user: Annotated[User, Security(get_current_active_user,
                                                scopes=["users:read"])],
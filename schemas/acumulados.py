@@ -0,0 +1,21 @@
+from typing import Optional
+
+from pydantic import BaseModel, ConfigDict
+
+
+class AcumuladoBase(BaseModel):
+    id_empleado: int
+    anio: int
+    tipo: str
+    concepto: str
+    monto: float
+    recibos: int
+
+
+class AcumuladoOut(AcumuladoBase):
+    model_config = ConfigDict(from_attributes=True)
+
+
+class DiferenciaAcumulado(AcumuladoBase):
+    monto_guardado: Optional[float] | None = None
+    recibos_guardado: Optional[int] | None = None
@@ -44,12 +44,16 @@ class AjusteOut(Ajuste):
 
     @field_validator('usuario', mode='before')
     def flat_usuario(cls, v):
+        if isinstance(v, str):
+            return v
         if v.username:
             return v.username
         return v  # pragma: no cover
 
     @field_validator('empleado', mode='before')
     def nombre_empelado(cls, v):
+        if isinstance(v, str):
+            return v
         if v.nombre:
             return ' '.join([v.nombre, v.paterno, v.materno])
         return v  # pragma: no cover
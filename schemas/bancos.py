@@ -1,9 +1,21 @@
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, field_validator
+
+# Formatos de archivo de dispersión; cada uno se genera en
+# dependencies.layouts
+TIPOS_LAYOUT = ('csv', 'fijo')
 
 
 class BancoBase(BaseModel):
     nombre: str
     activo: bool = True
+    layout: str = 'csv'
+
+    @field_validator('layout')
+    def layout_valido(cls, v):
+        if v not in TIPOS_LAYOUT:
+            raise ValueError('Layout no soportado, opciones: '
+                             + ', '.join(TIPOS_LAYOUT))
+        return v
 
 
 class BancoIn(BancoBase):
@@ -43,6 +43,9 @@ class Cuenta(CuentaBase):
 
     @model_validator(mode='before')
     def validate_fechas(self) -> 'CuentaBase':
+        # Las consultas por columnas llegan como dict
+        if isinstance(self, dict):
+            return {**self, 'tipo_txt': tipo_dict.get(self.get('tipo'))}
         t = self.tipo
         self.tipo_txt = tipo_dict.get(t)
 
@@ -56,18 +59,24 @@ class CuentaOut(Cuenta):
 
     @field_validator('usuario', mode='before')
     def flat_usuario(cls, v):
+        if isinstance(v, str):
+            return v
         if v.username:
             return v.username
         return v  # pragma: no cover
 
     @field_validator('empleado', mode='before')
     def nombre_empelado(cls, v):
+        if isinstance(v, str):
+            return v
         if v.nombre:
             return ' '.join([v.nombre, v.paterno, v.materno])
         return v  # pragma: no cover
 
     @field_validator('banco', mode='before')
     def nombre_banco(cls, v):
+        if isinstance(v, str):
+            return v
         if v.nombre:
             return v.nombre
         return v  # pragma: no cover
@@ -1,4 +1,5 @@
 from datetime import date
+from typing import Optional
 
 from pydantic import (BaseModel, ConfigDict, Field, field_validator,
                       model_validator)
@@ -33,11 +34,18 @@ class DispersionOut(Dispersion):
 
     @field_validator('usuario', mode='before')
     def flat_user(cls, v):
+        if isinstance(v, str):
+            return v
         if v.username:
             return v.username
         return v  # pragma: no cover
 
 
+class DispersionCreada(DispersionOut):
+    reutilizados: int
+    recalculados: int
+
+
 class DispersionDetallesBase(BaseModel):
     id_dispersion: int
     id_cuenta: int
@@ -79,3 +87,56 @@ class DispersionDetallesOut(DispersionDetalles):
 
 class DispersionConDetalles(DispersionOut):
     detalles: list[DispersionDetallesOut]
+
+
+class TotalBanco(BaseModel):
+    id_banco: int
+    banco: str
+    total: float
+
+
+class ResumenDispersion(DispersionBase):
+    recibos: int
+    reutilizados: int
+    recalculados: int
+    total: float
+    bancos: list[TotalBanco]
+
+
+class TotalConcepto(BaseModel):
+    tipo: str
+    concepto: str
+    recibos: int
+    total: float
+
+
+class ResumenConceptos(DispersionBase):
+    id_dispersion: int
+    conceptos: list[TotalConcepto]
+    bancos: list[TotalBanco]
+
+
+class DiferenciaConcepto(BaseModel):
+    tipo: str
+    concepto: str
+    monto_base: float
+    monto: float
+    diferencia: float
+
+
+class DiferenciaRecibo(BaseModel):
+    id_empleado: int
+    empleado: str
+    monto_base: Optional[float] | None = None
+    monto: Optional[float] | None = None
+    diferencia: float
+    cuenta_base: Optional[str] | None = None
+    cuenta: Optional[str] | None = None
+    conceptos: list[DiferenciaConcepto] = []
+
+
+class DiferenciasDispersion(BaseModel):
+    id_dispersion: int
+    id_base: int
+    diferencia: float
+    recibos: list[DiferenciaRecibo]
@@ -0,0 +1,72 @@
+from datetime import date
+from typing import Optional
+
+from pydantic import BaseModel, ConfigDict
+
+
+class SalarioVigente(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id_salario: int
+    id_empleado: int
+    fecha_valido: date
+    monto: float
+
+
+class AjusteVigente(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id_ajuste: int
+    id_empleado: int
+    motivo: str
+    monto: float
+
+
+class CuotaPrestamo(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id_prestamo: int
+    id_empleado: int
+    comentarios: Optional[str] | None = None
+    monto_quincenal: float
+    saldo: float
+
+
+class CuentaNomina(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id_cuenta: int
+    id_empleado: int
+    id_banco: int
+    banco: str
+    numero: str
+    tipo: int
+
+
+class EntradaNomina(BaseModel):
+    id_empleado: int
+    salario: SalarioVigente
+    ajustes: list[AjusteVigente] = []
+    prestamos: list[CuotaPrestamo] = []
+    cuenta: CuentaNomina
+
+
+class ConceptoRecibo(BaseModel):
+    id_salario: Optional[int] | None = None
+    id_ajuste: Optional[int] | None = None
+    id_prestamo: Optional[int] | None = None
+    texto: str
+    monto: float
+
+
+class ReciboCalculado(BaseModel):
+    id_empleado: int
+    id_cuenta: int
+    id_banco: int
+    monto: float
+    conceptos: list[ConceptoRecibo]
+
+
+class ResumenCalculo(BaseModel):
+    reutilizados: int = 0
+    recalculados: int = 0
@@ -1,11 +1,12 @@
 from datetime import date
+from typing import Optional
 
 from pydantic import (BaseModel, ConfigDict, Field, field_validator,
                       model_validator)
 from pydantic.json_schema import SkipJsonSchema
 
 from schemas.ajustes import Ajuste
-from schemas.cuentas import Cuenta
+from schemas.cuentas import Cuenta, tipo_dict
 from schemas.dispersiones import Dispersion
 from schemas.empleados import Empleado
 from schemas.prestamos import Prestamo
@@ -31,7 +32,8 @@ class Recibo(ReciboBase):
 
 
 class ReciboOut(Recibo):
-    dispersion: SkipJsonSchema[Dispersion] = Field(exclude=True)
+    dispersion: SkipJsonSchema[Optional[Dispersion]] = Field(default=None,
+                                                             exclude=True)
     empleado: str
     periodo: int
     periodo_fecha: date
@@ -39,12 +41,17 @@ class ReciboOut(Recibo):
 
     @field_validator('empleado', mode='before')
     def nombre_empelado(cls, v):
+        if isinstance(v, str):
+            return v
         if v.nombre:
             return ' '.join([v.nombre, v.paterno, v.materno])
         return v  # pragma: no cover
 
     @model_validator(mode='before')
     def flat_dispersion(self) -> 'ReciboOut':
+        # Las consultas por columnas ya traen el periodo aplanado
+        if isinstance(self, dict):
+            return self
         self.periodo = self.dispersion.periodo
         self.periodo_fecha = self.dispersion.periodo_fecha
         self.fecha = self.dispersion.fecha
@@ -54,66 +61,89 @@ class ReciboOut(Recibo):
 
 class ReciboDetallesbase(BaseModel):
     id_recibo: int
-    id_ajuste: int
-    id_prestamo: int
-    id_salario: int
-    id_cuenta: int
-    texto: str
+    id_ajuste: Optional[int] | None = None
+    id_prestamo: Optional[int] | None = None
+    id_salario: Optional[int] | None = None
+    id_cuenta: Optional[int] | None = None
+    texto: Optional[str] | None = None
     monto: float
 
 
 class ReciboDetalles(ReciboDetallesbase):
     model_config = ConfigDict(from_attributes=True)
 
-    id_recibo_detalle: int
-    ajuste: Ajuste
-    cuenta: Cuenta
-    prestamo: Prestamo
-    salario: Salario
+    id_recibos_detalle: int
+    ajuste: Optional[Ajuste] | None = None
+    cuenta: Optional[Cuenta] | None = None
+    prestamo: Optional[Prestamo] | None = None
+    salario: Optional[Salario] | None = None
 
 
 class ReciboDetallesOut(ReciboDetalles):
-    ajuste: SkipJsonSchema[Ajuste] = Field(exclude=True)
-    prestamo: SkipJsonSchema[Prestamo] = Field(exclude=True)
-    salario: SkipJsonSchema[Salario] = Field(exclude=True)
+    ajuste: SkipJsonSchema[Optional[Ajuste]] = Field(default=None,
+                                                     exclude=True)
+    prestamo: SkipJsonSchema[Optional[Prestamo]] = Field(default=None,
+                                                         exclude=True)
+    salario: SkipJsonSchema[Optional[Salario]] = Field(default=None,
+                                                       exclude=True)
     id_recibo: SkipJsonSchema[int] = Field(exclude=True)
-    id_ajuste: SkipJsonSchema[int] = Field(exclude=True)
-    id_prestamo: SkipJsonSchema[int] = Field(exclude=True)
-    id_salario: SkipJsonSchema[int] = Field(exclude=True)
-    id_cuenta: SkipJsonSchema[int] = Field(exclude=True)
-    id_externo: int
-    texto: str
+    id_ajuste: SkipJsonSchema[Optional[int]] = Field(default=None,
+                                                     exclude=True)
+    id_prestamo: SkipJsonSchema[Optional[int]] = Field(default=None,
+                                                       exclude=True)
+    id_salario: SkipJsonSchema[Optional[int]] = Field(default=None,
+                                                      exclude=True)
+    id_cuenta: SkipJsonSchema[Optional[int]] = Field(default=None,
+                                                     exclude=True)
+    id_externo: Optional[int] | None = None
+    texto: Optional[str] | None = None
     monto: float
 
-    banco: str
-    cuenta: str
-    tipo: str
+    banco: Optional[str] | None = None
+    cuenta: Optional[str] | None = None
+    tipo: Optional[str] | None = None
 
-    @model_validator(mode='after')
+    @model_validator(mode='before')
     def flat_fields(self) -> 'ReciboDetallesOut':
-        self.banco = self.cuenta.banco.nombre
-        self.tipo = self.cuenta.tipo_txt
-        self.cuenta = self.cuenta.numero
-
-        if self.prestamo:
-            self.id_externo = self.prestamo.id_prestamo
-            self.monto = self.prestamo.monto_quincenal
-            self.texto = self.prestamo.comentarios
-        if self.salario:
-            self.id_externo = self.salario.id_salario
-            self.monto = self.salario.monto
-            self.texto = 'Salario'
-        if self.ajuste:
-            self.id_externo = self.ajuste.id_ajuste
-            self.monto = self.ajuste.monto
-            self.texto = self.ajuste.motivo
-
-        self.periodo = self.dispersion.periodo
-        self.periodo_fecha = self.dispersion.periodo_fecha
-        self.fecha = self.dispersion.fecha
-
-        return self
+        # Los snapshots ya vienen aplanados; texto y monto son los
+        # pagados, no los del salario, ajuste o préstamo actuales
+        if isinstance(self, dict):
+            return self
+        cuenta = self.cuenta
+        return {'id_recibos_detalle': self.id_recibos_detalle,
+                'id_recibo': self.id_recibo,
+                'id_externo': self.id_salario or self.id_ajuste
+                or self.id_prestamo or self.id_cuenta,
+                'texto': self.texto,
+                'monto': self.monto,
+                'banco': cuenta.banco.nombre if cuenta else None,
+                'cuenta': cuenta.numero if cuenta else None,
+                'tipo': tipo_dict.get(cuenta.tipo) if cuenta else None}
 
 
 class ReciboConDetalles(ReciboOut):
     detalles: list[ReciboDetallesOut]
+
+
+class ConceptoDocumento(BaseModel):
+    texto: Optional[str] | None = None
+    monto: float
+
+
+class ReciboDocumento(BaseModel):
+    id_recibo: int
+    empleado: str
+    rfc: Optional[str] | None = None
+    periodo: int
+    periodo_fecha: date
+    monto: float
+    conceptos: list[ConceptoDocumento] = []
+
+
+class DocumentosIn(BaseModel):
+    id_dispersion: int
+
+
+class DocumentosOut(BaseModel):
+    archivo: str
+    recibos: int
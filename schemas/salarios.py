@@ -37,12 +37,16 @@ class SalarioOut(Salario):
 
     @field_validator('usuario', mode='before')
     def flat_usuario(cls, v):
+        if isinstance(v, str):
+            return v
         if v.username:
             return v.username
         return v  # pragma: no cover
 
     @field_validator('empleado', mode='before')
     def nombre_empelado(cls, v):
+        if isinstance(v, str):
+            return v
         if v.nombre:
             return ' '.join([v.nombre, v.paterno, v.materno])
         return v  # pragma: no cover
@@ -0,0 +1,40 @@
+from functools import lru_cache
+from typing import Iterable
+
+# Registro de scopes; el bit de cada uno es su posición. Sólo se agregan
+# al final: los bits ya guardados en users y en los tokens no cambian
+SCOPES = (
+    'Admin',
+    'users:read',
+    'users:write',
+    'empleados:read',
+    'empleados:write',
+    'cuentas:read',
+    'cuentas:write',
+    'bancos:read',
+    'bancos:write',
+    'salarios:read',
+    'salarios:write',
+    'ajustes:read',
+    'ajustes:write',
+    'prestamos:read',
+    'prestamos:write',
+    'dispersiones:read',
+    'dispersiones:write',
+    'dispersiones:delete',
+    'recibos:read',
+)
+BITS = {scope: 1 << bit for bit, scope in enumerate(SCOPES)}
+
+
+def scopes_mask(scopes: Iterable[str]) -> int:
+    # Los nombres fuera del registro no otorgan nada y se descartan
+    mask = 0
+    for scope in scopes:
+        mask |= BITS.get(scope, 0)
+    return mask
+
+
+@lru_cache(maxsize=None)
+def mask_scopes(mask: int) -> tuple[str, ...]:
+    return tuple(scope for scope in SCOPES if mask & BITS[scope])
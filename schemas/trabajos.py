@@ -0,0 +1,38 @@
+import json
+from datetime import datetime
+from typing import Any, Optional
+
+from pydantic import BaseModel, ConfigDict, field_validator
+
+from schemas.users import User
+
+
+class Trabajo(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id_trabajo: int
+    fecha: datetime
+    tipo: str
+    estado: str
+    fase: Optional[str] | None = None
+    procesados: int = 0
+    total: Optional[int] | None = None
+    resultado: Optional[Any] | None = None
+    error: Optional[str] | None = None
+    usuario: User
+
+
+class TrabajoOut(Trabajo):
+    usuario: str
+
+    @field_validator('usuario', mode='before')
+    def flat_usuario(cls, v):
+        if v.username:
+            return v.username
+        return v  # pragma: no cover
+
+    @field_validator('resultado', mode='before')
+    def load_resultado(cls, v):
+        if isinstance(v, str):
+            return json.loads(v)
+        return v
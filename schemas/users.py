@@ -1,6 +1,10 @@
 from typing import Optional
 
-from pydantic import BaseModel, ConfigDict, field_validator
+from pydantic import (BaseModel, ConfigDict, Field, field_validator,
+                      model_validator)
+from pydantic.json_schema import SkipJsonSchema
+
+from schemas.scopes import mask_scopes, scopes_mask
 
 
 class UserBase(BaseModel):
@@ -22,12 +26,18 @@ class User(UserBase):
     model_config = ConfigDict(from_attributes=True)
 
     id_user: int
+    permisos: SkipJsonSchema[int] = Field(default=0, exclude=True)
 
     @field_validator('scopes', mode='before')
-    def split_str(cls, v):
-        if isinstance(v, str):
-            return v.split(',')
-        return v  # pragma: no cover
+    def split_mask(cls, v):
+        if isinstance(v, int):
+            return list(mask_scopes(v))
+        return v
+
+    @model_validator(mode='after')
+    def set_permisos(self) -> 'User':
+        self.permisos = scopes_mask(self.scopes)
+        return self
 
 
 class UserOut(User):
@@ -37,9 +47,18 @@ class UserOut(User):
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] | None = None
+
+
+class RefreshIn(BaseModel):
+    refresh_token: str
 
 
 class TokenData(BaseModel):
     id: int
     username: str
     nombre: str
+    scopes: Optional[int] | None = None
+    activo: bool = True
+    jti: Optional[str] | None = None
+    iat: Optional[float] | None = None
@@ -0,0 +1,92 @@
+# Latencia de endpoints ajenos durante una ráfaga de logins, con la app en
+# un solo event loop como un worker de uvicorn: GET / (async) y GET /users
+# (sync, con consulta; compite por los 40 hilos del threadpool y por las
+# conexiones del pool con los logins). La base va fuera del repositorio:
+#   DB_URL=sqlite:////tmp/gbic_bench.db SECRET_KEY=x \
+#       python -m tests.bench_login
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from dependencies.database import Base, SessionLocal, engine
+from dependencies.users import (create_access_token, create_user,
+                                get_user_by_username)
+from main import app
+from schemas.users import UserIn
+
+LOGINS = 60
+SONDEOS = 200
+usuario = UserIn(username='bench', password='password', nombre='Bench',
+                 scopes=['users:read'])
+
+
+def percentiles(latencias: list[float]) -> str:
+    cortes = statistics.quantiles(latencias, n=100)
+    return f'p50 {cortes[49] * 1000:7.1f} ms  ' \
+           f'p99 {cortes[98] * 1000:7.1f} ms  ' \
+           f'max {max(latencias) * 1000:7.1f} ms'
+
+
+async def sondear(client: httpx.AsyncClient,
+                  url: str,
+                  headers: dict,
+                  latencias: list[float],
+                  fin: asyncio.Event):
+    while not fin.is_set() or len(latencias) < 2:
+        inicio = time.perf_counter()
+        respuesta = await client.get(url, headers=headers)
+        assert respuesta.status_code == 200
+        latencias.append(time.perf_counter() - inicio)
+        await asyncio.sleep(0.005)
+
+
+async def medir(client: httpx.AsyncClient, url: str, headers: dict) -> list:
+    latencias = []
+    for _ in range(SONDEOS):
+        inicio = time.perf_counter()
+        await client.get(url, headers=headers)
+        latencias.append(time.perf_counter() - inicio)
+    return latencias
+
+
+async def main():
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    if not get_user_by_username(usuario.username, db):
+        create_user(usuario, db)
+    token = create_access_token(usuario, db).access_token
+    db.close()
+    sondeos = {'GET /      ': ('/', {}),
+               'GET /users ': ('/users/',
+                               {'Authorization': f'Bearer {token}'})}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport,
+                                 base_url='http://bench') as client:
+        base = {nombre: await medir(client, url, headers)
+                for nombre, (url, headers) in sondeos.items()}
+
+        rafaga = {nombre: [] for nombre in sondeos}
+        fin = asyncio.Event()
+        tareas = [asyncio.create_task(sondear(client, url, headers,
+                                              rafaga[nombre], fin))
+                  for nombre, (url, headers) in sondeos.items()]
+        inicio = time.perf_counter()
+        respuestas = await asyncio.gather(*[
+            client.post('/users/token',
+                        data={'username': usuario.username,
+                              'password': usuario.password})
+            for _ in range(LOGINS)])
+        duracion = time.perf_counter() - inicio
+        fin.set()
+        await asyncio.gather(*tareas)
+    assert all(respuesta.status_code == 200 for respuesta in respuestas)
+    print(f'{LOGINS} logins en {duracion:.2f} s')
+    for nombre in sondeos:
+        print(f'{nombre} sin carga:  {percentiles(base[nombre])}')
+        print(f'{nombre} con logins: {percentiles(rafaga[nombre])}'
+              f'  ({len(rafaga[nombre])} requests)')
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -1,3 +1,5 @@
+from concurrent.futures import Executor, Future
+
 from sqlalchemy import StaticPool, create_engine
 from sqlalchemy.orm import sessionmaker
 
@@ -21,3 +23,19 @@ def ovrd_get_db():
         yield database
     finally:
         database.close()
+
+
+# Los trabajos corren dentro de la petición: con StaticPool comparten la
+# única conexión y en otro hilo se mezclarían las transacciones
+class InlineExecutor(Executor):
+    def submit(self, fn, /, *args, **kwargs):
+        futuro = Future()
+        try:
+            futuro.set_result(fn(*args, **kwargs))
+        except Exception as e:  # pragma: no cover
+            futuro.set_exception(e)
+        return futuro
+
+
+def ovrd_get_executor():
+    return InlineExecutor()
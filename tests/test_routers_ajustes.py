@@ -113,6 +113,39 @@ def test_get_all_ajustes_no_scope():
         assert res_json == {'detail': 'Sin Privilegios Necesarios'}
 
 
+def test_get_ajustes_activos():
+    tkn = create_access_token(usr, theDb).access_token
+    with TestClient(app) as client:
+        response = client.get('/ajustes/activos?fecha=2024-03-01',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn
+                              })
+        res_json = response.json()
+        assert response.status_code == status.HTTP_200_OK
+        assert res_json == {'1': [{'id_ajuste': ajuste.id_ajuste,
+                                   'id_empleado': 1,
+                                   'motivo': 'test',
+                                   'monto': 10}]}
+        response = client.get('/ajustes/activos?fecha=2024-03-02',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn
+                              })
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == {}
+
+
+def test_get_ajustes_activos_no_scope():
+    tkn = create_access_token(usr_scope, theDb).access_token
+    with TestClient(app) as client:
+        response = client.get('/ajustes/activos?fecha=2024-03-01',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn
+                              })
+        res_json = response.json()
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+        assert res_json == {'detail': 'Sin Privilegios Necesarios'}
+
+
 def test_create_ajuste():
     tkn = create_access_token(usr, theDb).access_token
     with TestClient(app) as client:
@@ -0,0 +1,1019 @@
+import io
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, func
+from sqlalchemy.orm import Session
+from starlette import status
+
+from dependencies.acumulados import rebuild_acumulados
+from dependencies.database import Base, get_db
+from dependencies.dispersiones import create_dispersion, delete_dispersion
+from dependencies.empleados import edit_empleado
+from dependencies.layouts import LAYOUTS, layout_fijo
+from dependencies.nomina import (calc_recibos, crear_pool_nomina,
+                                 get_entradas_nomina, save_calculos)
+from dependencies.trabajos import (TrabajoReclamado, get_executor,
+                                   get_trabajo, register_tarea,
+                                   resume_trabajos, run_trabajo,
+                                   wait_trabajo)
+from dependencies.users import create_access_token, create_user
+from dependencies.versiones import cambio_nomina
+from main import app
+from models.acumulados import AcumuladosDB
+from models.ajustes import AjustesDB
+from models.bancos import BancosDB
+from models.colonias import ColoniaDB
+from models.cuentas import CuentasDB
+from models.dispersiones import (DispersionesCalculoDB, DispersionesDB,
+                                 DispersionesDetalleDB)
+from models.empleados import EmpleadosDB
+from models.prestamos import PrestamosDB, PrestamosSaldoDB
+from models.recibos import RecibosDB, RecibosDetalleDB
+from models.salarios import SalariosDB
+from models.trabajos import TrabajosDB
+from models.users import UserDB
+from schemas.bancos import TIPOS_LAYOUT
+from schemas.dispersiones import DispersionIn
+from schemas.empleados import EmpleadoIn
+from schemas.users import User, UserIn
+from tests.core import (InlineExecutor, engine, ovrd_get_db,
+                        ovrd_get_executor)
+
+db_gen = ovrd_get_db()
+theDb = next(db_gen)
+
+colonia_data = {
+    'nombre': 'La Colonia',
+    'estado': 'Estado',
+    'ciudad': 'Ciudad',
+    'cp': '00000'
+}
+
+empleado_data = {
+    "nombre": "Nombre",
+    "paterno": "Paterno",
+    "materno": "Materno",
+    "rfc": "RFC000XXX",
+    "curp": "CURPXXX000",
+    "calle": "Calle",
+    "exterior": "200",
+    "id_colonia": 1,
+    "celular": "1231232132",
+}
+
+empleado2_data = {
+    "nombre": "Otro",
+    "paterno": "Paterno",
+    "materno": "Materno",
+    "rfc": "RFC001XXX",
+    "curp": "CURPXXX001",
+    "calle": "Calle",
+    "exterior": "201",
+    "id_colonia": 1,
+}
+
+sin_cuenta_data = {
+    "nombre": "Sin",
+    "paterno": "Cuenta",
+    "materno": "Materno",
+    "rfc": "RFC002XXX",
+    "curp": "CURPXXX002",
+    "calle": "Calle",
+    "exterior": "202",
+    "id_colonia": 1,
+}
+
+user_data = {
+    'username': 'writer',
+    'password': 'password',
+    'nombre': 'name',
+    'scopes': ['dispersiones:write', 'dispersiones:read',
+               'dispersiones:delete', 'recibos:read']
+}
+
+no_scope_user_data = {
+    'username': 'JustUser',
+    'password': 'password',
+    'nombre': 'name',
+    'scopes': ['None']
+}
+
+usr = UserIn(**user_data)
+usr_scope = UserIn(**no_scope_user_data)
+colonia = ColoniaDB(**colonia_data)
+empleado = EmpleadosDB(**empleado_data)
+empleado2 = EmpleadosDB(**empleado2_data)
+sin_cuenta = EmpleadosDB(**sin_cuenta_data)
+banco = BancosDB(nombre='Banco Uno')
+cuenta = CuentasDB(numero='25101988123412343', tipo=2, id_banco=1,
+                   id_empleado=1, id_usuario=1)
+cuenta2 = CuentasDB(numero='12312', tipo=1, id_banco=1,
+                    id_empleado=2, id_usuario=1)
+salarios = [
+    SalariosDB(fecha_valido=date(2024, 1, 1), monto=1000,
+               id_empleado=1, id_usuario=1),
+    SalariosDB(fecha_valido=date(2024, 3, 1), monto=1200,
+               id_empleado=1, id_usuario=1),
+    SalariosDB(fecha_valido=date(2024, 4, 1), monto=1500,
+               id_empleado=1, id_usuario=1),
+    SalariosDB(fecha_valido=date(2024, 1, 1), monto=800.555,
+               id_empleado=2, id_usuario=1),
+]
+ajustes = [
+    AjustesDB(fecha_inicio=date(2024, 3, 1), motivo='Bono', monto=150,
+              id_empleado=1, id_usuario=1),
+    AjustesDB(fecha_inicio=date(2024, 1, 1), fecha_fin=date(2024, 2, 1),
+              motivo='Vencido', monto=-50, id_empleado=1, id_usuario=1),
+]
+prestamo = PrestamosDB(fecha_inicio=date(2024, 3, 1), monto=1000,
+                       monto_quincenal=300, comentarios='Prestamo Test',
+                       id_empleado=1, id_usuario=1)
+periodo = {'periodo': 6, 'periodo_fecha': '2024-03-15'}
+
+
+def setup():
+    Base.metadata.create_all(bind=engine)
+    app.dependency_overrides[get_db] = ovrd_get_db
+    app.dependency_overrides[get_executor] = ovrd_get_executor
+    create_user(usr, theDb)
+    create_user(usr_scope, theDb)
+    theDb.add(colonia)
+    theDb.add_all([empleado, empleado2, sin_cuenta, banco, cuenta, cuenta2,
+                   prestamo, *salarios, *ajustes])
+    theDb.commit()
+
+
+def teardown():
+    Base.metadata.drop_all(bind=engine)
+
+
+def test_create_dispersion_401():
+    with TestClient(app) as client:
+        response = client.post('/dispersiones')
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+        assert response.json() == {'detail': 'Not authenticated'}
+
+
+def test_create_dispersion_no_scope():
+    tkn = create_access_token(usr_scope, theDb).access_token
+    with TestClient(app) as client:
+        response = client.post('/dispersiones',
+                               headers={
+                                   'Authorization': 'Bearer '+tkn
+                               },
+                               json=periodo)
+        res_json = response.json()
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+        assert res_json == {'detail': 'Sin Privilegios Necesarios'}
+
+
+def test_create_dispersion_sin_cuenta():
+    theDb.add(SalariosDB(fecha_valido=date(2024, 1, 1), monto=500,
+                         id_empleado=sin_cuenta.id_empleado, id_usuario=1))
+    theDb.commit()
+    tkn = create_access_token(usr, theDb).access_token
+    with TestClient(app) as client:
+        response = client.post('/dispersiones?dry_run=false',
+                               headers={
+                                   'Authorization': 'Bearer '+tkn
+                               },
+                               json=periodo)
+        id_trabajo = response.json()['id_trabajo']
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        wait_trabajo(id_trabajo, 30)
+        response = client.get(f'/dispersiones/trabajos/{id_trabajo}',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn
+                              })
+        res_json = response.json()
+        assert response.status_code == status.HTTP_200_OK
+        assert res_json['estado'] == 'error'
+        assert res_json['fase'] == 'cargando'
+        assert res_json['error'] == 'Empleados sin cuenta activa: ' \
+                                    f'{sin_cuenta.id_empleado}'
+        assert theDb.query(DispersionesDB).count() == 0
+    sin_cuenta.activo = False
+    theDb.commit()
+
+
+def test_create_dispersion_dry_run():
+    tkn = create_access_token(usr, theDb).access_token
+    with TestClient(app) as client:
+        response = client.post('/dispersiones',
+                               headers={
+                                   'Authorization': 'Bearer '+tkn
+                               },
+                               json=periodo)
+        lineas = [json.loads(linea) for linea in response.iter_lines()]
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers['content-type'] == 'application/x-ndjson'
+        assert [linea['id_empleado'] for linea in lineas[:-1]] ==\
+            [empleado.id_empleado, empleado2.id_empleado]
+        assert lineas[0]['monto'] == 1050
+        assert lineas[-1] == {'resumen': {
+            'periodo': 6,
+            'periodo_fecha': '2024-03-15',
+            'recibos': 2,
+            'reutilizados': 0,
+            'recalculados': 2,
+            'total': 1850.56,
+            'bancos': [{'id_banco': banco.id_banco,
+                        'banco': 'Banco Uno',
+                        'total': 1850.56}]
+        }}
+        assert theDb.query(DispersionesDB).count() == 0
+        assert theDb.query(RecibosDB).count() == 0
+
+
+def test_create_dispersion_dry_run_incremental():
+    tkn = create_access_token(usr, theDb).access_token
+    # Escritura directa: fuera de dependencies hay que subir el contador
+    ajustes[0].monto = 200
+    cambio_nomina(theDb)
+    theDb.commit()
+    with TestClient(app) as client:
+        response = client.post('/dispersiones',
+                               headers={
+                                   'Authorization': 'Bearer '+tkn
+                               },
+                               json=periodo)
+        lineas = [json.loads(linea) for linea in response.iter_lines()]
+        assert response.status_code == status.HTTP_200_OK
+        assert lineas[0]['monto'] == 1100
+        assert lineas[-1]['resumen']['reutilizados'] == 1
+        assert lineas[-1]['resumen']['recalculados'] == 1
+        assert lineas[-1]['resumen']['total'] == 1900.56
+    ajustes[0].monto = 150
+    cambio_nomina(theDb)
+    theDb.commit()
+
+
+def test_save_calculos_carrera():
+    # Dos dry runs simultáneos del periodo: el segundo no vio las filas del
+    # primero al borrar y guarda los mismos empleados
+    create_request = DispersionIn(periodo=9, periodo_fecha=date(2024, 3, 31))
+    recibos = calc_recibos(get_entradas_nomina(theDb,
+                                               create_request.periodo_fecha))
+    ids = [recibo.id_empleado for recibo in recibos]
+    save_calculos(theDb, create_request, recibos, dict.fromkeys(ids, 'a'), [],
+                  'x')
+    save_calculos(theDb, create_request, recibos, dict.fromkeys(ids, 'b'),
+                  ids, 'x')
+    theDb.commit()
+    huellas = theDb\
+        .query(DispersionesCalculoDB.huella)\
+        .filter(DispersionesCalculoDB.periodo == 9)\
+        .all()
+    assert [huella for huella, in huellas] == ['b'] * len(ids)
+    theDb.query(DispersionesCalculoDB)\
+        .filter(DispersionesCalculoDB.periodo == 9)\
+        .delete()
+    theDb.commit()
+
+
+def test_create_dispersion_dry_run_sin_cambios():
+    tkn = create_access_token(usr, theDb).access_token
+    otro_periodo = {'periodo': 10, 'periodo_fecha': '2024-03-15'}
+    with TestClient(app) as client:
+        response = client.post('/dispersiones',
+                               headers={
+                                   'Authorization': 'Bearer '+tkn
+                               },
+                               json=otro_periodo)
+        primera = [json.loads(linea) for linea in response.iter_lines()]
+        consultas = []
+
+        def contar(conn, cursor, statement, *args):
+            consultas.append(statement)
+
+        event.listen(engine, 'before_cursor_execute', contar)
+        try:
+            response = client.post('/dispersiones',
+                                   headers={
+                                       'Authorization': 'Bearer '+tkn
+                                   },
+                                   json=otro_periodo)
+            segunda = [json.loads(linea) for linea in response.iter_lines()]
+        finally:
+            event.remove(engine, 'before_cursor_execute', contar)
+    assert response.status_code == status.HTTP_200_OK
+    assert segunda[:-1] == primera[:-1]
+    assert segunda[-1]['resumen'] == {**primera[-1]['resumen'],
+                                      'reutilizados': 2,
+                                      'recalculados': 0}
+    # Sin cambios en el contador no se lee ninguna entrada
+    for tabla in ('salarios', 'ajustes', 'prestamos', 'cuentas'):
+        assert not [consulta for consulta in consultas
+                    if f'FROM {tabla}' in consulta]
+    theDb.query(DispersionesCalculoDB)\
+        .filter(DispersionesCalculoDB.periodo == 10)\
+        .delete()
+    theDb.commit()
+
+
+def test_create_dispersion():
+    tkn = create_access_token(usr, theDb).access_token
+    # Cálculos de un periodo sin dispersión: se conservan
+    theDb.add(DispersionesCalculoDB(periodo=8, periodo_fecha=date(2024, 3, 31),
+                                    id_empleado=empleado.id_empleado,
+                                    huella='x', recibo='{}'))
+    theDb.commit()
+    with TestClient(app) as client:
+        response = client.post('/dispersiones?dry_run=false',
+                               headers={
+                                   'Authorization': 'Bearer '+tkn
+                               },
+                               json=periodo)
+        res_json = response.json()
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        assert res_json['estado'] == 'pendiente'
+        assert res_json['usuario'] == 'writer'
+        wait_trabajo(res_json['id_trabajo'], 30)
+        response = client.get('/dispersiones/trabajos/'
+                              f'{res_json["id_trabajo"]}',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn
+                              })
+        res_json = response.json()
+        assert response.status_code == status.HTTP_200_OK
+        assert res_json['estado'] == 'terminado'
+        assert res_json['fase'] == 'terminado'
+        assert res_json['procesados'] == 2
+        assert res_json['total'] == 2
+        assert res_json['error'] is None
+        assert res_json['resultado']['total'] == 1850.56
+        assert res_json['resultado']['usuario'] == 'writer'
+        assert res_json['resultado']['reutilizados'] == 1
+        assert res_json['resultado']['recalculados'] == 1
+        id_disp = res_json['resultado']['id_dispersion']
+        recibos = theDb\
+            .query(RecibosDB.id_empleado, RecibosDB.monto)\
+            .filter(RecibosDB.id_dispersion == id_disp)\
+            .order_by(RecibosDB.id_empleado)\
+            .all()
+        assert [tuple(recibo) for recibo in recibos] ==\
+            [(empleado.id_empleado, 1050), (empleado2.id_empleado, 800.56)]
+        conceptos = theDb\
+            .query(RecibosDetalleDB.texto, RecibosDetalleDB.monto)\
+            .join(RecibosDB)\
+            .filter(RecibosDB.id_empleado == empleado.id_empleado)\
+            .order_by(RecibosDetalleDB.id_recibos_detalle)\
+            .all()
+        assert [tuple(concepto) for concepto in conceptos] == [
+            ('Salario', 1200), ('Bono', 150), ('Prestamo Test', -300),
+            ('Depósito', 1050)]
+        depositos = theDb\
+            .query(DispersionesDetalleDB.id_cuenta,
+                   DispersionesDetalleDB.monto)\
+            .filter(DispersionesDetalleDB.id_dispersion == id_disp)\
+            .order_by(DispersionesDetalleDB.id_cuenta)\
+            .all()
+        assert [tuple(deposito) for deposito in depositos] ==\
+            [(cuenta.id_cuenta, 1050), (cuenta2.id_cuenta, 800.56)]
+        saldo_db = theDb.get(PrestamosSaldoDB, prestamo.id_prestamo)
+        assert saldo_db.saldo == 700
+        assert saldo_db.cuotas_pagadas == 1
+        assert saldo_db.ultimo_periodo == 6
+        assert saldo_db.ultimo_periodo_fecha == date(2024, 3, 15)
+        # Los cálculos del periodo dispersado ya no sirven
+        calculos = theDb.query(DispersionesCalculoDB.periodo).all()
+        assert [calculo for calculo, in calculos] == [8]
+    theDb.query(DispersionesCalculoDB).delete()
+    theDb.commit()
+
+
+def test_create_dispersion_duplicada():
+    tkn = create_access_token(usr, theDb).access_token
+    with TestClient(app) as client:
+        response = client.post('/dispersiones?dry_run=false',
+                               headers={
+                                   'Authorization': 'Bearer '+tkn
+                               },
+                               json=periodo)
+        res_json = response.json()
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert res_json == {'detail': 'Dispersión del periodo 6 ya existente'}
+
+
+def test_create_dispersion_carrera(monkeypatch):
+    # Otra corrida guardó el periodo entre la validación y el insert
+    monkeypatch.setattr('dependencies.dispersiones.validate_periodo',
+                        lambda db, create_request: None)
+    current_user = User.model_validate(theDb.get(UserDB, 1))
+    try:
+        create_dispersion(theDb, DispersionIn(**periodo), current_user)
+        assert False  # pragma: no cover
+    except HTTPException as e:
+        assert e.status_code == status.HTTP_400_BAD_REQUEST
+        assert e.detail == 'Dispersión del periodo 6 ya existente'
+    assert theDb.query(DispersionesDB).count() == 1
+
+
+def test_create_dispersion_en_proceso():
+    tkn = create_access_token(usr, theDb).access_token
+    trabajo = TrabajosDB(tipo='dispersion', clave='dispersion:7:2024-03-31',
+                         parametros='{}', estado='pendiente', id_usuario=1)
+    theDb.add(trabajo)
+    theDb.commit()
+    with TestClient(app) as client:
+        response = client.post('/dispersiones?dry_run=false',
+                               headers={
+                                   'Authorization': 'Bearer '+tkn
+                               },
+                               json={'periodo': 7,
+                                     'periodo_fecha': '2024-03-31'})
+        res_json = response.json()
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert res_json == {'detail': 'Dispersión del periodo 7 en proceso'}
+    theDb.delete(trabajo)
+    theDb.commit()
+
+
+def test_create_dispersion_lease_vencido():
+    tkn = create_access_token(usr, theDb).access_token
+    trabajo = TrabajosDB(tipo='dispersion', clave='dispersion:7:2024-03-31',
+                         parametros='{}', estado='en_proceso',
+                         propietario='otro',
+                         latido=datetime.utcnow() - timedelta(hours=1),
+                         id_usuario=1)
+    theDb.add(trabajo)
+    theDb.commit()
+    with TestClient(app) as client:
+        response = client.post('/dispersiones?dry_run=false',
+                               headers={
+                                   'Authorization': 'Bearer '+tkn
+                               },
+                               json={'periodo': 7,
+                                     'periodo_fecha': '2024-03-31'})
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        assert response.json()['id_trabajo'] == trabajo.id_trabajo
+    theDb.refresh(trabajo)
+    assert trabajo.propietario != 'otro'
+    theDb.delete(trabajo)
+    theDb.commit()
+
+
+def test_get_trabajo_404():
+    tkn = create_access_token(usr, theDb).access_token
+    with TestClient(app) as client:
+        response = client.get('/dispersiones/trabajos/1000',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn
+                              })
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert response.json() == {'detail': 'Trabajo con id: 1000 '
+                                             'no encontrado'}
+
+
+def test_resume_trabajos():
+    register_tarea('prueba', lambda db, trabajo, avance: '"ok"')
+    trabajo = TrabajosDB(tipo='prueba', clave='prueba', parametros='{}',
+                         estado='en_proceso', id_usuario=1)
+    theDb.add(trabajo)
+    theDb.commit()
+    assert resume_trabajos(theDb, InlineExecutor()) == [trabajo.id_trabajo]
+    wait_trabajo(trabajo.id_trabajo, 30)
+    theDb.refresh(trabajo)
+    assert trabajo.estado == 'terminado'
+    assert trabajo.resultado == '"ok"'
+
+
+def test_get_resumen_dispersion():
+    tkn = create_access_token(usr, theDb).access_token
+    id_disp = theDb.query(DispersionesDB.id_dispersion).scalar()
+    with TestClient(app) as client:
+        response = client.get(f'/dispersiones/{id_disp}/resumen',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn
+                              })
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == {
+            'id_dispersion': id_disp,
+            'periodo': 6,
+            'periodo_fecha': '2024-03-15',
+            'conceptos': [
+                {'tipo': 'salario', 'concepto': 'Salario', 'recibos': 2,
+                 'total': 2000.56},
+                {'tipo': 'prestamo', 'concepto': 'Préstamos', 'recibos': 1,
+                 'total': -300},
+                {'tipo': 'ajuste', 'concepto': 'Bono', 'recibos': 1,
+                 'total': 150},
+            ],
+            'bancos': [{'id_banco': banco.id_banco, 'banco': 'Banco Uno',
+                        'total': 1850.56}]
+        }
+        response = client.get('/dispersiones/1000/resumen',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn
+                              })
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_get_acumulados_empleado():
+    tkn = create_access_token(usr, theDb).access_token
+    with TestClient(app) as client:
+        response = client.get(f'/recibos/empleado/{empleado.id_empleado}'
+                              '/acumulados/2024',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn
+                              })
+        res_json = response.json()
+        assert response.status_code == status.HTTP_200_OK
+        assert [(acumulado['tipo'], acumulado['concepto'],
+                 acumulado['monto'], acumulado['recibos'])
+                for acumulado in res_json] == [
+            ('salario', 'Salario', 1200, 1),
+            ('prestamo', 'Préstamos', -300, 1),
+            ('neto', 'Neto', 1050, 1),
+            ('ajuste', 'Bono', 150, 1)]
+        response = client.get('/recibos/empleado/1000/acumulados/2024',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn
+                              })
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_rebuild_acumulados():
+    assert rebuild_acumulados(theDb) == []
+
+
+def test_get_recibo_snapshot():
+    tkn = create_access_token(usr, theDb).access_token
+    id_recibo = theDb\
+        .query(RecibosDB.id_recibo)\
+        .filter(RecibosDB.id_empleado == empleado.id_empleado)\
+        .scalar()
+    prestamo_db = theDb.get(PrestamosDB, prestamo.id_prestamo)
+    prestamo_db.comentarios = 'Comentario nuevo'
+    theDb.commit()
+    with TestClient(app) as client:
+        response = client.get(f'/recibos/{id_recibo}',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn
+                              })
+        res_json = response.json()
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers['content-encoding'] == 'deflate'
+        assert res_json['empleado'] == 'Nombre Paterno Materno'
+        assert res_json['periodo'] == 6
+        assert res_json['monto'] == 1050
+        assert [(detalle['id_externo'], detalle['texto'], detalle['monto'])
+                for detalle in res_json['detalles']] == [
+            (salarios[1].id_salario, 'Salario', 1200),
+            (ajustes[0].id_ajuste, 'Bono', 150),
+            (prestamo.id_prestamo, 'Prestamo Test', -300),
+            (cuenta.id_cuenta, 'Depósito', 1050)]
+        assert res_json['detalles'][3]['banco'] == 'Banco Uno'
+        assert res_json['detalles'][3]['cuenta'] == '25101988123412343'
+        assert res_json['detalles'][3]['tipo'] == 'Nómina'
+        response = client.get(f'/recibos/{id_recibo}',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn,
+                                  'Accept-Encoding': 'identity'
+                              })
+        assert response.status_code == status.HTTP_200_OK
+        assert 'content-encoding' not in response.headers
+        assert response.json() == res_json
+        plano = response.headers['etag']
+        response = client.get(f'/recibos/{id_recibo}',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn,
+                                  'Accept-Encoding': 'gzip, deflate;q=0'
+                              })
+        assert 'content-encoding' not in response.headers
+        assert response.headers['etag'] == plano
+    prestamo_db.comentarios = 'Prestamo Test'
+    theDb.commit()
+    acumulado = theDb.get(AcumuladosDB, (empleado.id_empleado, 2024,
+                                         'salario', 'Salario'))
+    acumulado.monto = 1000
+    theDb.commit()
+    diferencias = rebuild_acumulados(theDb, corregir=True)
+    assert [(diferencia.concepto, diferencia.monto,
+             diferencia.monto_guardado) for diferencia in diferencias] ==\
+        [('Salario', 1200, 1000)]
+    assert rebuild_acumulados(theDb) == []
+
+
+def test_get_dispersion_etag():
+    tkn = create_access_token(usr, theDb).access_token
+    id_disp = theDb.query(func.max(DispersionesDB.id_dispersion)).scalar()
+    with TestClient(app) as client:
+        response = client.get(f'/dispersiones/{id_disp}',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn
+                              })
+        assert response.status_code == status.HTTP_200_OK
+        actual = response.headers['etag']
+        response = client.get(f'/dispersiones/{id_disp}',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn,
+                                  'If-None-Match': actual
+                              })
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response.headers['etag'] == actual
+        assert response.content == b''
+        response = client.get('/dispersiones/',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn
+                              })
+        lista = response.headers['etag']
+        assert lista != actual
+        consultas = []
+
+        def contar(conn, cursor, statement, *args):
+            consultas.append(statement)
+
+        event.listen(engine, 'before_cursor_execute', contar)
+        try:
+            response = client.get('/dispersiones/',
+                                  headers={
+                                      'Authorization': 'Bearer '+tkn,
+                                      'If-None-Match': lista
+                                  })
+        finally:
+            event.remove(engine, 'before_cursor_execute', contar)
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        # El 304 sólo lee el contador, no las dispersiones
+        assert any('versiones' in consulta for consulta in consultas)
+        assert not [consulta for consulta in consultas
+                    if 'dispersiones' in consulta]
+        # Un cambio en datos unidos (el nombre del empleado) cambia el
+        # ETag aunque la dispersión sea la misma
+        edit_empleado(empleado.id_empleado,
+                      EmpleadoIn(**{**empleado_data, 'nombre': 'Renombrado'}),
+                      theDb)
+        response = client.get(f'/dispersiones/{id_disp}',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn,
+                                  'If-None-Match': actual
+                              })
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers['etag'] != actual
+        edit_empleado(empleado.id_empleado, EmpleadoIn(**empleado_data),
+                      theDb)
+
+
+def test_get_diferencias_dispersion():
+    tkn = create_access_token(usr, theDb).access_token
+    id_base = theDb.query(DispersionesDB.id_dispersion).scalar()
+    bono = theDb.get(AjustesDB, ajustes[0].id_ajuste)
+    bono.monto = 200
+    theDb.commit()
+    user = User.model_validate(theDb.get(UserDB, 1))
+    nueva = create_dispersion(theDb, DispersionIn(periodo=7,
+                                                  periodo_fecha='2024-03-31'),
+                              user)
+    try:
+        with TestClient(app) as client:
+            response = client.get(f'/dispersiones/{nueva.id_dispersion}'
+                                  f'/diferencias?base={id_base}',
+                                  headers={
+                                      'Authorization': 'Bearer '+tkn
+                                  })
+            assert response.status_code == status.HTTP_200_OK
+            assert response.json() == {
+                'id_dispersion': nueva.id_dispersion,
+                'id_base': id_base,
+                'diferencia': 50,
+                'recibos': [{
+                    'id_empleado': empleado.id_empleado,
+                    'empleado': 'Nombre Paterno Materno',
+                    'monto_base': 1050,
+                    'monto': 1100,
+                    'diferencia': 50,
+                    'cuenta_base': '25101988123412343',
+                    'cuenta': '25101988123412343',
+                    'conceptos': [{'tipo': 'ajuste', 'concepto': 'Bono',
+                                   'monto_base': 150, 'monto': 200,
+                                   'diferencia': 50}]
+                }]
+            }
+            response = client.get(f'/dispersiones/{nueva.id_dispersion}'
+                                  '/diferencias?base=1000',
+                                  headers={
+                                      'Authorization': 'Bearer '+tkn
+                                  })
+            assert response.status_code == status.HTTP_404_NOT_FOUND
+            assert response.json() ==\
+                {'detail': 'Dispersión con id: 1000 no encontrada'}
+    finally:
+        delete_dispersion(theDb, nueva.id_dispersion)
+        bono.monto = 150
+        theDb.commit()
+
+
+def test_get_archivo_banco():
+    tkn = create_access_token(usr, theDb).access_token
+    id_disp = theDb.query(DispersionesDB.id_dispersion).scalar()
+    with TestClient(app) as client:
+        response = client.get(f'/dispersiones/{id_disp}/archivos/'
+                              f'{banco.id_banco}',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn
+                              })
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers['content-type'].startswith('text/csv')
+        assert response.headers['content-disposition'] ==\
+            f'attachment; filename="dispersion_{id_disp}_banco_' \
+            f'{banco.id_banco}.csv"'
+        assert response.text ==\
+            'cuenta,beneficiario,rfc,monto\r\n' \
+            '25101988123412343,Nombre Paterno Materno,RFC000XXX,1050.00\r\n' \
+            '12312,Otro Paterno Materno,RFC001XXX,800.56\r\n'
+
+
+def test_get_archivo_banco_fijo():
+    tkn = create_access_token(usr, theDb).access_token
+    id_disp = theDb.query(DispersionesDB.id_dispersion).scalar()
+    banco.layout = 'fijo'
+    theDb.commit()
+    with TestClient(app) as client:
+        response = client.get(f'/dispersiones/{id_disp}/archivos/'
+                              f'{banco.id_banco}',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn
+                              })
+        lineas = response.text.split('\r\n')
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers['content-type'].startswith('text/plain')
+        assert lineas[0] == '025101988123412343' \
+                            + 'NOMBRE PATERNO MATERNO'.ljust(40) \
+                            + 'RFC000XXX    ' + '000000000105000'
+        assert lineas[1].startswith('000000000000012312OTRO')
+        assert lineas[1].endswith('000000000080056')
+        assert lineas[2] == ''
+    banco.layout = 'csv'
+    theDb.commit()
+
+
+def test_layout_fijo_no_ascii():
+    deposito = SimpleNamespace(numero='12312',
+                               beneficiario='José Peña Ibáñez',
+                               rfc='PEÑJ800101XX1',
+                               monto=10.5)
+    linea = next(layout_fijo([deposito]))
+    assert linea == '000000000000012312' \
+                    + 'JOSE PENA IBANEZ'.ljust(40) \
+                    + 'PENJ800101XX1' + '000000000001050' + '\r\n'
+    assert len(linea.encode()) == 18 + 40 + 13 + 15 + 2
+    assert set(LAYOUTS) == set(TIPOS_LAYOUT)
+
+
+def test_get_archivos_zip():
+    tkn = create_access_token(usr, theDb).access_token
+    id_disp = theDb.query(DispersionesDB.id_dispersion).scalar()
+    with TestClient(app) as client:
+        response = client.get(f'/dispersiones/{id_disp}/archivos',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn
+                              })
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers['content-type'] == 'application/zip'
+        archivo = zipfile.ZipFile(io.BytesIO(response.content))
+        nombre = f'dispersion_{id_disp}_banco_{banco.id_banco}.csv'
+        assert archivo.namelist() == [nombre]
+        assert archivo.read(nombre).decode().splitlines()[1] ==\
+            '25101988123412343,Nombre Paterno Materno,RFC000XXX,1050.00'
+
+
+def test_get_archivo_banco_404():
+    tkn = create_access_token(usr, theDb).access_token
+    with TestClient(app) as client:
+        response = client.get('/dispersiones/1000/archivos/1',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn
+                              })
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert response.json() ==\
+            {'detail': 'Dispersión con id: 1000 no encontrada'}
+        id_disp = theDb.query(DispersionesDB.id_dispersion).scalar()
+        response = client.get(f'/dispersiones/{id_disp}/archivos/1000',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn
+                              })
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert response.json() ==\
+            {'detail': 'Banco con id: 1000 sin depósitos en la dispersión '
+                       f'{id_disp}'}
+
+
+def test_calc_recibos_workers():
+    entradas = get_entradas_nomina(theDb, date(2024, 3, 15))
+    un_proceso = calc_recibos(entradas, workers=1)
+    pool = crear_pool_nomina(2)
+    try:
+        en_paralelo = calc_recibos(entradas, pool, workers=2, minimo=0)
+        # Debajo del mínimo no se usa el pool
+        assert calc_recibos(entradas, pool, workers=2) == un_proceso
+    finally:
+        pool.shutdown()
+    assert [recibo.model_dump_json() for recibo in un_proceso] ==\
+        [recibo.model_dump_json() for recibo in en_paralelo]
+
+
+def test_calculo_sin_dependencias():
+    # Lo que carga cada proceso del pool: ni fastapi ni SQLAlchemy
+    codigo = ('import sys, dependencies.calculo; '
+              'print(sorted({"fastapi", "sqlalchemy", "pydantic", '
+              '"decouple"} & set(sys.modules)))')
+    raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    salida = subprocess.run([sys.executable, '-c', codigo], cwd=raiz,
+                            capture_output=True, text=True, check=True)
+    assert salida.stdout.strip() == '[]'
+
+
+def test_delete_dispersion():
+    tkn = create_access_token(usr, theDb).access_token
+    id_disp = theDb.query(DispersionesDB.id_dispersion).scalar()
+    borrados = []
+
+    def contar(conn, cursor, statement, *args):
+        if statement.startswith('DELETE'):
+            borrados.append(statement)
+
+    with TestClient(app) as client:
+        response = client.get(f'/dispersiones/{id_disp}',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn
+                              })
+        anterior = response.headers['etag']
+    event.listen(engine, 'before_cursor_execute', contar)
+    try:
+        with TestClient(app) as client:
+            response = client.delete(f'/dispersiones/{id_disp}',
+                                     headers={
+                                         'Authorization': 'Bearer '+tkn
+                                     })
+            assert response.status_code == status.HTTP_204_NO_CONTENT
+    finally:
+        event.remove(engine, 'before_cursor_execute', contar)
+    with TestClient(app) as client:
+        # El ETag guardado por el cliente ya no corresponde
+        response = client.get(f'/dispersiones/{id_disp}',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn,
+                                  'If-None-Match': anterior
+                              })
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+    # recibos_detalle, recibos, dispersiones_detalle y dispersiones, más
+    # los acumulados que quedan en cero
+    assert len(borrados) == 5
+    theDb.expire_all()
+    assert theDb.get(DispersionesDB, id_disp) is None
+    assert theDb.query(RecibosDB).count() == 0
+    assert theDb.query(RecibosDetalleDB).count() == 0
+    assert theDb.query(DispersionesDetalleDB).count() == 0
+    assert theDb.query(AcumuladosDB).count() == 0
+    saldo_db = theDb.get(PrestamosSaldoDB, prestamo.id_prestamo)
+    assert saldo_db.saldo == 1000
+    assert saldo_db.cuotas_pagadas == 0
+    assert saldo_db.ultimo_periodo is None
+    assert saldo_db.ultimo_periodo_fecha is None
+    with TestClient(app) as client:
+        response = client.delete(f'/dispersiones/{id_disp}',
+                                 headers={
+                                     'Authorization': 'Bearer '+tkn
+                                 })
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert response.json() ==\
+            {'detail': f'Dispersión con id: {id_disp} no encontrada'}
+
+
+def test_trabajos_lease(tmp_path):
+    # Sin InlineExecutor: hilos reales sobre una base en archivo, con el
+    # avance leído desde otra sesión como lo haría otro worker
+    engine_archivo = create_engine(f'sqlite:///{tmp_path}/trabajos.db',
+                                   connect_args={'check_same_thread': False})
+    Base.metadata.create_all(bind=engine_archivo)
+    liberar = threading.Event()
+
+    def lenta(db, trabajo, avance):
+        avance('calculando', 1, 2)
+        liberar.wait(30)
+        return '"ok"'
+
+    register_tarea('lenta', lenta)
+    db = Session(bind=engine_archivo)
+    db.add(UserDB(id_user=1, username='lease', scopes=0))
+    vivo = TrabajosDB(tipo='lenta', clave='vivo', parametros='{}',
+                      estado='en_proceso', propietario='otro',
+                      latido=datetime.utcnow(), id_usuario=1)
+    muerto = TrabajosDB(tipo='lenta', clave='muerto', parametros='{}',
+                        estado='en_proceso', propietario='otro',
+                        latido=datetime.utcnow() - timedelta(hours=1),
+                        id_usuario=1)
+    db.add_all([vivo, muerto])
+    db.commit()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        assert resume_trabajos(db, executor) == [muerto.id_trabajo]
+        lector = Session(bind=engine_archivo)
+        for _ in range(300):
+            trabajo = get_trabajo(lector, muerto.id_trabajo, 'lenta')
+            if trabajo.fase == 'calculando':
+                break
+            time.sleep(0.01)
+        assert trabajo.estado == 'en_proceso'
+        assert trabajo.procesados == 1
+        assert trabajo.total == 2
+        liberar.set()
+        wait_trabajo(muerto.id_trabajo, 30)
+    db.expire_all()
+    assert db.get(TrabajosDB, muerto.id_trabajo).estado == 'terminado'
+    assert db.get(TrabajosDB, muerto.id_trabajo).propietario != 'otro'
+    assert db.get(TrabajosDB, vivo.id_trabajo).estado == 'en_proceso'
+    assert db.get(TrabajosDB, vivo.id_trabajo).propietario == 'otro'
+    lector.close()
+    db.close()
+    engine_archivo.dispose()
+
+
+def test_trabajos_latido(tmp_path, monkeypatch):
+    # La tarea no reporta avance; el hilo de latido renueva el lease
+    monkeypatch.setattr('dependencies.trabajos.TRABAJOS_LATIDO', 0.01)
+    engine_archivo = create_engine(f'sqlite:///{tmp_path}/latido.db',
+                                   connect_args={'check_same_thread': False})
+    Base.metadata.create_all(bind=engine_archivo)
+    inicio = datetime.utcnow()
+    latidos = []
+
+    def callada(db, trabajo, avance):
+        lector = Session(bind=engine_archivo)
+        for _ in range(300):
+            latido = lector.query(TrabajosDB.latido)\
+                .filter(TrabajosDB.id_trabajo == trabajo.id_trabajo)\
+                .scalar()
+            if latido > latidos[0]:
+                break
+            time.sleep(0.01)
+        latidos.append(latido)
+        lector.close()
+        return '"ok"'
+
+    register_tarea('callada', callada)
+    db = Session(bind=engine_archivo)
+    db.add(UserDB(id_user=1, username='latido', scopes=0))
+    trabajo = TrabajosDB(tipo='callada', clave='callada', parametros='{}',
+                         estado='pendiente', latido=inicio, id_usuario=1)
+    db.add(trabajo)
+    db.commit()
+    latidos.append(inicio)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        executor.submit(run_trabajo, engine_archivo,
+                        trabajo.id_trabajo).result(30)
+    assert latidos[1] > inicio
+    db.expire_all()
+    assert db.get(TrabajosDB, trabajo.id_trabajo).estado == 'terminado'
+    db.close()
+    engine_archivo.dispose()
+
+
+def test_trabajos_reclamado(tmp_path):
+    # Otro proceso reclama el trabajo a media tarea: el commit de la tarea
+    # no guarda nada y el estado queda en manos del nuevo propietario
+    engine_archivo = create_engine(f'sqlite:///{tmp_path}/reclamado.db',
+                                   connect_args={'check_same_thread': False})
+    Base.metadata.create_all(bind=engine_archivo)
+    errores = []
+
+    def reclamada(db, trabajo, avance):
+        with Session(bind=engine_archivo) as otro:
+            otro.query(TrabajosDB)\
+                .filter(TrabajosDB.id_trabajo == trabajo.id_trabajo)\
+                .update({'propietario': 'otro'})
+            otro.commit()
+        db.add(BancosDB(nombre='Reclamado'))
+        try:
+            db.commit()
+        except TrabajoReclamado as e:
+            errores.append(e)
+            raise
+        return '"ok"'
+
+    register_tarea('reclamada', reclamada)
+    db = Session(bind=engine_archivo)
+    db.add(UserDB(id_user=1, username='reclamado', scopes=0))
+    trabajo = TrabajosDB(tipo='reclamada', clave='reclamada',
+                         parametros='{}', estado='pendiente', id_usuario=1)
+    db.add(trabajo)
+    db.commit()
+    run_trabajo(engine_archivo, trabajo.id_trabajo)
+    assert len(errores) == 1
+    db.expire_all()
+    assert db.query(BancosDB).count() == 0
+    reclamado = db.get(TrabajosDB, trabajo.id_trabajo)
+    assert reclamado.estado == 'en_proceso'
+    assert reclamado.propietario == 'otro'
+    db.close()
+    engine_archivo.dispose()
@@ -309,3 +309,25 @@ def test_edit_empleado_curp():
         res_json = response.json()
         assert response.status_code == 400
         assert res_json == {'detail': 'CURP ya registrado'}
+
+
+def test_nombre_completo_sin_paterno():
+    sin_paterno = EmpleadosDB(**{**empleado_data,
+                                 'paterno': None,
+                                 'rfc': 'RFC002XXX',
+                                 'curp': 'CURPXXX002'})
+    theDb.add(sin_paterno)
+    theDb.commit()
+    # La expresión SQL da lo mismo que la propiedad en Python
+    en_sql = theDb\
+        .query(EmpleadosDB.nombre_completo)\
+        .filter(EmpleadosDB.id_empleado == sin_paterno.id_empleado)\
+        .scalar()
+    assert en_sql == sin_paterno.nombre_completo == 'Nombre Materno'
+    theDb.refresh(empleado)
+    assert theDb\
+        .query(EmpleadosDB.id_empleado)\
+        .filter(EmpleadosDB.nombre_completo == empleado.nombre_completo)\
+        .scalar() == empleado.id_empleado
+    theDb.delete(sin_paterno)
+    theDb.commit()
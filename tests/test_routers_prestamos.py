@@ -8,7 +8,7 @@ from dependencies.users import create_access_token, create_user
 from main import app
 from models.colonias import ColoniaDB
 from models.empleados import EmpleadosDB
-from models.prestamos import PrestamosDB
+from models.prestamos import PrestamosDB, PrestamosSaldoDB
 from schemas.users import UserIn
 from tests.core import engine, ovrd_get_db
 
@@ -62,6 +62,7 @@ usr_scope = UserIn(**no_scope_user_data)
 empleado = EmpleadosDB(**empleado_data)
 colonia = ColoniaDB(**colonia_data)
 prestamo = PrestamosDB(**prestamo_data)
+aplicado = PrestamosDB(**prestamo_data)
 
 
 def setup():
@@ -267,6 +268,49 @@ def test_edit_prestamo_monto_total():
             'Value error, El monto quicenal no puede ser mayor al total'
 
 
+def test_edit_prestamo_monto_pagado():
+    theDb.add(aplicado)
+    theDb.flush()
+    theDb.add(PrestamosSaldoDB(id_prestamo=aplicado.id_prestamo, saldo=800,
+                               cuotas_pagadas=2, ultimo_periodo=6,
+                               ultimo_periodo_fecha=date(2024, 3, 15)))
+    theDb.commit()
+    tkn = create_access_token(usr, theDb).access_token
+    with TestClient(app) as client:
+        response = client.put(f'/prestamos/{aplicado.id_prestamo}',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn
+                              },
+                              json={
+                                  'fecha_inicio': '2024-03-01',
+                                  'monto': 150,
+                                  'monto_quincenal': 100
+                              })
+        res_json = response.json()
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert res_json == {'detail': 'EL monto total no puede ser menor a '
+                                      'la suma de lo ya pagado ($200.0)'}
+
+
+def test_edit_prestamo_saldo():
+    tkn = create_access_token(usr, theDb).access_token
+    with TestClient(app) as client:
+        response = client.put(f'/prestamos/{aplicado.id_prestamo}',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn
+                              },
+                              json={
+                                  'fecha_inicio': '2024-03-01',
+                                  'monto': 1500,
+                                  'monto_quincenal': 100
+                              })
+        saldo_db = theDb.get(PrestamosSaldoDB, aplicado.id_prestamo)
+        theDb.refresh(saldo_db)
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        assert saldo_db.saldo == 1300
+        assert saldo_db.cuotas_pagadas == 2
+
+
 def test_edit_prestamo_fecha_ini_aplicada():
     # TODO: Validar no cambiar fecha_ini < last_aplicada
     pass
@@ -292,12 +336,17 @@ def test_delete_prestamo_404():
 
 
 def test_delete_prestamo_aplicada():
-    # TODO: Validar no cambiar fecha_ini < last_aplicada
-    # res_json = response.json()
-    # assert response.status_code == status.HTTP_400_BAD_REQUEST
-    # assert res_json == {'detail': f'Prestamo con id: {prestamo.id_prestamo} '
-    #                     'ya aplicado, no se puede eliminar'}
-    pass
+    tkn = create_access_token(usr, theDb).access_token
+    with TestClient(app) as client:
+        response = client.delete(f'/prestamos/{aplicado.id_prestamo}',
+                                 headers={
+                                     'Authorization': 'Bearer '+tkn
+                                 })
+        res_json = response.json()
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert res_json == {'detail': 'Prestamo con id: '
+                                      f'{aplicado.id_prestamo} ya aplicado, '
+                                      'no se puede eliminar'}
 
 
 def test_delete_prestamo():
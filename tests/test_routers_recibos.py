@@ -0,0 +1,472 @@
+import io
+import time
+import zipfile
+from datetime import date, datetime, timedelta
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from starlette import status
+
+from dependencies.database import Base, get_db
+from dependencies.documentos import (iter_documentos, iter_lotes_documentos,
+                                     limpiar_documentos)
+from dependencies.recibos import (get_recibos_dispersion,
+                                  get_recibos_empleado)
+from dependencies.trabajos import get_executor
+from dependencies.users import create_access_token, create_user
+from main import app
+from models.colonias import ColoniaDB
+from models.dispersiones import DispersionesDB
+from models.empleados import EmpleadosDB
+from models.recibos import RecibosDB, RecibosDetalleDB
+from models.trabajos import TrabajosArchivoDB, TrabajosDB
+from schemas.users import UserIn
+from tests.core import engine, ovrd_get_db, ovrd_get_executor
+
+db_gen = ovrd_get_db()
+theDb = next(db_gen)
+
+colonia_data = {
+    'nombre': 'La Colonia',
+    'estado': 'Estado',
+    'ciudad': 'Ciudad',
+    'cp': '00000'
+}
+
+empleado_data = {
+    "nombre": "Nombre",
+    "paterno": "Paterno",
+    "materno": "Materno",
+    "rfc": "RFC000XXX",
+    "curp": "CURPXXX000",
+    "calle": "Calle",
+    "exterior": "200",
+    "id_colonia": 1,
+    "celular": "1231232132",
+}
+
+empleado2_data = {
+    "nombre": "Otro",
+    "paterno": "Paterno",
+    "materno": "Materno",
+    "rfc": "RFC001XXX",
+    "curp": "CURPXXX001",
+    "calle": "Calle",
+    "exterior": "201",
+    "id_colonia": 1,
+}
+
+user_data = {
+    'username': 'reader',
+    'password': 'password',
+    'nombre': 'name',
+    'scopes': ['recibos:read']
+}
+
+writer_user_data = {
+    'username': 'writer',
+    'password': 'password',
+    'nombre': 'name',
+    'scopes': ['recibos:read', 'dispersiones:write']
+}
+
+no_scope_user_data = {
+    'username': 'JustUser',
+    'password': 'password',
+    'nombre': 'name',
+    'scopes': ['None']
+}
+
+usr = UserIn(**user_data)
+usr_writer = UserIn(**writer_user_data)
+usr_scope = UserIn(**no_scope_user_data)
+colonia = ColoniaDB(**colonia_data)
+empleado = EmpleadosDB(**empleado_data)
+empleado2 = EmpleadosDB(**empleado2_data)
+dispersiones = [
+    DispersionesDB(periodo=5, periodo_fecha=date(2024, 2, 29), total=1900,
+                   id_usuario=1),
+    DispersionesDB(periodo=6, periodo_fecha=date(2024, 3, 15), total=1950,
+                   id_usuario=1),
+]
+recibos = [
+    RecibosDB(id_empleado=1, id_dispersion=1, monto=1000),
+    RecibosDB(id_empleado=2, id_dispersion=1, monto=900),
+    RecibosDB(id_empleado=1, id_dispersion=2, monto=1050),
+    RecibosDB(id_empleado=2, id_dispersion=2, monto=900),
+]
+detalles = [
+    RecibosDetalleDB(id_recibo=3, texto='Salario', monto=1200),
+    RecibosDetalleDB(id_recibo=3, texto='Préstamo <auto>', monto=-150),
+    RecibosDetalleDB(id_recibo=3, id_cuenta=1, texto='Depósito', monto=1050),
+]
+
+
+def setup():
+    Base.metadata.create_all(bind=engine)
+    app.dependency_overrides[get_db] = ovrd_get_db
+    app.dependency_overrides[get_executor] = ovrd_get_executor
+    create_user(usr, theDb)
+    create_user(usr_writer, theDb)
+    create_user(usr_scope, theDb)
+    theDb.add(colonia)
+    theDb.add_all([empleado, empleado2, *dispersiones])
+    theDb.commit()
+    theDb.add_all(recibos)
+    theDb.commit()
+    theDb.add_all(detalles)
+    theDb.commit()
+
+
+def teardown():
+    Base.metadata.drop_all(bind=engine)
+
+
+def test_get_recibos_dispersion_401():
+    with TestClient(app) as client:
+        response = client.get('/recibos/dispersion/1')
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+        assert response.json() == {'detail': 'Not authenticated'}
+
+
+def test_get_recibos_dispersion_no_scope():
+    tkn = create_access_token(usr_scope, theDb).access_token
+    with TestClient(app) as client:
+        response = client.get('/recibos/dispersion/1',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn
+                              })
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+        assert response.json() == {'detail': 'Sin Privilegios Necesarios'}
+
+
+def test_get_recibos_dispersion():
+    tkn = create_access_token(usr, theDb).access_token
+    id_disp = dispersiones[1].id_dispersion
+    with TestClient(app) as client:
+        response = client.get(f'/recibos/dispersion/{id_disp}',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn
+                              })
+        res_json = response.json()
+        assert response.status_code == status.HTTP_200_OK
+        assert [recibo['id_recibo'] for recibo in res_json] ==\
+            [recibos[2].id_recibo, recibos[3].id_recibo]
+        assert res_json[0] == {'id_recibo': recibos[2].id_recibo,
+                               'id_empleado': 1,
+                               'id_dispersion': id_disp,
+                               'monto': 1050,
+                               'empleado': 'Nombre Paterno Materno',
+                               'periodo': 6,
+                               'periodo_fecha': '2024-03-15',
+                               'fecha': str(dispersiones[1].fecha)}
+
+
+def test_get_recibos_dispersion_despues():
+    tkn = create_access_token(usr, theDb).access_token
+    id_disp = dispersiones[1].id_dispersion
+    with TestClient(app) as client:
+        response = client.get(f'/recibos/dispersion/{id_disp}?limit=1',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn
+                              })
+        pagina = response.json()
+        assert [recibo['id_recibo'] for recibo in pagina] ==\
+            [recibos[2].id_recibo]
+        response = client.get(f'/recibos/dispersion/{id_disp}?limit=1'
+                              f'&despues={pagina[-1]["id_recibo"]}',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn
+                              })
+        pagina = response.json()
+        assert [recibo['id_recibo'] for recibo in pagina] ==\
+            [recibos[3].id_recibo]
+        response = client.get(f'/recibos/dispersion/{id_disp}?limit=1'
+                              f'&despues={pagina[-1]["id_recibo"]}',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn
+                              })
+        assert response.json() == []
+
+
+def test_get_recibos_dispersion_404():
+    tkn = create_access_token(usr, theDb).access_token
+    with TestClient(app) as client:
+        response = client.get('/recibos/dispersion/1000',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn
+                              })
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert response.json() ==\
+            {'detail': 'Dispersión con id: 1000 no encontrada'}
+
+
+def test_get_recibos_dispersion_consultas():
+    consultas = []
+    id_disp = dispersiones[0].id_dispersion
+
+    def contar(conn, cursor, statement, *args):
+        consultas.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', contar)
+    try:
+        get_recibos_dispersion(theDb, id_disp)
+    finally:
+        event.remove(engine, 'before_cursor_execute', contar)
+    assert len(consultas) == 2
+
+
+def test_get_recibos_empleado():
+    tkn = create_access_token(usr, theDb).access_token
+    with TestClient(app) as client:
+        response = client.get('/recibos/empleado/1',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn
+                              })
+        res_json = response.json()
+        assert response.status_code == status.HTTP_200_OK
+        assert [(recibo['periodo'], recibo['monto'])
+                for recibo in res_json] == [(5, 1000), (6, 1050)]
+        assert res_json[0]['empleado'] == 'Nombre Paterno Materno'
+        assert res_json[0]['periodo_fecha'] == '2024-02-29'
+
+
+def test_get_recibos_empleado_fechas():
+    tkn = create_access_token(usr, theDb).access_token
+    with TestClient(app) as client:
+        response = client.get('/recibos/empleado/2?desde=2024-03-01',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn
+                              })
+        res_json = response.json()
+        assert response.status_code == status.HTTP_200_OK
+        assert [recibo['periodo'] for recibo in res_json] == [6]
+        response = client.get('/recibos/empleado/2?hasta=2024-03-01',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn
+                              })
+        assert [recibo['periodo'] for recibo in response.json()] == [5]
+        response = client.get('/recibos/empleado/2?desde=2025-01-01',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn
+                              })
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == []
+
+
+def test_get_recibos_empleado_404():
+    tkn = create_access_token(usr, theDb).access_token
+    with TestClient(app) as client:
+        response = client.get('/recibos/empleado/1000',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn
+                              })
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert response.json() ==\
+            {'detail': 'Empleado con id: 1000 no encontrado'}
+
+
+def test_get_recibos_empleado_consultas():
+    consultas = []
+
+    def contar(conn, cursor, statement, *args):
+        consultas.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', contar)
+    try:
+        get_recibos_empleado(theDb, 1)
+    finally:
+        event.remove(engine, 'before_cursor_execute', contar)
+    assert len(consultas) == 1
+
+
+def test_get_recibo_sin_snapshot():
+    tkn = create_access_token(usr, theDb).access_token
+    with TestClient(app) as client:
+        response = client.get(f'/recibos/{recibos[2].id_recibo}',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn
+                              })
+        res_json = response.json()
+        assert response.status_code == status.HTTP_200_OK
+        assert res_json['empleado'] == 'Nombre Paterno Materno'
+        assert res_json['periodo'] == 6
+        assert [(detalle['id_externo'], detalle['texto'], detalle['monto'])
+                for detalle in res_json['detalles']] == [
+            (None, 'Salario', 1200),
+            (None, 'Préstamo <auto>', -150),
+            (1, 'Depósito', 1050)]
+        response = client.get('/recibos/1000',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn
+                              })
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert response.json() ==\
+            {'detail': 'Recibo con id: 1000 no encontrado'}
+
+
+def test_get_recibo_etag():
+    tkn = create_access_token(usr, theDb).access_token
+    with TestClient(app) as client:
+        response = client.get(f'/recibos/{recibos[2].id_recibo}',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn
+                              })
+        actual = response.headers['etag']
+        assert response.headers['vary'] == 'Accept-Encoding'
+        response = client.get(f'/recibos/{recibos[2].id_recibo}',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn,
+                                  'If-None-Match': f'"otro", W/{actual}'
+                              })
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        response = client.get(f'/recibos/{recibos[2].id_recibo}',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn,
+                                  'Accept-Encoding': 'identity',
+                                  'If-None-Match': actual
+                              })
+        # Cada codificación negociada tiene su propio ETag
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers['etag'] != actual
+        assert response.headers['vary'] == 'Accept-Encoding'
+        response = client.get('/recibos/dispersion/1',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn,
+                                  'If-None-Match': '*'
+                              })
+        assert response.status_code == status.HTTP_200_OK
+        response = client.get('/recibos/dispersion/1',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn,
+                                  'If-None-Match': response.headers['etag']
+                              })
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+
+def test_create_documentos():
+    tkn = create_access_token(usr_writer, theDb).access_token
+    reader_tkn = create_access_token(usr, theDb).access_token
+    id_disp = dispersiones[1].id_dispersion
+    with TestClient(app) as client:
+        # Leer recibos no basta para lanzar el render
+        response = client.post(f'/recibos/dispersion/{id_disp}/documentos',
+                               headers={
+                                   'Authorization': 'Bearer '+reader_tkn
+                               })
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+        response = client.post(f'/recibos/dispersion/{id_disp}/documentos',
+                               headers={
+                                   'Authorization': 'Bearer '+tkn
+                               })
+        id_trabajo = response.json()['id_trabajo']
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        response = client.get(f'/recibos/trabajos/{id_trabajo}',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn
+                              })
+        res_json = response.json()
+        assert res_json['estado'] == 'terminado'
+        assert res_json['procesados'] == 2
+        assert res_json['resultado'] == {
+            'archivo': f'recibos_{id_trabajo}.zip', 'recibos': 2}
+        response = client.get(f'/recibos/trabajos/{id_trabajo}/archivo',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn
+                              })
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers['content-type'] == 'application/zip'
+        assert response.headers['content-disposition'] == \
+            f'attachment; filename="recibos_{id_trabajo}.zip"'
+        archivo = zipfile.ZipFile(io.BytesIO(response.content))
+        nombre = f'recibo_{recibos[2].id_recibo}_RFC000XXX.html'
+        assert sorted(archivo.namelist()) == [
+            nombre, f'recibo_{recibos[3].id_recibo}_RFC001XXX.html']
+        documento = archivo.read(nombre).decode()
+        assert 'Nombre Paterno Materno' in documento
+        assert 'Préstamo &lt;auto&gt;' in documento
+        assert '-$150.00' in documento
+        assert '$1,050.00' in documento
+        assert 'Depósito' not in documento
+    # El zip queda en la base, no en el disco del worker que lo generó
+    assert theDb.get(TrabajosArchivoDB, id_trabajo).contenido == \
+        response.content
+
+
+def test_create_documentos_404():
+    tkn = create_access_token(usr_writer, theDb).access_token
+    with TestClient(app) as client:
+        response = client.post('/recibos/dispersion/1000/documentos',
+                               headers={
+                                   'Authorization': 'Bearer '+tkn
+                               })
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert response.json() ==\
+            {'detail': 'Dispersión con id: 1000 no encontrada'}
+        response = client.get('/recibos/trabajos/1000/archivo',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn
+                              })
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert response.json() ==\
+            {'detail': 'Trabajo con id: 1000 no encontrado'}
+
+
+def archivos_documentos(*edades: timedelta) -> list[int]:
+    ids = []
+    for edad in edades:
+        trabajo = TrabajosDB(tipo='documentos', clave='limpiar',
+                             parametros='{}', estado='terminado',
+                             id_usuario=1)
+        theDb.add(trabajo)
+        theDb.flush()
+        theDb.add(TrabajosArchivoDB(id_trabajo=trabajo.id_trabajo,
+                                    fecha=datetime.utcnow() - edad,
+                                    nombre='x.zip', contenido=b'zip'))
+        ids.append(trabajo.id_trabajo)
+    theDb.commit()
+    return ids
+
+
+def test_limpiar_documentos():
+    tkn = create_access_token(usr, theDb).access_token
+    viejo, nuevo = archivos_documentos(timedelta(days=2), timedelta())
+    assert limpiar_documentos(theDb) == 1
+    assert theDb.get(TrabajosArchivoDB, viejo) is None
+    assert theDb.get(TrabajosArchivoDB, nuevo) is not None
+    with TestClient(app) as client:
+        response = client.get(f'/recibos/trabajos/{viejo}/archivo',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn
+                              })
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert response.json() == \
+            {'detail': f'Archivo del trabajo {viejo} no disponible'}
+    assert limpiar_documentos(theDb) == 0
+
+
+def test_limpiar_documentos_periodico(monkeypatch):
+    monkeypatch.setattr('dependencies.documentos.RENDER_LIMPIEZA', 0.05)
+    viejo, = archivos_documentos(timedelta(days=2))
+    with TestClient(app):
+        # La limpieza corre desde el lifespan, sin esperar a un request
+        for _ in range(100):
+            theDb.expire_all()
+            if theDb.get(TrabajosArchivoDB, viejo) is None:
+                break
+            time.sleep(0.01)
+        assert theDb.get(TrabajosArchivoDB, viejo) is None
+
+
+def test_iter_documentos_workers():
+    id_disp = dispersiones[1].id_dispersion
+    un_proceso = [documento
+                  for documentos in iter_documentos(
+                      iter_lotes_documentos(theDb, id_disp, lote=1), 1)
+                  for documento in documentos]
+    en_paralelo = [documento
+                   for documentos in iter_documentos(
+                       iter_lotes_documentos(theDb, id_disp, lote=1), 2)
+                   for documento in documentos]
+    assert len(un_proceso) == 2
+    assert sorted(un_proceso) == sorted(en_paralelo)
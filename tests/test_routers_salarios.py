@@ -1,9 +1,11 @@
 from datetime import date
 
 from fastapi.testclient import TestClient
+from sqlalchemy import event
 from starlette import status
 
 from dependencies.database import Base, get_db
+from dependencies.salarios import get_salarios, get_salarios_vigentes
 from dependencies.users import create_access_token, create_user
 from main import app
 from models.colonias import ColoniaDB
@@ -91,6 +93,24 @@ def test_get_all_salarios():
         assert res_json[0]['monto'] == 1000
 
 
+def test_get_salarios_columnas():
+    consultas = []
+
+    def contar(conn, cursor, statement, *args):
+        consultas.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', contar)
+    try:
+        salarios = get_salarios(theDb)
+    finally:
+        event.remove(engine, 'before_cursor_execute', contar)
+    assert len(consultas) == 1
+    assert 'colonias' not in consultas[0]
+    assert 'password_h' not in consultas[0]
+    assert salarios[0].empleado == 'Nombre Paterno Materno'
+    assert salarios[0].usuario == usr.username
+
+
 def test_get_all_salarios_401():
     with TestClient(app) as client:
         response = client.get('/salarios')
@@ -245,6 +265,15 @@ def test_create_salario():
         assert 'id_salario' in res_json.keys()
 
 
+def test_get_salarios_vigentes():
+    vigentes = get_salarios_vigentes(theDb, date(2024, 4, 15))
+    assert vigentes[empleado.id_empleado].id_salario == salario.id_salario
+    vigentes = get_salarios_vigentes(theDb, date(2024, 5, 1),
+                                     [empleado.id_empleado])
+    assert vigentes[empleado.id_empleado].monto == 1200.50
+    assert get_salarios_vigentes(theDb, date(2024, 1, 1)) == {}
+
+
 def test_create_salario_401():
     with TestClient(app) as client:
         response = client.post('/salarios')
@@ -1,13 +1,25 @@
-from datetime import timedelta
+import time
+from datetime import datetime, timedelta
 
+import pytest
+from fastapi import FastAPI, Security
 from fastapi.testclient import TestClient
+from jose import jwt
+from sqlalchemy import event
 from starlette import status
 
 from dependencies.database import Base, get_db
-from dependencies.users import create_access_token, create_user, encode_token
-from main import app
-from models.users import UserDB
-from schemas.users import UserIn
+from dependencies.scopes import required_mask
+from dependencies.users import (ALGORITHM, SECRET_KEY, access_token_usuario,
+                                create_access_token, create_user,
+                                encode_token, get_current_active_user,
+                                get_user_by_username,
+                                refresh_revocaciones, revocaciones,
+                                revoke_token)
+from main import app, lifespan
+from models.users import RevocacionesDB, UserDB
+from schemas.scopes import BITS
+from schemas.users import User, UserIn
 from tests.core import engine, ovrd_get_db
 
 db_gen = ovrd_get_db()
@@ -75,6 +87,7 @@ usr_inactive = UserIn(**inactive_user_data)
 usr_access = UserIn(**access_user_data)
 usr_access2 = UserIn(**access2_user_data)
 user_false = UserIn(**false_user_data)
+usr_refresh = UserIn(**{**access_user_data, 'username': 'refresh'})
 
 
 def setup() -> None:
@@ -276,11 +289,17 @@ def test_deactivate_user():
         assert response.status_code == status.HTTP_200_OK
         res_json = response.json()
         assert res_json['username'] == access2_user_data['username']
-        # Edit DB to deActivate
-        theDb.query(UserDB)\
+        # Edit DB to deActivate, como lo haría edit_user en otro worker:
+        # el cache local no se toca, la revocación lo desaloja
+        id_user = theDb.query(UserDB.id_user)\
             .filter(UserDB.username == access2_user_data['username'])\
+            .scalar()
+        theDb.query(UserDB)\
+            .filter(UserDB.id_user == id_user)\
             .update({'activo': False})
+        theDb.add(RevocacionesDB(id_user=id_user, fecha=datetime.utcnow()))
         theDb.commit()
+        refresh_revocaciones(theDb, forzar=True)
         # Get /Me
         response = client.get('/users/me',
                               headers={
@@ -430,3 +449,258 @@ def test_edit_user_non_exist():
         assert response.status_code == status.HTTP_404_NOT_FOUND
         res_json = response.json()
         assert res_json == {'detail': 'Usuario con id: 100 no encontrado'}
+
+
+def test_edit_user_deactivate_cached():
+    writer_tkn = create_access_token(usr_writer, theDb).access_token
+    reader_tkn = create_access_token(usr_reader, theDb).access_token
+    consultas = []
+
+    def contar(conn, cursor, statement, *args):
+        consultas.append(statement)
+
+    with TestClient(app) as client:
+        response = client.get('/users/me',
+                              headers={
+                                  'Authorization': 'Bearer '+reader_tkn
+                              })
+        assert response.status_code == status.HTTP_200_OK
+        event.listen(engine, 'before_cursor_execute', contar)
+        try:
+            response = client.get('/users/me',
+                                  headers={
+                                      'Authorization': 'Bearer '+reader_tkn
+                                  })
+        finally:
+            event.remove(engine, 'before_cursor_execute', contar)
+        assert response.status_code == status.HTTP_200_OK
+        assert consultas == []
+        response = client.put('/users/3',
+                              headers={
+                                  'Authorization': 'Bearer '+writer_tkn
+                              },
+                              json={
+                                  'username': 'reader',
+                                  'nombre': 'Reader Test User',
+                                  'scopes': ['users:read'],
+                                  'activo': False
+                              })
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        response = client.get('/users/me',
+                              headers={
+                                  'Authorization': 'Bearer '+reader_tkn
+                              })
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+        assert response.json() == {'detail': 'Usuario Desactivado'}
+
+
+def test_logout():
+    access_tkn = create_access_token(usr_writer, theDb).access_token
+    with TestClient(app) as client:
+        response = client.post('/users/logout',
+                               headers={
+                                   'Authorization': 'Bearer '+access_tkn
+                               })
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        response = client.get('/users/me',
+                              headers={
+                                  'Authorization': 'Bearer '+access_tkn
+                              })
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+        assert response.json() == {'detail': 'Could not validate credentials'}
+
+
+def test_stateless_user(monkeypatch):
+    monkeypatch.setattr('dependencies.users.AUTH_STATELESS', True)
+    usr_stateless = UserIn(**{**access_user_data, 'username': 'stateless'})
+    id_user = create_user(usr_stateless, theDb).id_user
+    admin_tkn = create_access_token(usr_admin, theDb).access_token
+    access_tkn = create_access_token(usr_stateless, theDb).access_token
+    refresh_revocaciones(theDb, forzar=True)
+    consultas = []
+
+    def contar(conn, cursor, statement, *args):
+        consultas.append(statement)
+
+    with TestClient(app) as client:
+        event.listen(engine, 'before_cursor_execute', contar)
+        try:
+            response = client.get('/users/me',
+                                  headers={
+                                      'Authorization': 'Bearer '+access_tkn
+                                  })
+        finally:
+            event.remove(engine, 'before_cursor_execute', contar)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()['id_user'] == id_user
+        # noScope no está en el registro y no se guarda
+        assert response.json()['scopes'] == []
+        assert consultas == []
+        response = client.put(f'/users/{id_user}',
+                              headers={
+                                  'Authorization': 'Bearer '+admin_tkn
+                              },
+                              json={
+                                  'username': 'stateless',
+                                  'nombre': 'Stateless',
+                                  'scopes': ['noScope'],
+                                  'activo': False
+                              })
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        response = client.get('/users/me',
+                              headers={
+                                  'Authorization': 'Bearer '+access_tkn
+                              })
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_stateless_token_after_edit(monkeypatch):
+    # Un token emitido en el mismo segundo, después del cambio, vale
+    monkeypatch.setattr('dependencies.users.AUTH_STATELESS', True)
+    usr_edit = UserIn(**{**access_user_data, 'username': 'recien'})
+    user = User.model_validate(create_user(usr_edit, theDb))
+    time.sleep(1.5 - time.time() % 1)
+    revoke_token(theDb, id_user=user.id_user)
+    time.sleep(0.1)
+    access_tkn = access_token_usuario(user)
+    with TestClient(app) as client:
+        response = client.get('/users/me',
+                              headers={
+                                  'Authorization': 'Bearer '+access_tkn
+                              })
+        assert response.status_code == status.HTTP_200_OK
+
+
+def test_refresh_revocaciones_periodico(monkeypatch):
+    monkeypatch.setattr('dependencies.users.REVOCACIONES_REFRESH', 0.05)
+    with TestClient(app):
+        # Revocación escrita por otro worker; la recarga del lifespan la
+        # trae sin pasar por un request
+        theDb.add(RevocacionesDB(jti='otro-worker', fecha=datetime.utcnow()))
+        theDb.commit()
+        for _ in range(100):
+            if 'otro-worker' in revocaciones['jtis']:
+                break
+            time.sleep(0.01)
+        assert 'otro-worker' in revocaciones['jtis']
+
+
+def test_refresh_token():
+    create_user(usr_refresh, theDb)
+    refresh_tkn = create_access_token(usr_refresh, theDb).refresh_token
+    with TestClient(app) as client:
+        response = client.post('/users/token/refresh',
+                               json={'refresh_token': refresh_tkn})
+        assert response.status_code == status.HTTP_200_OK
+        nuevo = response.json()
+        assert nuevo['refresh_token'] != refresh_tkn
+        response = client.get('/users/me',
+                              headers={
+                                  'Authorization': 'Bearer ' +
+                                  nuevo['access_token']
+                              })
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()['username'] == 'refresh'
+        # Reusar el anterior revoca también el rotado
+        response = client.post('/users/token/refresh',
+                               json={'refresh_token': refresh_tkn})
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+        assert response.json() == {'detail': 'Refresh token no valido'}
+        response = client.post('/users/token/refresh',
+                               json={'refresh_token': nuevo['refresh_token']})
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_refresh_token_logout():
+    tkn = create_access_token(usr_refresh, theDb)
+    with TestClient(app) as client:
+        response = client.post('/users/logout',
+                               headers={
+                                   'Authorization': 'Bearer '+tkn.access_token
+                               },
+                               json={'refresh_token': tkn.refresh_token})
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        response = client.post('/users/token/refresh',
+                               json={'refresh_token': tkn.refresh_token})
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_refresh_token_inactive():
+    refresh_tkn = create_access_token(usr_inactive, theDb).refresh_token
+    with TestClient(app) as client:
+        response = client.post('/users/token/refresh',
+                               json={'refresh_token': refresh_tkn})
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+        response = client.post('/users/token/refresh',
+                               json={'refresh_token': 'no-existo'})
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_scopes_mask():
+    writer_tkn = create_access_token(usr_writer, theDb).access_token
+    with TestClient(app) as client:
+        response = client.post('/users',
+                               headers={
+                                  'Authorization': 'Bearer '+writer_tkn
+                                  },
+                               json={
+                                  'username': 'mascara',
+                                  'nombre': 'Usuario Mascara',
+                                  'password': 'EsUnSecreto',
+                                  'scopes': ['users:read', 'noScope',
+                                             'recibos:read']
+                                })
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.json()['scopes'] == ['users:read', 'recibos:read']
+        user_db = get_user_by_username('mascara', theDb)
+        assert user_db.scopes == BITS['users:read'] | BITS['recibos:read']
+        tkn = create_access_token(UserIn(username='mascara',
+                                         nombre='Usuario Mascara',
+                                         password='EsUnSecreto',
+                                         scopes=[]),
+                                  theDb).access_token
+        payload = jwt.decode(tkn, SECRET_KEY, algorithms=[ALGORITHM])
+        assert payload['scopes'] == user_db.scopes
+        response = client.get('/users',
+                              headers={
+                                  'Authorization': 'Bearer '+tkn
+                              })
+        assert response.status_code == status.HTTP_200_OK
+        response = client.post('/users',
+                               headers={
+                                  'Authorization': 'Bearer '+tkn
+                                  },
+                               json={
+                                  'username': 'mascara2',
+                                  'nombre': 'Usuario Mascara',
+                                  'password': 'EsUnSecreto',
+                                  'scopes': []
+                                })
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+def test_scopes_al_arrancar():
+    required_mask.cache_clear()
+    writer_tkn = create_access_token(usr_writer, theDb).access_token
+    with TestClient(app) as client:
+        # Las máscaras de todas las rutas quedan calculadas en el arranque
+        compiladas = required_mask.cache_info().currsize
+        assert compiladas > 1
+        for ruta in ('/users', '/users/me', '/dispersiones', '/recibos'):
+            client.get(ruta,
+                       headers={'Authorization': 'Bearer '+writer_tkn})
+        assert required_mask.cache_info().currsize == compiladas
+
+
+def test_scope_no_registrado():
+    otra = FastAPI(lifespan=lifespan)
+    otra.dependency_overrides[get_db] = ovrd_get_db
+
+    @otra.get('/nada')
+    def nada(user: User = Security(get_current_active_user,
+                                   scopes=['nada:read'])):
+        return {}
+
+    with pytest.raises(RuntimeError, match='nada:read'):
+        with TestClient(otra):
+            pass